@@ -0,0 +1,34 @@
+"""
+Compares the time taken to evaluate aggregate outputs by the JSONata interpreter against the aggregation
+fast path. The parity of their results is checked by tests/unit/test_aggregate.py.
+"""
+
+from helpers import load_drivers, make_config, make_outputs, set_values, timeit
+
+from processor import compile_aggregate, evaluate_jsonata
+from reader.read_plan import build_read_plan
+
+REPEAT = 20
+
+
+def main() -> None:
+    drivers = load_drivers()
+    config = make_config(drivers, 200)
+    dev_rdg = build_read_plan(config, drivers).get_dev_rdg()
+    set_values(dev_rdg)
+    values = {(dev_id, rdg["var"]): rdg["value"] for dev_id, rdgs in dev_rdg.items() for rdg in rdgs}
+    projection = {dev_id: [{"var": r["var"], "value": r["value"]} for r in rdgs] for dev_id, rdgs in dev_rdg.items()}
+
+    # Only the sums and single readings among the synthetic outputs are aggregates
+    outputs = [oc for oc in make_outputs(config, 120) if compile_aggregate(oc["source"]) is not None]
+    aggregates = [compile_aggregate(oc["source"]) for oc in outputs]
+
+    interpreter_ms = timeit(lambda: [evaluate_jsonata(projection, oc["source"]) for oc in outputs], REPEAT)
+    fast_path_ms = timeit(lambda: [aggregate.evaluate(values) for aggregate in aggregates], REPEAT)
+    print(f"{len(outputs)} aggregate outputs")
+    print(f"JSONata interpreter: {interpreter_ms:.3f} ms per cycle")
+    print(f"fast path: {fast_path_ms:.3f} ms per cycle ({interpreter_ms / fast_path_ms:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
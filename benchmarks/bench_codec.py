@@ -0,0 +1,57 @@
+"""
+Compares the encodings of the values in the key-value stores: the json module (as used before the codec was
+added), orjson (the default, which still produces JSON) and msgpack (the optional binary codec, if installed).
+Reports the time taken to encode and decode the cached readings and the config of sites of different sizes, and
+the size of the stored values. Also checks that every encoding decodes to the original value.
+"""
+
+import json
+
+from helpers import load_drivers, make_config, set_values, timeit
+
+from kvstore import keys
+from kvstore.codec import Codec, dump_json, msgpack
+from reader.read_plan import build_read_plan
+
+REPEAT = 50
+
+# The binary codec is only used for the keys that Python alone reads
+binary_codec = Codec("msgpack")
+
+ENCODINGS = {
+    "json": (lambda value: json.dumps(value).encode("utf-8"), json.loads),
+    "orjson": (dump_json, Codec.load),
+}
+if msgpack is not None:
+    ENCODINGS["msgpack"] = (lambda value: binary_codec.dump(keys.LAST_ENV_SCAN, value), Codec.load)
+
+
+def make_readings(config: dict, drivers: dict) -> list[dict]:
+    """Readings as cached at the end of a reading cycle, in the format of the readout"""
+    dev_rdg = build_read_plan(config, drivers).get_dev_rdg()
+    set_values(dev_rdg)
+    return [{"_d": dev_id, **{rdg["var"]: rdg["value"] for rdg in rdgs}} for dev_id, rdgs in dev_rdg.items()]
+
+
+def main() -> None:
+    drivers = load_drivers()
+
+    print(f"{'value':>20} {'encoding':>9} {'size [kB]':>10} {'encode [ms]':>12} {'decode [ms]':>12}")
+    for num_readings in (200, 1000, 4000):
+        config = make_config(drivers, num_readings)
+        values = {
+            f"readings ({num_readings})": make_readings(config, drivers),
+            f"config ({num_readings})": config,
+        }
+
+        for name, value in values.items():
+            for encoding, (dump, load) in ENCODINGS.items():
+                encoded = dump(value)
+                assert load(encoded) == value, f"{encoding} doesn't preserve the {name}"
+                dump_ms = timeit(lambda: dump(value), REPEAT)
+                load_ms = timeit(lambda: load(encoded), REPEAT)
+                print(f"{name:>20} {encoding:>9} {len(encoded) / 1024:>10.1f} {dump_ms:>12.3f} {load_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Compares decoding a value for every field in drivers/*.json with process_reading() against the
+compiled field codecs. That both give the same results is checked by tests/unit/test_field_codec.py.
+Also compares decoding the cell voltages of a Pylontech battery module as separate fields against
+decoding them as one array field.
+"""
+
+import os
+import struct
+
+from helpers import load_drivers, timeit
+
+from processor import compile_codec, process_reading
+
+REPEAT = 200
+ARRAY_REPEAT = 10000
+
+SAMPLE_LENGTHS = {
+    "int16": 2,
+    "uint16": 2,
+    "int32": 4,
+    "uint32": 4,
+    "int64": 8,
+    "uint64": 8,
+    "float": 4,
+    "single": 4,
+    "double": 8,
+}
+
+
+def get_sample_value(rdg: dict) -> bytes:
+    """Representative raw value for a field, as it would be returned by the reader"""
+    if rdg.get("parse_as") == "str":
+        return b"12.5" if rdg.get("typecast") != "int" else b"12"
+
+    length = SAMPLE_LENGTHS.get(rdg.get("datatype"))
+    if length is None:
+        length = 2 * rdg["words"] if "words" in rdg else rdg.get("length", 2)
+    if rdg.get("datatype") in ("float", "single"):
+        val_b = struct.pack(">f", 12.5)
+    elif rdg.get("datatype") == "double":
+        val_b = struct.pack(">d", 12.5)
+    else:
+        val_b = os.urandom(length)
+
+    if rdg.get("parse_as") == "hex":
+        return val_b.hex().encode("utf-8")
+    return val_b
+
+
+def get_fields(drivers: dict) -> list[tuple[dict, bytes]]:
+    fields = []
+    for drv in drivers.values():
+        for var, field in drv.get("fields", {}).items():
+            rdg = {"var": var, **drv.get("common", {}), **field}
+            fields.append((rdg, get_sample_value(rdg)))
+    return fields
+
+
+def decode_or_error(fn, val_b):
+    try:
+        return fn(val_b)
+    except Exception as e:
+        return type(e)
+
+
+def compare_array_decoding(drivers: dict) -> None:
+    # The cell voltages M1_V1 ... M1_V15 are hex-encoded uint16 values at subsequent positions in the response
+    driver = drivers["pylontech_rs485"]
+    cell_fields = [{"var": f"M1_V{i}", **driver["common"], **driver["fields"][f"M1_V{i}"]} for i in range(1, 16)]
+    start = cell_fields[0]["pos"]
+    response = b"0" * (start - 1) + struct.pack(">15H", *range(3300, 3315)).hex().upper().encode("utf-8")
+
+    field_codecs = [(rdg["pos"] - 1, rdg["length"], compile_codec(rdg)) for rdg in cell_fields]
+    array_rdg = {**cell_fields[0], "var": "M1_V", "length": 60, "array": {"count": 15}}
+    array_codec = compile_codec(array_rdg)
+
+    def decode_fields():
+        return [codec.decode(response[pos : pos + length]) for pos, length, codec in field_codecs]
+
+    def decode_array():
+        return array_codec.decode(response[start - 1 : start - 1 + array_rdg["length"]])
+
+    assert decode_fields() == decode_array(), "Array decoding does not match decoding of separate fields"
+
+    fields_ms = timeit(decode_fields, ARRAY_REPEAT)
+    array_ms = timeit(decode_array, ARRAY_REPEAT)
+    print(f"15 cell voltages as separate fields: {fields_ms * 1000:.1f} us")
+    print(f"15 cell voltages as array field: {array_ms * 1000:.1f} us ({fields_ms / array_ms:.1f}x)")
+
+
+def main() -> None:
+    drivers = load_drivers()
+    fields = get_fields(drivers)
+    codecs = [compile_codec(rdg) for rdg, _ in fields]
+
+    # Only fields that can be decoded are timed
+    decodable = [
+        (rdg, val_b, codec)
+        for (rdg, val_b), codec in zip(fields, codecs)
+        if not isinstance(decode_or_error(codec.decode, val_b), type)
+    ]
+
+    def run_process_reading():
+        for rdg, val_b, _ in decodable:
+            process_reading(val_b, **rdg)
+
+    def run_codecs():
+        for _, val_b, codec in decodable:
+            codec.decode(val_b)
+
+    process_reading_ms = timeit(run_process_reading, REPEAT)
+    codecs_ms = timeit(run_codecs, REPEAT)
+    compile_ms = timeit(lambda: [compile_codec(rdg) for rdg, _ in fields], REPEAT)
+
+    print(f"{len(fields)} fields ({len(decodable)} decodable)")
+    print(f"process_reading: {process_reading_ms:.3f} ms per pass over all fields")
+    print(f"compiled codecs: {codecs_ms:.3f} ms per pass ({process_reading_ms / codecs_ms:.1f}x)")
+    print(f"compiling codecs: {compile_ms:.3f} ms (once per read plan)")
+
+    compare_array_decoding(drivers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Compares caching the readings of a reading cycle with a separate commit for each key (as was the case before
+batched writes, when the readings were cached as a single value) against a single transaction (with a row for
+each device), and against the write-behind mode of the cache (in which commits are made in the background), for
+sites of different sizes. Reports the number of commits and the time taken per cycle.
+"""
+
+import os
+import tempfile
+
+from helpers import timeit
+
+from kvstore import keys
+from kvstore.kv import KV
+
+REPEAT = 20
+
+# The single merged value in which the readings were cached before each device had a row of its own
+LEGACY_LAST_READINGS = "last_readings"
+
+
+def make_readings(num_devices: int) -> list[dict]:
+    return [{"_d": f"dev_{i}", "P": 1000.0 + i, "E": 123456.0 + i, "V": 230.0} for i in range(num_devices)]
+
+
+def save_separately(kv: KV, readings: list[dict], timestamp: int) -> None:
+    kv.get(keys.LAST_READINGS_TS)
+    kv.get(LEGACY_LAST_READINGS)
+    kv.set(LEGACY_LAST_READINGS, readings)
+    kv.set(keys.LAST_READINGS_TS, timestamp)
+    for rdg in readings:
+        kv.set(f"{keys.LAST_READING_TS_FOR_DEV_PFX}/{rdg['_d']}", timestamp)
+
+
+def save_batched(kv: KV, readings: list[dict], timestamp: int) -> None:
+    with kv.transaction() as txn:
+        txn.get_many([keys.LAST_READINGS_TS, *(f"{keys.LAST_READING_FOR_DEV_PFX}/{rdg['_d']}" for rdg in readings)])
+        txn.set_many(
+            {
+                **{f"{keys.LAST_READING_FOR_DEV_PFX}/{rdg['_d']}": {"t": timestamp, "r": rdg} for rdg in readings},
+                keys.LAST_READINGS_TS: timestamp,
+                **{f"{keys.LAST_READING_TS_FOR_DEV_PFX}/{rdg['_d']}": timestamp for rdg in readings},
+            }
+        )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kv = KV(os.path.join(tmp_dir, "kvcache.db"))
+        stats = kv.connection_manager
+        write_behind_kv = KV(os.path.join(tmp_dir, "kvcache-wb.db"), synchronous="OFF", write_behind=True)
+
+        print(
+            f"{'devices':>8} {'commits':>8} {'separate [ms]':>14} {'commits':>8} {'batched [ms]':>13} {'speedup':>8} "
+            f"{'write-behind [ms]':>18} {'speedup':>8}"
+        )
+        for num_devices in (10, 50, 100, 200):
+            readings = make_readings(num_devices)
+
+            stats.pop_stats()
+            separate_ms = timeit(lambda: save_separately(kv, readings, 1700000000), REPEAT)
+            separate_commits = stats.pop_stats()["writes"] / REPEAT
+
+            batched_ms = timeit(lambda: save_batched(kv, readings, 1700000000), REPEAT)
+            batched_commits = stats.pop_stats()["writes"] / REPEAT
+
+            write_behind_ms = timeit(lambda: save_batched(write_behind_kv, readings, 1700000000), REPEAT)
+            write_behind_kv.flush()
+
+            print(
+                f"{num_devices:>8} {separate_commits:>8.0f} {separate_ms:>14.2f} "
+                f"{batched_commits:>8.0f} {batched_ms:>13.2f} {separate_ms / batched_ms:>7.1f}x "
+                f"{write_behind_ms:>18.2f} {separate_ms / write_behind_ms:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
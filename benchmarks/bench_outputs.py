@@ -0,0 +1,73 @@
+"""
+Compares the per-cycle time taken to evaluate outputs when every JSONata expression is parsed and its
+input validated on every cycle (as was the case before compiled expressions were cached) against using
+the expression cache. Then compares evaluating every output against all of the readings' parameters on
+every cycle against the incremental output engine, over a number of cycles in which only some of the
+readings change, and checks that both give the same outputs.
+"""
+
+from helpers import load_drivers, make_config, make_outputs, set_values, timeit
+from jsonata import Jsonata
+
+from processor import OutputEngine, evaluate_jsonata, get_jsonata_cache_info
+from processor.process_reading import typecast
+from reader.read_plan import build_read_plan
+
+REPEAT = 5
+CYCLES = 20
+CHANGED_FRACTION = 0.1
+
+
+def evaluate_all(dev_rdg: dict, output_config: list) -> list:
+    """Evaluates every output against the full readings, as get_output() did before the output engine"""
+    output = [dict(oc) for oc in output_config]
+    for oc in output:
+        evaluated_value = evaluate_jsonata(dev_rdg, oc["source"])
+        if evaluated_value is not None:
+            oc["value"] = typecast(evaluated_value, **oc)
+    return output
+
+
+def compare_incremental(dev_rdg: dict, output_config: list) -> None:
+    engine = OutputEngine()
+    full_ms = engine_ms = 0
+    for cycle in range(CYCLES):
+        set_values(dev_rdg, cycle, CHANGED_FRACTION)
+        full_ms += timeit(lambda: evaluate_all(dev_rdg, output_config), 1)
+        engine_ms += timeit(lambda: engine.evaluate(dev_rdg, output_config), 1)
+        assert engine.evaluate(dev_rdg, output_config) == evaluate_all(dev_rdg, output_config), (
+            f"Outputs of the output engine differ in cycle {cycle}"
+        )
+
+    full_ms, engine_ms = full_ms / CYCLES, engine_ms / CYCLES
+    print(f"{len(output_config):>8} {full_ms:>14.2f} {engine_ms:>12.2f} {full_ms / engine_ms:>7.1f}x")
+
+
+def main() -> None:
+    drivers = load_drivers()
+    config = make_config(drivers, 200)
+    dev_rdg = build_read_plan(config, drivers).get_dev_rdg()
+    set_values(dev_rdg)
+
+    print(f"{'outputs':>8} {'uncached [ms]':>14} {'cached [ms]':>12} {'speedup':>8}")
+    for num_outputs in (10, 40, 80):
+        output_config = make_outputs(config, num_outputs)
+
+        def uncached():
+            for oc in output_config:
+                Jsonata(oc["source"]).evaluate(dev_rdg)
+
+        uncached_ms = timeit(uncached, REPEAT)
+        cached_ms = timeit(lambda: evaluate_all(dev_rdg, output_config), REPEAT)
+        print(f"{num_outputs:>8} {uncached_ms:>14.2f} {cached_ms:>12.2f} {uncached_ms / cached_ms:>7.1f}x")
+
+    print(f"Expression cache: {get_jsonata_cache_info()}")
+
+    print(f"\n{CHANGED_FRACTION:.0%} of readings changing per cycle")
+    print(f"{'outputs':>8} {'full [ms]':>14} {'engine [ms]':>12} {'speedup':>8}")
+    for num_outputs in (10, 40, 80):
+        compare_incremental(dev_rdg, make_outputs(config, num_outputs))
+
+
+if __name__ == "__main__":
+    main()
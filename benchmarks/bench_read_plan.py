@@ -0,0 +1,77 @@
+"""
+Compares the per-cycle planning cost of the compiled read plan against rebuilding dev_rdg from
+the config on every cycle (the approach used before the read plan was introduced).
+"""
+
+from copy import deepcopy
+
+from helpers import load_drivers, make_config, timeit
+
+from node_mgmt.config_watch import get_digest
+from reader.read_plan import build_read_plan, get_read_plan
+
+REPEAT = 50
+
+
+def legacy_planning(config: dict, drivers: dict) -> dict:
+    dev_rdg = {}
+
+    for rdg in config["readings"]:
+        if not config["readings"][rdg].get("enabled", True):
+            continue
+        try:
+            dev_id = config["readings"][rdg]["device"]
+            var = config["readings"][rdg]["var"]
+        except KeyError:
+            continue
+        if dev_id not in config["devices"]:
+            continue
+        dev = config["devices"][dev_id]
+        if not dev.get("enabled", True):
+            continue
+        drv_id = dev["driver"]
+        if drv_id not in drivers:
+            continue
+        if dev_id not in dev_rdg:
+            dev_rdg[dev_id] = []
+        rdict = {"reading": rdg, "var": var}
+        rdict.update(drivers[drv_id].get("common", {}))
+        try:
+            rdict.update(drivers[drv_id]["fields"][var])
+        except KeyError:
+            pass
+        dev_rdg[dev_id].append(rdict)
+
+    # Each device's address used to be deep-copied when setting up its reader
+    for dev_id in dev_rdg:
+        deepcopy(config["devices"][dev_id]["address"])
+
+    return dev_rdg
+
+
+def main() -> None:
+    drivers = load_drivers()
+
+    print(
+        f"{'readings':>10} {'legacy [ms]':>12} {'build [ms]':>12} {'digest [ms]':>12} "
+        f"{'cached [ms]':>12} {'speedup':>8}"
+    )
+    for num_readings in (100, 500, 2000, 5000):
+        config = make_config(drivers, num_readings)
+
+        legacy = timeit(lambda: legacy_planning(config, drivers), REPEAT)
+        build = timeit(lambda: build_read_plan(config, drivers), REPEAT)
+        # Worked out once for each config, by the node's config snapshot
+        digest = timeit(lambda: get_digest(config), REPEAT)
+        # Includes the validity check that is carried out on every cycle, with the config digest
+        config_digest = get_digest(config)
+        cached = timeit(lambda: get_read_plan(config, drivers, config_digest).get_dev_rdg(), REPEAT)
+
+        print(
+            f"{len(config['readings']):>10} {legacy:>12.2f} {build:>12.2f} {digest:>12.2f} "
+            f"{cached:>12.2f} {legacy / cached:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
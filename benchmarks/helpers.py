@@ -0,0 +1,100 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+The scripts are run from the repository root, e.g. `uv run python benchmarks/bench_read_plan.py`,
+and import the application modules from `src`.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DRIVERS_PATH = os.path.join(REPO_ROOT, "drivers")
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+# Keep the output readable; warnings about e.g. deprecated driver variables are expected
+logging.basicConfig(level=logging.ERROR)
+
+
+def load_drivers() -> dict:
+    drivers = {}
+    for drv in sorted(os.listdir(DRIVERS_PATH)):
+        if drv.endswith(".json"):
+            with open(os.path.join(DRIVERS_PATH, drv)) as driver_file:
+                drivers[os.path.splitext(drv)[0]] = json.load(driver_file)
+    return drivers
+
+
+def make_config(drivers: dict, num_readings: int) -> dict:
+    """
+    Synthetic site config with (at least) `num_readings` readings, spread over devices that each
+    use one of the given drivers and read all of its fields.
+    """
+    devices = {}
+    readings = {}
+    drv_ids = [drv_id for drv_id, drv in drivers.items() if drv.get("fields")]
+
+    i = 0
+    while len(readings) < num_readings:
+        drv_id = drv_ids[i % len(drv_ids)]
+        dev_id = f"dev_{i}"
+        devices[dev_id] = {
+            "driver": drv_id,
+            "reading_type": "modbusrtu",
+            "address": {"device": f"/dev/ttyUSB{i % 4}", "slaveaddr": i % 247 + 1, "baudrate": 9600},
+        }
+        for var in drivers[drv_id]["fields"]:
+            readings[f"{dev_id}_{var}"] = {"device": dev_id, "var": var}
+        i += 1
+
+    return {"devices": devices, "readings": readings, "read_interval": 60}
+
+
+def make_outputs(config: dict, num_outputs: int) -> list[dict]:
+    """
+    Synthetic output config with `num_outputs` calculated outputs, each referring to one or more readings
+    of the devices in the config
+    """
+    dev_vars = {}
+    for rdg in config["readings"].values():
+        dev_vars.setdefault(rdg["device"], []).append(rdg["var"])
+    dev_ids = list(dev_vars)
+
+    outputs = []
+    for i in range(num_outputs):
+        dev_a = dev_ids[i % len(dev_ids)]
+        dev_b = dev_ids[(i + 1) % len(dev_ids)]
+        var_a = dev_vars[dev_a][i % len(dev_vars[dev_a])]
+        var_b = dev_vars[dev_b][i % len(dev_vars[dev_b])]
+        if i % 3 == 0:
+            source = f'{dev_a}[var = "{var_a}"].value * 2'
+        elif i % 3 == 1:
+            source = f'$sum([{dev_a}[var = "{var_a}"].value, {dev_b}[var = "{var_b}"].value])'
+        else:
+            source = f'{dev_a}[var = "{var_a}"].value > 10 ? {dev_b}[var = "{var_b}"].value : 0'
+        outputs.append({"field": f"output_{i}", "source": source, "typecast": "float"})
+
+    return outputs
+
+
+def set_values(dev_rdg: dict, cycle: int = 0, changed_fraction: float = 1.0) -> None:
+    """
+    Sets synthetic values for the readings in dev_rdg, as would be obtained in the given reading cycle.
+    Only the given fraction of the readings changes its value from one cycle to the next.
+    """
+    for dev_id, readings in dev_rdg.items():
+        for i, rdg in enumerate(readings):
+            changes = (i * 7919) % 1000 < changed_fraction * 1000
+            rdg["value"] = float(i + (cycle if changes else 0))
+
+
+def timeit(fn, repeat: int) -> float:
+    """Average duration of `fn()` in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
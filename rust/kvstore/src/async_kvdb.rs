@@ -10,7 +10,7 @@ use serde::de::DeserializeOwned;
 use serde::Serialize;
 use tokio::sync::Mutex;
 
-use crate::{KVDb, KVStoreError};
+use crate::{KVDb, KVStoreError, KVTransaction};
 
 /// Async wrapper around KVDb
 ///
@@ -96,6 +96,27 @@ impl AsyncKVDb {
         })?
     }
 
+    /// Carry out the reads and writes of `f` in a single transaction (see KVDb::transaction)
+    pub async fn transaction<T, F>(&self, f: F) -> Result<T, KVStoreError>
+    where
+        T: Send + 'static,
+        F: FnOnce(&KVTransaction) -> Result<T, KVStoreError> + Send + 'static,
+    {
+        let inner = self.inner.clone();
+
+        tokio::task::spawn_blocking(move || {
+            let mut kvdb = inner.blocking_lock();
+            kvdb.transaction(f)
+        })
+        .await
+        .map_err(|e| {
+            KVStoreError::IOError(std::io::Error::other(format!(
+                "Failed to spawn blocking task: {}",
+                e
+            )))
+        })?
+    }
+
     /// Get the path to the database file
     pub fn path(&self) -> &Path {
         &self.path
@@ -147,6 +168,22 @@ mod tests {
         Ok(())
     }
 
+    #[tokio::test]
+    async fn test_async_kvdb_transaction() -> Result<(), KVStoreError> {
+        let db = AsyncKVDb::new(":memory:").await?;
+
+        db.set("counter", &1).await?;
+        db.transaction(|txn| {
+            let value: Option<i64> = txn.get("counter")?;
+            txn.set("counter", value.unwrap_or(0) + 1)
+        })
+        .await?;
+        let value: Option<i64> = db.get("counter").await?;
+        assert_eq!(value, Some(2));
+
+        Ok(())
+    }
+
     #[tokio::test]
     async fn test_async_kvdb_concurrent_access() -> Result<(), KVStoreError> {
         let db = AsyncKVDb::new(":memory:").await?;
@@ -1,7 +1,7 @@
 use std::path::Path;
 use std::{error::Error, fmt};
 
-use rusqlite::{params, Connection, OptionalExtension};
+use rusqlite::{params, Connection, OptionalExtension, Transaction, TransactionBehavior};
 use serde::de::DeserializeOwned;
 use serde::Serialize;
 
@@ -11,6 +11,14 @@ pub use async_kvdb::AsyncKVDb;
 const TABLENAME: &str = "kvstore";
 const KEY_FIELD: &str = "key";
 const VALUE_FIELD: &str = "value";
+// Table with the time-to-live (in seconds) of the keys that expire, and the time (as a Unix timestamp) at which they
+// do, as shared with the Python key-value store. Expired keys are hidden from reads, and deleted by the Python
+// process's maintenance.
+const EXPIRY_TABLENAME: &str = "kvstore_expiry";
+const TTL_FIELD: &str = "ttl";
+const EXPIRES_AT_FIELD: &str = "expires_at";
+// The current Unix timestamp, to the millisecond
+const NOW_SQL: &str = "((julianday('now') - 2440587.5) * 86400.0)";
 
 #[derive(Debug)]
 pub enum KVStoreError {
@@ -49,6 +57,65 @@ impl From<rusqlite::Error> for KVStoreError {
     }
 }
 
+fn select<K: AsRef<str>>(conn: &Connection, key: K) -> Result<Option<Vec<u8>>, KVStoreError> {
+    conn.query_row(
+        &format!(
+            "SELECT {VALUE_FIELD} FROM '{TABLENAME}' WHERE {KEY_FIELD} = ?1
+            AND NOT EXISTS (SELECT 1 FROM '{EXPIRY_TABLENAME}'
+                WHERE {KEY_FIELD} = {TABLENAME}.{KEY_FIELD} AND {EXPIRES_AT_FIELD} <= {NOW_SQL})"
+        ),
+        [key.as_ref()],
+        |r| r.get::<_, Vec<u8>>(0),
+    )
+    .optional()
+    .map_err(Into::into)
+}
+
+/// Writes the value of the key. With a `ttl` (in seconds), the key expires that long after it was last written;
+/// without, it no longer expires (as for the Python key-value store).
+fn upsert<K: AsRef<str>, V: AsRef<[u8]>>(
+    conn: &Connection,
+    key: K,
+    value: V,
+    ttl: Option<f64>,
+) -> Result<(), KVStoreError> {
+    let res = conn
+        .prepare_cached(&format!(
+            "INSERT INTO '{TABLENAME}' ({KEY_FIELD}, {VALUE_FIELD}) values (?1, ?2)
+            ON CONFLICT({KEY_FIELD}) DO UPDATE SET {VALUE_FIELD}=?2",
+        ))?
+        .execute(params![key.as_ref(), value.as_ref()])?;
+    log::debug!("Inserted: {:?} row(s)", res);
+
+    match ttl {
+        Some(ttl) => {
+            conn.prepare_cached(&format!(
+                "INSERT INTO '{EXPIRY_TABLENAME}' ({KEY_FIELD}, {TTL_FIELD}, {EXPIRES_AT_FIELD})
+                values (?1, ?2, {NOW_SQL} + ?2)
+                ON CONFLICT({KEY_FIELD}) DO UPDATE SET {TTL_FIELD}=?2, {EXPIRES_AT_FIELD}={NOW_SQL} + ?2",
+            ))?
+            .execute(params![key.as_ref(), ttl])?;
+        }
+        None => {
+            conn.prepare_cached(&format!(
+                "DELETE FROM '{EXPIRY_TABLENAME}' WHERE {KEY_FIELD} = ?1"
+            ))?
+            .execute([key.as_ref()])?;
+        }
+    }
+    Ok(())
+}
+
+fn get_json<T: DeserializeOwned>(
+    conn: &Connection,
+    key: impl AsRef<str>,
+) -> Result<Option<T>, KVStoreError> {
+    select(conn, key)?
+        .map(|v| serde_json::from_slice::<T>(&v))
+        .transpose()
+        .map_err(Into::into)
+}
+
 pub struct KVDb(Connection);
 
 impl KVDb {
@@ -60,48 +127,36 @@ impl KVDb {
             "PRAGMA journal_mode = WAL;  -- better write-concurrency
             PRAGMA synchronous = FULL;  -- fsync after each commit",
         )?;
-        connection.execute(
-            &format!(
-                "CREATE TABLE IF NOT EXISTS '{TABLENAME}' (
+        connection.execute_batch(&format!(
+            "CREATE TABLE IF NOT EXISTS '{TABLENAME}' (
                 key TEXT PRIMARY KEY NOT NULL,
                 value BLOB NOT NULL
-                )"
-            ),
-            [],
-        )?;
+            );
+            CREATE TABLE IF NOT EXISTS '{EXPIRY_TABLENAME}' (
+                {KEY_FIELD} TEXT PRIMARY KEY NOT NULL,
+                {TTL_FIELD} REAL NOT NULL,
+                {EXPIRES_AT_FIELD} REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS '{EXPIRY_TABLENAME}_{EXPIRES_AT_FIELD}'
+                ON '{EXPIRY_TABLENAME}' ({EXPIRES_AT_FIELD});"
+        ))?;
         log::debug!("Opened {} in read-write mode", path.as_ref().display());
         Ok(KVDb(connection))
     }
 
     fn select<K: AsRef<str>>(&self, key: K) -> Result<Option<Vec<u8>>, KVStoreError> {
-        self.0
-            .query_row(
-                &format!("SELECT {VALUE_FIELD} FROM '{TABLENAME}' WHERE {KEY_FIELD} = ?1"),
-                [key.as_ref()],
-                |r| r.get::<_, Vec<u8>>(0),
-            )
-            .optional()
-            .map_err(Into::into)
+        select(&self.0, key)
     }
 
     fn upsert<K: AsRef<str>, V: AsRef<[u8]>>(&self, key: K, value: V) -> Result<(), KVStoreError> {
-        let mut stmt = self.0.prepare(&format!(
-            "INSERT INTO '{TABLENAME}' ({KEY_FIELD}, {VALUE_FIELD}) values (?1, ?2)
-            ON CONFLICT({KEY_FIELD}) DO UPDATE SET {VALUE_FIELD}=?2",
-        ))?;
-        let res = stmt.execute(params![key.as_ref(), value.as_ref()])?;
-        log::debug!("Inserted: {:?} row(s)", res);
-        Ok(())
+        upsert(&self.0, key, value, None)
     }
 
     pub fn get<T: DeserializeOwned>(
         &self,
         key: impl AsRef<str>,
     ) -> Result<Option<T>, KVStoreError> {
-        self.select(key)?
-            .map(|v| serde_json::from_slice::<T>(&v))
-            .transpose()
-            .map_err(Into::into)
+        get_json(&self.0, key)
     }
 
     pub fn set<K: AsRef<str>, V: Serialize>(&self, key: K, value: V) -> Result<(), KVStoreError> {
@@ -110,6 +165,16 @@ impl KVDb {
         Ok(())
     }
 
+    /// Sets the value of the key, which expires `ttl` seconds after it was last written
+    pub fn set_with_ttl<K: AsRef<str>, V: Serialize>(
+        &self,
+        key: K,
+        value: V,
+        ttl: f64,
+    ) -> Result<(), KVStoreError> {
+        upsert(&self.0, &key, serde_json::to_vec(&value)?, Some(ttl))
+    }
+
     pub fn get_raw<K: AsRef<str>>(&self, key: K) -> Result<Option<Vec<u8>>, KVStoreError> {
         self.select(key)
     }
@@ -122,6 +187,48 @@ impl KVDb {
         self.upsert(key, &value)?;
         Ok(())
     }
+
+    /// Carries out the reads and writes of `f` in a single transaction, which is committed if `f` succeeds and
+    /// rolled back otherwise. The transaction takes the database's write lock straight away (BEGIN IMMEDIATE), so
+    /// that no other connection (e.g. of the Python process) writes in-between its reads and writes.
+    pub fn transaction<T, F>(&mut self, f: F) -> Result<T, KVStoreError>
+    where
+        F: FnOnce(&KVTransaction) -> Result<T, KVStoreError>,
+    {
+        let txn = KVTransaction(
+            self.0
+                .transaction_with_behavior(TransactionBehavior::Immediate)?,
+        );
+        let result = f(&txn)?;
+        txn.0.commit()?;
+        Ok(result)
+    }
+}
+
+/// Reads and writes within a transaction (see KVDb::transaction)
+pub struct KVTransaction<'a>(Transaction<'a>);
+
+impl KVTransaction<'_> {
+    pub fn get<T: DeserializeOwned>(
+        &self,
+        key: impl AsRef<str>,
+    ) -> Result<Option<T>, KVStoreError> {
+        get_json(&self.0, key)
+    }
+
+    pub fn set<K: AsRef<str>, V: Serialize>(&self, key: K, value: V) -> Result<(), KVStoreError> {
+        upsert(&self.0, &key, serde_json::to_vec(&value)?, None)
+    }
+
+    /// Sets the value of the key, which expires `ttl` seconds after it was last written
+    pub fn set_with_ttl<K: AsRef<str>, V: Serialize>(
+        &self,
+        key: K,
+        value: V,
+        ttl: f64,
+    ) -> Result<(), KVStoreError> {
+        upsert(&self.0, &key, serde_json::to_vec(&value)?, Some(ttl))
+    }
 }
 
 #[cfg(test)]
@@ -145,4 +252,69 @@ mod tests {
         assert!(db.select(TEST_KEY)?.is_none());
         Ok(())
     }
+
+    #[test]
+    fn transaction_commits() -> Result<(), KVStoreError> {
+        let mut db = KVDb::new(IN_MEMORY)?;
+        db.set(TEST_KEY, 1)?;
+        let previous = db.transaction(|txn| {
+            let value: Option<i64> = txn.get(TEST_KEY)?;
+            txn.set(TEST_KEY, value.unwrap_or(0) + 1)?;
+            Ok(value)
+        })?;
+        assert_eq!(previous, Some(1));
+        assert_eq!(db.get::<i64>(TEST_KEY)?, Some(2));
+        Ok(())
+    }
+
+    #[test]
+    fn transaction_rolls_back_on_error() -> Result<(), KVStoreError> {
+        let mut db = KVDb::new(IN_MEMORY)?;
+        db.set(TEST_KEY, 1)?;
+        let result: Result<(), KVStoreError> = db.transaction(|txn| {
+            txn.set(TEST_KEY, 2)?;
+            txn.get::<String>(TEST_KEY)?;
+            Ok(())
+        });
+        assert!(matches!(result, Err(KVStoreError::JsonError(_))));
+        assert_eq!(db.get::<i64>(TEST_KEY)?, Some(1));
+        Ok(())
+    }
+
+    fn expire(db: &KVDb, key: &str) -> Result<(), KVStoreError> {
+        db.0.execute(
+            &format!(
+                "UPDATE '{EXPIRY_TABLENAME}' SET {EXPIRES_AT_FIELD} = 0 WHERE {KEY_FIELD} = ?1"
+            ),
+            [key],
+        )?;
+        Ok(())
+    }
+
+    #[test]
+    fn expired_keys_are_hidden() -> Result<(), KVStoreError> {
+        let db = KVDb::new(IN_MEMORY)?;
+        db.set_with_ttl(TEST_KEY, 1, 60.0)?;
+        db.set("other", 2)?;
+        assert_eq!(db.get::<i64>(TEST_KEY)?, Some(1));
+
+        expire(&db, TEST_KEY)?;
+        assert_eq!(db.get::<i64>(TEST_KEY)?, None);
+        assert_eq!(db.get::<i64>("other")?, Some(2));
+
+        // Writing the key again pushes back its expiry
+        db.set_with_ttl(TEST_KEY, 3, 60.0)?;
+        assert_eq!(db.get::<i64>(TEST_KEY)?, Some(3));
+        Ok(())
+    }
+
+    #[test]
+    fn ttl_removed_when_set_without() -> Result<(), KVStoreError> {
+        let mut db = KVDb::new(IN_MEMORY)?;
+        db.transaction(|txn| txn.set_with_ttl(TEST_KEY, 1, 60.0))?;
+        db.set(TEST_KEY, 2)?;
+        expire(&db, TEST_KEY)?;
+        assert_eq!(db.get::<i64>(TEST_KEY)?, Some(2));
+        Ok(())
+    }
 }
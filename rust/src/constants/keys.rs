@@ -5,8 +5,11 @@ pub const CONFIG: &str = "config";
 pub const NODE_ID: &str = "node_id";
 
 // Cache keys (stored in SQLITE_CACHE)
-pub const LAST_READINGS: &str = "last_readings";
 pub const LAST_READINGS_TS: &str = "last_readings_ts";
+pub const LAST_READING_FOR_DEV_PFX: &str = "last_reading_for_dev";
 pub const LAST_READING_TS_FOR_DEV_PFX: &str = "last_reading_ts_for_dev";
+// Time-to-live (in seconds) of the per-device keys, so that those of devices that are no longer read don't accumulate
+// (as for the Python readers)
+pub const LAST_READING_FOR_DEV_TTL: f64 = 24.0 * 3600.0;
 pub const LAST_STATUS_INFO_LEVEL_PFX: &str = "last_status_info_level";
 pub const ENV_NET_MAC_PFX: &str = "env/net/mac";
@@ -1,65 +1,81 @@
 use anyhow::Result;
 use kvstore::AsyncKVDb;
+use serde_json::{Value, json};
 
 use crate::{constants::keys, interfaces::kvpath};
 
 use super::payload::DeviceData;
 
-/// Save device readings to the cache, merging with existing readings if they share the same timestamp
+/// Save the readings of each device to the cache, in a row of its own (shared with the Python readers) along
+/// with the timestamp, so that only the rows of the devices read are written. Readings don't replace more recent
+/// readings of the same device, and readings of a device for the same timestamp are merged. The rows are read
+/// and written in a single transaction, so that the Python readers can't write any of them in-between.
 pub async fn save_last_readings(readings: Vec<DeviceData>, timestamp: i64) -> Result<()> {
     let cache = AsyncKVDb::new(kvpath::SQLITE_CACHE.as_path()).await?;
 
-    // Get existing cached data
-    let cached_timestamp: Option<i64> = cache.get(keys::LAST_READINGS_TS).await?;
-    let mut cached_readings: Vec<DeviceData> =
-        cache.get(keys::LAST_READINGS).await?.unwrap_or_default();
+    let saved = cache
+        .transaction(move |txn| {
+            let mut saved = 0;
+            for reading in readings {
+                let Some(device_id) = reading.d.clone() else {
+                    log::debug!("Not caching readings without a device ID");
+                    continue;
+                };
+                let key = format!("{}/{}", keys::LAST_READING_FOR_DEV_PFX, device_id);
+                let mut reading = serde_json::to_value(&reading)?;
 
-    // Extract device IDs from readings for per-device timestamp tracking
-    let device_ids: Vec<String> = readings
-        .iter()
-        .filter_map(|r| r.d.clone())
-        .collect::<std::collections::HashSet<_>>()
-        .into_iter()
-        .collect();
+                // Rows written by Python may lack fields of DeviceData, so they are read as plain JSON
+                let cached_row: Option<Value> = txn.get(&key)?;
+                if let Some(cached_row) = cached_row {
+                    let cached_timestamp = cached_row.get("t").and_then(Value::as_i64);
+                    match cached_timestamp {
+                        Some(cached_ts) if cached_ts > timestamp => {
+                            log::debug!(
+                                "Not caching readings of {} for {}, as those for {} are",
+                                device_id,
+                                timestamp,
+                                cached_ts
+                            );
+                            continue;
+                        }
+                        Some(cached_ts) if cached_ts == timestamp => {
+                            if let (Some(Value::Object(cached_fields)), Value::Object(fields)) =
+                                (cached_row.get("r"), &mut reading)
+                            {
+                                for (name, value) in cached_fields {
+                                    fields.entry(name.clone()).or_insert_with(|| value.clone());
+                                }
+                            }
+                        }
+                        _ => {}
+                    }
+                }
 
-    // Merge logic based on timestamp
-    let final_readings = if cached_timestamp == Some(timestamp) {
-        // Same timestamp: combine the readings arrays
-        log::debug!(
-            "Merging {} new readings with {} cached readings for timestamp {}",
-            readings.len(),
-            cached_readings.len(),
-            timestamp
-        );
-        cached_readings.extend(readings);
-        cached_readings
-    } else {
-        // Different timestamp: replace with new readings
-        log::debug!(
-            "Replacing cached readings (ts: {:?}) with {} new readings for timestamp {}",
-            cached_timestamp,
-            readings.len(),
-            timestamp
-        );
-        readings
-    };
+                // The rows of devices that are no longer read expire
+                txn.set_with_ttl(
+                    &key,
+                    json!({"t": timestamp, "r": reading}),
+                    keys::LAST_READING_FOR_DEV_TTL,
+                )?;
+                let ts_key = format!("{}/{}", keys::LAST_READING_TS_FOR_DEV_PFX, device_id);
+                txn.set_with_ttl(&ts_key, timestamp, keys::LAST_READING_FOR_DEV_TTL)?;
+                saved += 1;
+            }
 
-    // Save to cache
-    cache.set(keys::LAST_READINGS, &final_readings).await?;
-    cache.set(keys::LAST_READINGS_TS, &timestamp).await?;
+            let cached_timestamp: Option<i64> = txn.get(keys::LAST_READINGS_TS)?;
+            if cached_timestamp.is_none_or(|cached_ts| cached_ts < timestamp) {
+                txn.set(keys::LAST_READINGS_TS, timestamp)?;
+            }
+            Ok(saved)
+        })
+        .await?;
 
     log::debug!(
-        "[t: {}] Saved {} total readings to cache",
+        "[t: {}] Saved readings of {} device(s) to cache",
         timestamp,
-        final_readings.len()
+        saved
     );
 
-    // Save per-device timestamps
-    for device_id in device_ids {
-        let key = format!("{}/{}", keys::LAST_READING_TS_FOR_DEV_PFX, device_id);
-        cache.set(key, &timestamp).await?;
-    }
-
     Ok(())
 }
 
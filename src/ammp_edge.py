@@ -2,8 +2,8 @@
 
 import logging
 import os
-import sched
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from dotenv import load_dotenv
 
@@ -11,7 +11,9 @@ import node_mgmt
 from data_mgmt import DataPusher
 from node_mgmt.config_watch import ConfigWatch
 from node_mgmt.node import Node
-from reader import get_readout
+from reader import complete_readout, read_devices
+from reader.read_plan import get_read_plan
+from reader.scheduler import ReadingScheduler
 
 # Set up logging
 logging.basicConfig(format="%(threadName)s:%(name)s:%(lineno)d [%(levelname)s] %(message)s", level=logging.INFO)
@@ -30,40 +32,115 @@ if os.environ.get("LOG_LEVEL"):
 __version__ = "1.0"
 
 
-def reading_cycle(node: Node, pusher: DataPusher, sc=None):
-    config = node.config
-
-    # Check if scheduler has been applied, and if so schedule this function to be run again
-    # at the appropriate interval before taking the readings
-    if sc:
-        # If we want readings with round timestamps, schedule the next reading for the next such time
-        # Otherwise schedule it 'interval' seconds from now. The latter (non-rounded) option
-        # will lead to timestamp drift if any readings take longer than 'interval' (since the scheduler
-        # won't start a new process until the current one has finished).
-        # With the round-time option, any readings immediately following ones that take too long will have
-        # non-round timestamps, but if possible ones following that should "catch up". That said,
-        # drift can still accumulate and if it becomes greater than 'interval', a reading will be skipped.
-        if config.get("read_roundtime"):
-            sc.enterabs(roundtime(config["read_interval"]), 1, reading_cycle, (node, pusher, sc))
-        else:
-            sc.enter(config["read_interval"], 1, reading_cycle, (node, pusher, sc))
-
+def complete_cycle(readout: dict, config: dict, plan, dev_rdg: dict, pusher: DataPusher):
+    """Completes the readout with the calculated outputs, and pushes it"""
     try:
-        node.update_drv_from_config()
-        readout = get_readout(config, node.drivers)
+        readout = complete_readout(readout, config, plan, dev_rdg)
         if readout["r"] == []:
             logger.warning("No readings were returned; not pushing data")
             return
         pusher.push_readout(readout)
 
     except Exception:
-        logger.exception("READ: Exception getting readings")
-
+        logger.exception("READ: Exception completing readout")
+
+
+def reading_cycle(
+    node: Node,
+    pusher: DataPusher,
+    due: dict[str, set] | None = None,
+    schedule_stats: dict | None = None,
+    pipeline=None,
+    slot_time: float | None = None,
+) -> Future | None:
+    """
+    Takes the readings that are due (or all readings, if not given), and completes and pushes the readout.
+    If a pipeline (an executor with a single worker) is given, the readout is completed and pushed there, so that
+    the next cycle's readings can be taken in the meantime; the future for this is returned.
+    The node's drivers are expected to be up to date with its config. The readout is stamped with `slot_time` (the
+    time at which the readings were due) if given; see read_devices().
+    """
+    # The config and its digest are taken from the same snapshot, in case the config changes during the cycle
+    snapshot = node.config_snapshot
+    config = snapshot.config
 
-def roundtime(interval):
-    tnow = time.time()
-    next_roundtime = tnow + interval - (tnow % interval)
-    return next_roundtime
+    try:
+        # Readings of devices that miss the cycle deadline are pushed separately, once available
+        readout, plan, dev_rdg = read_devices(
+            config,
+            node.drivers,
+            on_late_readout=pusher.push_readout,
+            due=due,
+            config_digest=snapshot.digest,
+            slot_time=slot_time,
+        )
+    except Exception:
+        logger.exception("READ: Exception getting readings")
+        return None
+
+    if schedule_stats is not None:
+        readout["m"]["schedule"] = schedule_stats
+
+    if pipeline is None:
+        complete_cycle(readout, config, plan, dev_rdg, pusher)
+        return None
+    return pipeline.submit(complete_cycle, readout, config, plan, dev_rdg, pusher)
+
+
+def run_schedule(node: Node, pusher: DataPusher):
+    """
+    Takes readings according to the intervals in the config. Devices and readings can have intervals of their
+    own; upon each wake-up, only the readings that are due are taken. Without round times, the schedule is
+    relative to its start, and the first readings are taken straight away.
+
+    With `read_pipelining` enabled in the config, the readings for a cycle are taken while the readout of the
+    previous cycle is being completed (i.e. outputs calculated, cached and pushed). At most one readout is being
+    completed at a time.
+    """
+    scheduler = ReadingScheduler()
+    pipeline = None
+    completing = None
+
+    while True:
+        snapshot = node.config_snapshot
+        config = snapshot.config
+        if not config.get("read_interval"):
+            logger.warning("No reading interval in config; waiting until available")
+            time.sleep(15)
+            continue
+
+        try:
+            # Once per wake-up, for both the read plan and the readings
+            node.update_drv_from_config()
+            scheduler.update(
+                get_read_plan(config, node.drivers, snapshot.digest), config.get("read_roundtime", False), time.time()
+            )
+        except Exception:
+            logger.exception("READ: Exception scheduling readings")
+            time.sleep(config["read_interval"])
+            continue
+
+        if config.get("read_pipelining") and pipeline is None:
+            pipeline = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CompleteReadout")
+
+        due = scheduler.pop_due(time.time())
+        if due:
+            future = reading_cycle(
+                node,
+                pusher,
+                due,
+                scheduler.pop_stats(),
+                pipeline if config.get("read_pipelining") else None,
+                scheduler.slot_time(),
+            )
+            # Wait for the readout of the cycle before this one, so that readouts don't queue up for completion
+            if completing is not None:
+                completing.result()
+            completing = future
+            scheduler.check_overrun(time.time())
+
+        next_due = scheduler.next_due()
+        time.sleep(max(next_due - time.time(), 0) if next_due is not None else config["read_interval"])
 
 
 def main():
@@ -83,21 +160,16 @@ def main():
 
     if node.config.get("read_interval"):
         # We will be carrying out periodic readings (daemon mode)
-
-        # Set up scheduler and run reading cycle with schedule (reading_cycle function then schedules
-        # its own further iterations)
-        s = sched.scheduler(time.time, time.sleep)
-
         if node.config.get("read_roundtime"):
-            s.enterabs(roundtime(node.config["read_interval"]), 1, reading_cycle, (node, pusher, s))
             logger.info("Waiting to start on round time interval...")
-        else:
-            reading_cycle(node, pusher, s)
-
-        s.run()
+        run_schedule(node, pusher)
 
     else:
         # Carry out a one-off reading, with no scheduler
+        try:
+            node.update_drv_from_config()
+        except Exception:
+            logger.exception("READ: Exception updating drivers from config")
         reading_cycle(node, pusher)
 
 
@@ -0,0 +1,94 @@
+"""
+Encoding of the values in the key-value stores.
+
+Values are JSON by default, as written by earlier versions and by the Rust process (which can only read JSON).
+They are encoded with orjson, which is considerably faster than the json module and produces equivalent JSON.
+
+Values can also be stored in a binary encoding, in which case they start with a header: HEADER_MAGIC (a NUL
+byte, which can't start a JSON text), followed by the ID of the codec. Values without the header are always
+decoded as JSON, so existing rows remain readable. Since the Rust process can't read them, binary codecs are only
+used for the keys listed in BINARY_CODEC_KEYS; all other keys fall back to JSON.
+"""
+
+import json
+import logging
+
+import orjson
+
+from kvstore.keys import LAST_ENV_SCAN
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+HEADER_MAGIC = b"\x00"
+CODEC_MSGPACK = 1
+CODEC_NAMES = {"msgpack": CODEC_MSGPACK}
+
+# Large values that are only ever read by the Python processes
+BINARY_CODEC_KEYS = frozenset([LAST_ENV_SCAN])
+
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dump_json(value) -> bytes:
+    try:
+        return orjson.dumps(value, option=_ORJSON_OPTIONS)
+    except TypeError:
+        # orjson only supports integers of up to 64 bits
+        return json.dumps(value).encode("utf-8")
+
+
+def load_json(bvalue: bytes):
+    # Like the Rust process, orjson decodes integers beyond 64 bits (which no device reading can have) as floats
+    try:
+        return orjson.loads(bvalue)
+    except orjson.JSONDecodeError:
+        # Values written by earlier versions may contain NaN or Infinity, which orjson doesn't accept
+        return json.loads(bvalue)
+
+
+def _dump_msgpack(value) -> bytes:
+    return HEADER_MAGIC + bytes([CODEC_MSGPACK]) + msgpack.packb(value)
+
+
+def _load_msgpack(bvalue: bytes):
+    return msgpack.unpackb(bvalue[2:], strict_map_key=False)
+
+
+class Codec:
+    """
+    Encodes and decodes the values of a key-value store. With `binary_codec` (e.g. "msgpack"), the values of the
+    keys in BINARY_CODEC_KEYS are stored in that encoding. Values in any encoding can be decoded, as long as the
+    package for the codec is installed.
+    """
+
+    def __init__(self, binary_codec: str | None = None) -> None:
+        self._binary_codec = None
+        if binary_codec:
+            if binary_codec not in CODEC_NAMES:
+                raise ValueError(f"Unknown codec {binary_codec}, must be one of {list(CODEC_NAMES)}")
+            if msgpack is None:
+                logger.warning(f"Package for codec {binary_codec} is not installed; storing values as JSON")
+            else:
+                self._binary_codec = CODEC_NAMES[binary_codec]
+
+    def dump(self, key: str, value) -> bytes:
+        if self._binary_codec == CODEC_MSGPACK and key in BINARY_CODEC_KEYS:
+            try:
+                return _dump_msgpack(value)
+            except (TypeError, OverflowError):
+                # E.g. integers of more than 64 bits
+                pass
+        return dump_json(value)
+
+    @staticmethod
+    def load(bvalue: bytes):
+        if bvalue[:1] != HEADER_MAGIC:
+            return load_json(bvalue)
+        if bvalue[1] == CODEC_MSGPACK and msgpack is not None:
+            return _load_msgpack(bvalue)
+        raise ValueError(f"Value is encoded with unsupported codec {bvalue[1]}")
@@ -0,0 +1,293 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.logging import add_logging_level
+
+add_logging_level("TRACE", logging.DEBUG - 5)
+logger = logging.getLogger(__name__)
+
+TABLENAME = "kvstore"
+KEY_FIELD = "key"
+VALUE_FIELD = "value"
+# Table with the version of each key, which is set by triggers whenever the key's value changes (whichever process
+# writes it) to the next value of the database's version clock, so that versions only increase, even across the
+# deletion and re-creation of a key. Keys that haven't changed since the table was added have no row, i.e. version 0.
+VERSIONS_TABLENAME = "kvstore_versions"
+VERSION_FIELD = "version"
+# Single-row table with the version clock, i.e. the latest version of any key, and the latest version of the rows of
+# deleted keys that have been pruned from the versions table by KVMaintenance
+VERSION_CLOCK_TABLENAME = "kvstore_version_clock"
+PRUNED_FIELD = "pruned"
+# Table with the time-to-live (in seconds) of the keys that expire, and the time (as a Unix timestamp) at which they
+# do. Whenever a key is written, by any process, its expiry is pushed back by its TTL. Expired keys are hidden from
+# reads, and deleted by KVMaintenance.
+EXPIRY_TABLENAME = "kvstore_expiry"
+TTL_FIELD = "ttl"
+EXPIRES_AT_FIELD = "expires_at"
+# The current Unix timestamp, to the millisecond
+_NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+# Size (in bytes) that the WAL is truncated to after each checkpoint
+WAL_SIZE_LIMIT = 4 * 1024 * 1024
+
+# Advances the version clock, and inserts or updates the key's version to it. Without conflict clauses, as those of an
+# upsert or INSERT OR REPLACE would be overridden by those of the statement that fires the trigger.
+_BUMP_VERSION_SQL = f"""UPDATE '{VERSION_CLOCK_TABLENAME}' SET {VERSION_FIELD} = {VERSION_FIELD} + 1;
+        INSERT INTO '{VERSIONS_TABLENAME}' ({KEY_FIELD}, {VERSION_FIELD}) SELECT {{key}}, 0
+            WHERE NOT EXISTS (SELECT 1 FROM '{VERSIONS_TABLENAME}' WHERE {KEY_FIELD} = {{key}});
+        UPDATE '{VERSIONS_TABLENAME}' SET {VERSION_FIELD} = (SELECT {VERSION_FIELD} FROM '{VERSION_CLOCK_TABLENAME}')
+            WHERE {KEY_FIELD} = {{key}}"""
+
+# The statements used by the key-value stores. Connections are long-lived, and sqlite3 keeps the prepared form
+# of each statement in a per-connection cache, so each of these is only prepared once per connection.
+INIT_SCRIPT = f"""
+    PRAGMA auto_vacuum = INCREMENTAL;
+    PRAGMA journal_mode = WAL;
+    PRAGMA journal_size_limit = {WAL_SIZE_LIMIT};
+    CREATE TABLE IF NOT EXISTS '{TABLENAME}' (
+        {KEY_FIELD} TEXT PRIMARY KEY NOT NULL,
+        {VALUE_FIELD} BLOB NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS '{VERSIONS_TABLENAME}' (
+        {KEY_FIELD} TEXT PRIMARY KEY NOT NULL,
+        {VERSION_FIELD} INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS '{VERSION_CLOCK_TABLENAME}' (
+        {VERSION_FIELD} INTEGER NOT NULL,
+        {PRUNED_FIELD} INTEGER NOT NULL
+    );
+    INSERT INTO '{VERSION_CLOCK_TABLENAME}' ({VERSION_FIELD}, {PRUNED_FIELD})
+        SELECT COALESCE(MAX({VERSION_FIELD}), 0), 0 FROM '{VERSIONS_TABLENAME}'
+        WHERE NOT EXISTS (SELECT 1 FROM '{VERSION_CLOCK_TABLENAME}');
+    CREATE TRIGGER IF NOT EXISTS '{TABLENAME}_insert_version' AFTER INSERT ON '{TABLENAME}' BEGIN
+        {_BUMP_VERSION_SQL.format(key=f"NEW.{KEY_FIELD}")};
+    END;
+    CREATE TRIGGER IF NOT EXISTS '{TABLENAME}_update_version' AFTER UPDATE ON '{TABLENAME}'
+        WHEN OLD.{VALUE_FIELD} IS NOT NEW.{VALUE_FIELD} BEGIN
+        {_BUMP_VERSION_SQL.format(key=f"NEW.{KEY_FIELD}")};
+    END;
+    CREATE TRIGGER IF NOT EXISTS '{TABLENAME}_delete_version' AFTER DELETE ON '{TABLENAME}' BEGIN
+        {_BUMP_VERSION_SQL.format(key=f"OLD.{KEY_FIELD}")};
+    END;
+    CREATE TABLE IF NOT EXISTS '{EXPIRY_TABLENAME}' (
+        {KEY_FIELD} TEXT PRIMARY KEY NOT NULL,
+        {TTL_FIELD} REAL NOT NULL,
+        {EXPIRES_AT_FIELD} REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS '{EXPIRY_TABLENAME}_{EXPIRES_AT_FIELD}' ON '{EXPIRY_TABLENAME}' ({EXPIRES_AT_FIELD});
+    CREATE TRIGGER IF NOT EXISTS '{TABLENAME}_update_expiry' AFTER UPDATE ON '{TABLENAME}' BEGIN
+        UPDATE '{EXPIRY_TABLENAME}' SET {EXPIRES_AT_FIELD} = {_NOW_SQL} + {TTL_FIELD}
+            WHERE {KEY_FIELD} = NEW.{KEY_FIELD};
+    END;
+    CREATE TRIGGER IF NOT EXISTS '{TABLENAME}_delete_expiry' AFTER DELETE ON '{TABLENAME}' BEGIN
+        DELETE FROM '{EXPIRY_TABLENAME}' WHERE {KEY_FIELD} = OLD.{KEY_FIELD};
+    END;
+"""
+# Excludes the keys that have expired
+_NOT_EXPIRED_SQL = f"""NOT EXISTS (SELECT 1 FROM '{EXPIRY_TABLENAME}'
+        WHERE {KEY_FIELD} = {TABLENAME}.{KEY_FIELD} AND {EXPIRES_AT_FIELD} <= {_NOW_SQL})"""
+SELECT_SQL = f"""SELECT {VALUE_FIELD} FROM '{TABLENAME}' WHERE {KEY_FIELD} = :key
+    AND {_NOT_EXPIRED_SQL}"""
+UPSERT_SQL = f"""INSERT INTO '{TABLENAME}' ({KEY_FIELD}, {VALUE_FIELD}) values (:key, :value)
+    ON CONFLICT({KEY_FIELD}) DO UPDATE SET {VALUE_FIELD}=:value"""
+# Keys between :start (inclusive) and :end (exclusive), as used for prefix scans. Since the keys are the primary key,
+# the range is looked up in the primary key index.
+SCAN_SQL = f"""SELECT {KEY_FIELD}, {VALUE_FIELD} FROM '{TABLENAME}'
+    WHERE {KEY_FIELD} >= :start AND {KEY_FIELD} < :end AND {_NOT_EXPIRED_SQL}
+    ORDER BY {KEY_FIELD}"""
+SELECT_VERSION_SQL = f"SELECT {VERSION_FIELD} FROM '{VERSIONS_TABLENAME}' WHERE {KEY_FIELD} = :key"
+# The latest version of the keys in a range increases whenever any of the keys changes. As the versions of deleted
+# keys may have been pruned, it's at least the latest version pruned, so that it never decreases.
+SELECT_RANGE_VERSION_SQL = f"""SELECT MAX(COALESCE(MAX({VERSION_FIELD}), 0),
+        (SELECT {PRUNED_FIELD} FROM '{VERSION_CLOCK_TABLENAME}'))
+    FROM '{VERSIONS_TABLENAME}' WHERE {KEY_FIELD} >= :start AND {KEY_FIELD} < :end"""
+SET_EXPIRY_SQL = f"""INSERT INTO '{EXPIRY_TABLENAME}' ({KEY_FIELD}, {TTL_FIELD}, {EXPIRES_AT_FIELD})
+    values (:key, :ttl, :expires_at)
+    ON CONFLICT({KEY_FIELD}) DO UPDATE SET {TTL_FIELD}=:ttl, {EXPIRES_AT_FIELD}=:expires_at"""
+DELETE_EXPIRY_SQL = f"DELETE FROM '{EXPIRY_TABLENAME}' WHERE {KEY_FIELD} = :key"
+# Deletes up to :limit expired keys (and, by trigger, their expiry)
+DELETE_EXPIRED_SQL = f"""DELETE FROM '{TABLENAME}' WHERE {KEY_FIELD} IN (SELECT {KEY_FIELD} FROM '{EXPIRY_TABLENAME}'
+    WHERE {EXPIRES_AT_FIELD} <= {_NOW_SQL} LIMIT :limit)"""
+# Deletes the versions of up to :limit deleted keys. To be followed, in the same transaction, by SET_PRUNED_SQL,
+# which records them as pruned (as no version is later than the clock).
+DELETE_PRUNED_VERSIONS_SQL = f"""DELETE FROM '{VERSIONS_TABLENAME}' WHERE {KEY_FIELD} IN (
+    SELECT {KEY_FIELD} FROM '{VERSIONS_TABLENAME}' AS v
+    WHERE NOT EXISTS (SELECT 1 FROM '{TABLENAME}' WHERE {KEY_FIELD} = v.{KEY_FIELD}) LIMIT :limit)"""
+SET_PRUNED_SQL = f"UPDATE '{VERSION_CLOCK_TABLENAME}' SET {PRUNED_FIELD} = {VERSION_FIELD}"
+CACHED_STATEMENTS = 32
+
+# Values of SQLite's `synchronous` pragma, from least to most durable. In WAL mode, commits are only synced to disk
+# with FULL or EXTRA; with NORMAL, they may be lost (but the database is not corrupted) upon power loss.
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# Reader connections kept open when not in use; any others are closed once released
+MAX_IDLE_READERS = 4
+
+
+def upsert_many(conn: sqlite3.Connection, items: dict[str, bytes], expiry: dict | None = None) -> None:
+    """
+    Writes the encoded values of the keys. Those in `expiry`, a dict of (ttl, expires_at) tuples, expire; all
+    others no longer do.
+    """
+    expiry = expiry or {}
+    conn.executemany(UPSERT_SQL, ({"key": key, "value": bvalue} for key, bvalue in items.items()))
+    conn.executemany(DELETE_EXPIRY_SQL, ({"key": key} for key in items if key not in expiry))
+    conn.executemany(
+        SET_EXPIRY_SQL,
+        ({"key": key, "ttl": ttl, "expires_at": expires_at} for key, (ttl, expires_at) in expiry.items()),
+    )
+
+
+class ConnectionManager:
+    """
+    Long-lived connections to a single SQLite database: one writer connection, which is used by one thread at a
+    time, and a pool of reader connections. Since the database is in WAL mode, readers see the most recently
+    committed state and don't have to wait for writes to finish.
+
+    `synchronous` sets the durability of the writes (see SYNCHRONOUS_MODES).
+
+    The time spent waiting for the write lock and the duration of read and write operations are recorded, and
+    reported by pop_stats().
+    """
+
+    def __init__(self, db_path: str, synchronous: str = "FULL") -> None:
+        if synchronous.upper() not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode {synchronous}, must be one of {SYNCHRONOUS_MODES}")
+        self._db_path = db_path
+        self._write_lock = threading.Lock()
+        self._writer = self.__connect()
+        self._writer.executescript(INIT_SCRIPT)
+        self._writer.execute(f"PRAGMA synchronous = {synchronous.upper()}")
+        self._writer.commit()
+        self._readers = queue.LifoQueue()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        logger.debug(f"Opened connections to {db_path} (synchronous = {synchronous.upper()})")
+
+    def _reset_stats(self) -> None:
+        self._stats = {
+            "reads": 0,
+            "writes": 0,
+            "read_time": 0.0,
+            "write_time": 0.0,
+            "lock_wait_time": 0.0,
+            "max_lock_wait": 0.0,
+            "contended": 0,
+        }
+
+    def __connect(self) -> sqlite3.Connection:
+        # Connections are handed between threads, but only ever used by one thread at a time
+        conn = sqlite3.connect(self._db_path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+        # Only when tracing, as the trace callback is called (with the statement expanded) for every statement, as
+        # well as every statement of the triggers that it fires
+        if logger.isEnabledFor(logging.TRACE):
+            conn.set_trace_callback(logger.trace)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Provides a reader connection for the duration of the context"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            # Reader connections are in autocommit mode, so every read sees the latest committed state
+            conn = self.__connect()
+            conn.isolation_level = None
+
+        start = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            self.__record(reads=1, read_time=time.perf_counter() - start)
+            if self._readers.qsize() < MAX_IDLE_READERS:
+                self._readers.put(conn)
+            else:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        """
+        Provides the writer connection for the duration of the context, committing the transaction at the end
+        (or rolling it back if an exception is raised)
+        """
+        start = time.perf_counter()
+        contended = not self._write_lock.acquire(blocking=False)
+        if contended:
+            self._write_lock.acquire()
+        acquired = time.perf_counter()
+
+        try:
+            with self._writer:
+                yield self._writer
+        finally:
+            self._write_lock.release()
+            self.__record(
+                writes=1,
+                write_time=time.perf_counter() - acquired,
+                lock_wait_time=acquired - start,
+                max_lock_wait=acquired - start,
+                contended=int(contended),
+            )
+
+    def __record(self, **values) -> None:
+        with self._stats_lock:
+            for key, value in values.items():
+                if key.startswith("max_"):
+                    self._stats[key] = max(self._stats[key], value)
+                else:
+                    self._stats[key] += value
+
+    def pop_stats(self) -> dict:
+        """
+        Returns the number of operations and their mean duration (in ms), and the time spent waiting for the write
+        lock, since the previous call. Returns an empty dict if the database was not used.
+        """
+        with self._stats_lock:
+            stats = self._stats
+            self._reset_stats()
+
+        if not stats["reads"] and not stats["writes"]:
+            return {}
+
+        return {
+            "reads": stats["reads"],
+            "writes": stats["writes"],
+            "mean_read_ms": 1000 * stats["read_time"] / stats["reads"] if stats["reads"] else 0.0,
+            "mean_write_ms": 1000 * stats["write_time"] / stats["writes"] if stats["writes"] else 0.0,
+            "lock_wait_ms": 1000 * stats["lock_wait_time"],
+            "max_lock_wait_ms": 1000 * stats["max_lock_wait"],
+            "contended": stats["contended"],
+        }
+
+    def close(self) -> None:
+        with self._write_lock:
+            self._writer.close()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# The connection manager for each database path, along with the ID of the process that created it. Connections
+# must not be shared across a fork, so a process that was forked from the one that opened them opens its own.
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def get_connection_manager(db_path: str, synchronous: str = "FULL") -> ConnectionManager:
+    """
+    Returns the connection manager for the database, creating it if needed. `synchronous` only applies when the
+    manager is created.
+    """
+    with _managers_lock:
+        manager, pid = _managers.get(db_path, (None, None))
+        if manager is None or pid != os.getpid():
+            manager = ConnectionManager(db_path, synchronous)
+            _managers[db_path] = (manager, os.getpid())
+
+    return manager
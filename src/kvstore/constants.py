@@ -1,2 +1,13 @@
 SQLITE_STORE_REL_PATH = "kvs-db/kvstore.db"
 SQLITE_CACHE_ABS_PATH = "/tmp/ae-kvcache.db"
+
+# Environment variables that set the durability of each store's writes, as the value of SQLite's `synchronous`
+# pragma. The cache is in /tmp and doesn't need to survive a reboot, so its writes aren't synced to disk by default.
+KVSTORE_SYNCHRONOUS_ENV = "KVSTORE_SYNCHRONOUS"
+KVSTORE_SYNCHRONOUS_DEFAULT = "FULL"
+KVCACHE_SYNCHRONOUS_ENV = "KVCACHE_SYNCHRONOUS"
+KVCACHE_SYNCHRONOUS_DEFAULT = "OFF"
+# Environment variable that disables the cache's write-behind mode when set to 0 (see WriteBehindBuffer)
+KVCACHE_WRITE_BEHIND_ENV = "KVCACHE_WRITE_BEHIND"
+# Environment variable that sets the binary codec (e.g. msgpack) of the values that only Python reads (see Codec)
+KV_BINARY_CODEC_ENV = "KV_BINARY_CODEC"
@@ -2,9 +2,11 @@ NODE_ID = "node_id"
 ACCESS_KEY = "access_key"
 CONFIG = "config"
 
-LAST_READINGS = "last_readings"
 LAST_READINGS_TS = "last_readings_ts"
+LAST_READING_FOR_DEV_PFX = "last_reading_for_dev"
 LAST_READING_TS_FOR_DEV_PFX = "last_reading_ts_for_dev"
+# Time-to-live (in seconds) of the per-device keys, so that those of devices that are no longer read don't accumulate
+LAST_READING_FOR_DEV_TTL = 24 * 3600
 
 LAST_ENV_SCAN = "last_env_scan"
 
@@ -12,3 +14,5 @@ WIFI_AP_AVAILABLE = "wifi_ap_available"
 WIFI_AP_CONFIG = "wifi_ap_config"
 
 ENV_NET_MAC_PFX = "env/net/mac"
+# Time-to-live (in seconds) of the hosts found by network scans, so that those that are gone don't accumulate
+ENV_NET_MAC_TTL = 7 * 24 * 3600
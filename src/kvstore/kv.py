@@ -1,98 +1,377 @@
-import json
 import logging
 import sqlite3
-import threading
+import time
+from collections.abc import Callable
+from contextlib import contextmanager, nullcontext
 from os import getenv, path
 
-from kvstore.constants import SQLITE_CACHE_ABS_PATH, SQLITE_STORE_REL_PATH
-from utils.logging import add_logging_level
+from kvstore.codec import Codec
+from kvstore.connection_manager import (
+    SCAN_SQL,
+    SELECT_RANGE_VERSION_SQL,
+    SELECT_SQL,
+    SELECT_VERSION_SQL,
+    ConnectionManager,
+    get_connection_manager,
+    upsert_many,
+)
+from kvstore.constants import (
+    KV_BINARY_CODEC_ENV,
+    KVCACHE_SYNCHRONOUS_DEFAULT,
+    KVCACHE_SYNCHRONOUS_ENV,
+    KVCACHE_WRITE_BEHIND_ENV,
+    KVSTORE_SYNCHRONOUS_DEFAULT,
+    KVSTORE_SYNCHRONOUS_ENV,
+    SQLITE_CACHE_ABS_PATH,
+    SQLITE_STORE_REL_PATH,
+)
+from kvstore.maintenance import KVMaintenance, get_maintenance
+from kvstore.watcher import get_watcher
+from kvstore.write_behind import WriteBehindBuffer, get_write_behind_buffer
 
-add_logging_level("TRACE", logging.DEBUG - 5)
 logger = logging.getLogger(__name__)
 
 
-TABLENAME = "kvstore"
-KEY_FIELD = "key"
-VALUE_FIELD = "value"
+def _get_many(conn: sqlite3.Connection, keys, default=None) -> dict:
+    values = {}
+    for key in keys:
+        row = conn.execute(SELECT_SQL, {"key": key}).fetchone()
+        values[key] = default if row is None else Codec.load(row[0])
+    return values
 
-# The locks are created globally, since there is a chance that more than one
-# instance of KVCache or KVStore would be created and used concurrently
-KVS_lock = threading.Lock()
-KVC_lock = threading.Lock()
+
+def _get_version(conn: sqlite3.Connection, key: str) -> int:
+    row = conn.execute(SELECT_VERSION_SQL, {"key": key}).fetchone()
+    return 0 if row is None else row[0]
+
+
+def _get_prefix_range(prefix: str) -> dict:
+    if not prefix:
+        raise ValueError("A prefix is required for scanning keys")
+    # All keys that start with the prefix sort before the prefix with its last character incremented
+    return {"start": prefix, "end": prefix[:-1] + chr(ord(prefix[-1]) + 1)}
+
+
+def _get_prefix_version(conn: sqlite3.Connection, prefix: str) -> int:
+    return conn.execute(SELECT_RANGE_VERSION_SQL, _get_prefix_range(prefix)).fetchone()[0]
+
+
+def _scan_prefix(conn: sqlite3.Connection, prefix: str) -> list[tuple[str, object]]:
+    return [(key, Codec.load(bvalue)) for key, bvalue in conn.execute(SCAN_SQL, _get_prefix_range(prefix))]
+
+
+def _set_many(conn: sqlite3.Connection, codec: Codec, items: dict, ttl: float | None) -> None:
+    expiry = {} if ttl is None else dict.fromkeys(items, (ttl, time.time() + ttl))
+    upsert_many(conn, {key: codec.dump(key, value) for key, value in items.items()}, expiry)
+
+
+def _load_mirrored(bvalue: bytes | None, default=None):
+    return default if bvalue is None else Codec.load(bvalue)
+
+
+class KVTransaction:
+    """
+    Reads and writes that are carried out in a single transaction, on the writer connection. Reads see the
+    transaction's own writes, and all writes are committed at once at the end of the transaction.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, codec: Codec) -> None:
+        self._conn = conn
+        self._codec = codec
+        self._written = set()
+
+    @property
+    def written(self) -> set[str]:
+        """The keys written in the transaction"""
+        return self._written
+
+    def get(self, key: str, default=None):
+        return _get_many(self._conn, [key], default)[key]
+
+    def get_many(self, keys, default=None) -> dict:
+        return _get_many(self._conn, keys, default)
+
+    def get_version(self, key: str) -> int:
+        """Returns the version of the key, including the transaction's own writes"""
+        return _get_version(self._conn, key)
+
+    def scan_prefix(self, prefix: str) -> list[tuple[str, object]]:
+        return _scan_prefix(self._conn, prefix)
+
+    def get_prefix_dict(self, prefix: str) -> dict:
+        return {key[len(prefix) :]: value for key, value in _scan_prefix(self._conn, prefix)}
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict, ttl: float | None = None) -> None:
+        _set_many(self._conn, self._codec, items, ttl)
+        self._written.update(items)
+
+
+class WriteBehindTransaction:
+    """
+    Transaction on a KV in write-behind mode. The writes are collected, and handed to the write-behind buffer
+    at once at the end of the transaction. Other transactions of the process wait until the transaction is
+    complete, but unlike KVTransaction, writes by other processes are not locked out.
+    """
+
+    def __init__(self, kv: "KV") -> None:
+        self._kv = kv
+        # (encoded value, TTL) of each key written
+        self._items = {}
+
+    def get(self, key: str, default=None):
+        return self.get_many([key], default)[key]
+
+    def get_many(self, keys, default=None) -> dict:
+        values = self._kv.get_many([key for key in keys if key not in self._items], default)
+        return {key: Codec.load(self._items[key][0]) if key in self._items else values[key] for key in keys}
+
+    def scan_prefix(self, prefix: str) -> list[tuple[str, object]]:
+        values = dict(self._kv.scan_prefix(prefix))
+        values.update({key: Codec.load(bvalue) for key, (bvalue, _) in self._items.items() if key.startswith(prefix)})
+        return sorted(values.items())
+
+    def get_prefix_dict(self, prefix: str) -> dict:
+        return {key[len(prefix) :]: value for key, value in self.scan_prefix(prefix)}
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict, ttl: float | None = None) -> None:
+        self._items.update({key: (self._kv.codec.dump(key, value), ttl) for key, value in items.items()})
+
+    def commit(self) -> None:
+        items_by_ttl = {}
+        for key, (bvalue, ttl) in self._items.items():
+            items_by_ttl.setdefault(ttl, {})[key] = bvalue
+        for ttl, items in items_by_ttl.items():
+            self._kv.write_behind.set_many(items, ttl)
 
 
 class KV:
-    def __init__(self, sqlite_db_path: str, lock: threading.Lock) -> None:
-        self._conn = sqlite3.connect(sqlite_db_path, check_same_thread=False)
-        self._conn.set_trace_callback(logger.trace)
-        self._cur = self._conn.cursor()
-        self._lock = lock
-        with self._lock:
-            self.__initialize_db()
+    """
+    Key-value store backed by a SQLite database. Instances are cheap to create: they share the long-lived
+    connections of the process to the database (see ConnectionManager), which remain open when an instance is
+    closed or discarded.
+
+    Each set() is committed separately. To write several values with a single commit, use set_many(), or
+    transaction() if values also need to be read (e.g. to be merged with the values being written). Values
+    written with a `ttl` expire that many seconds after they were last written (by any process), upon which they
+    are no longer read, and are deleted by the database's KVMaintenance.
+
+    With `write_behind`, writes go to the in-process WriteBehindBuffer of the database instead, which also
+    serves the reads of the keys written by the process, and are committed to the database in the background.
+    `synchronous` sets the durability of the commits (see SYNCHRONOUS_MODES); as the connections are shared,
+    only the first instance for a database sets it. `binary_codec` sets the encoding of the values that don't
+    need to be readable by the Rust process (see Codec).
+    """
+
+    def __init__(
+        self,
+        sqlite_db_path: str,
+        synchronous: str = "FULL",
+        write_behind: bool = False,
+        binary_codec: str | None = None,
+    ) -> None:
+        self._db_path = sqlite_db_path
+        self._codec = Codec(binary_codec)
+        self._manager = get_connection_manager(sqlite_db_path, synchronous)
+        self._write_behind = get_write_behind_buffer(sqlite_db_path, self._manager) if write_behind else None
+        self._maintenance = get_maintenance(sqlite_db_path)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
-        self._conn.close()
-
-    def __del__(self) -> None:
-        self._conn.close()
-
-    def __initialize_db(self) -> None:
-        self._cur.executescript(
-            f"""
-            PRAGMA journal_mode = WAL;
-            PRAGMA synchronous = FULL;
-            CREATE TABLE IF NOT EXISTS '{TABLENAME}' (
-                key TEXT PRIMARY KEY NOT NULL,
-                value BLOB NOT NULL
-            );
-            """
-        )
-        self._conn.commit()
-
-    @staticmethod
-    def __dump(value) -> bytes:
-        return json.dumps(value).encode("utf-8")
-
-    @staticmethod
-    def __load(bvalue: bytes):
-        return json.loads(bvalue)
-
-    def __select(self, key: str) -> bytes:
-        with self._lock:
-            self._cur.execute("SELECT value FROM 'kvstore' WHERE key = :key", {"key": key})
-            return self._cur.fetchone()[0]
-
-    def __upsert(self, key: str, value: bytes) -> None:
-        with self._lock:
-            self._cur.execute(
-                f"""INSERT INTO '{TABLENAME}' ({KEY_FIELD}, {VALUE_FIELD}) values (:key, :value)
-                ON CONFLICT({KEY_FIELD}) DO UPDATE SET {VALUE_FIELD}=:value""",
-                {"key": key, "value": value},
-            )
-            self._conn.commit()
+        pass
+
+    @property
+    def connection_manager(self) -> ConnectionManager:
+        return self._manager
+
+    @property
+    def codec(self) -> Codec:
+        return self._codec
+
+    @property
+    def write_behind(self) -> WriteBehindBuffer | None:
+        return self._write_behind
+
+    @property
+    def maintenance(self) -> KVMaintenance:
+        return self._maintenance
 
     def get(self, key: str, default=None):
-        try:
-            bvalue = self.__select(key)
-        except TypeError:
-            return default
+        return self.get_many([key], default)[key]
+
+    def get_many(self, keys, default=None) -> dict:
+        """Returns the values of the keys as a dict, all read from the same snapshot of the store"""
+        mirrored = self._write_behind.get_many(keys) if self._write_behind else {}
+        values = {}
+        if unmirrored := [key for key in keys if key not in mirrored]:
+            with self._manager.reader() as conn:
+                if len(unmirrored) == 1:
+                    values = _get_many(conn, unmirrored, default)
+                else:
+                    conn.execute("BEGIN")
+                    try:
+                        values = _get_many(conn, unmirrored, default)
+                    finally:
+                        conn.execute("COMMIT")
+        return {key: _load_mirrored(mirrored[key], default) if key in mirrored else values[key] for key in keys}
+
+    def get_version(self, key: str) -> int:
+        """
+        Returns the version of the key, which increases whenever its value changes (by any process). In
+        write-behind mode, pending writes to the key are flushed first.
+        """
+        self.__flush_key(key)
+        with self._manager.reader() as conn:
+            return _get_version(conn, key)
 
-        return self.__load(bvalue)
+    def get_if_changed(self, key: str, version: int | None, default=None) -> tuple[int, object] | None:
+        """
+        Returns the current version and value of the key if its version differs from the given one (e.g. the
+        version returned by the previous call, or None to always get the value), or None if it's unchanged. This
+        way, unchanged values are neither read nor parsed.
+        """
+        self.__flush_key(key)
+        with self._manager.reader() as conn:
+            conn.execute("BEGIN")
+            try:
+                current_version = _get_version(conn, key)
+                if current_version == version:
+                    return None
+                return current_version, _get_many(conn, [key], default)[key]
+            finally:
+                conn.execute("COMMIT")
 
-    def set(self, key: str, value) -> None:
-        bvalue = self.__dump(value)
-        self.__upsert(key, bvalue)
+    def watch(self, key: str, callback: Callable[[int, object], None]) -> Callable[[], None]:
+        """
+        Calls the callback with the new version and value of the key whenever it changes, including changes by
+        other processes (see KVWatcher). In write-behind mode, the process's own changes are notified once
+        they have been flushed. Returns a function that stops watching the key.
+        """
+
+        def on_change(version: int, bvalue: bytes | None) -> None:
+            callback(version, None if bvalue is None else Codec.load(bvalue))
+
+        watcher = get_watcher(self._db_path)
+        watcher.subscribe(key, on_change, self.get_version(key))
+        return lambda: watcher.unsubscribe(key, on_change)
+
+    def get_prefix_if_changed(self, prefix: str, version: int | None) -> tuple[int, dict] | None:
+        """
+        Like get_if_changed(), for all keys that start with the prefix: returns a version for the keys, which
+        changes whenever any of them changes, along with the get_prefix_dict() of the keys, or None if none of
+        them has changed since the given version.
+        """
+        if self._write_behind and self._write_behind.get_prefix(prefix, pending=True):
+            self._write_behind.flush()
+        with self._manager.reader() as conn:
+            conn.execute("BEGIN")
+            try:
+                current_version = _get_prefix_version(conn, prefix)
+                if current_version == version:
+                    return None
+                return current_version, {key[len(prefix) :]: value for key, value in _scan_prefix(conn, prefix)}
+            finally:
+                conn.execute("COMMIT")
+
+    def __flush_key(self, key: str) -> None:
+        if self._write_behind and self._write_behind.is_pending(key):
+            self._write_behind.flush()
+
+    def scan_prefix(self, prefix: str) -> list[tuple[str, object]]:
+        """Returns (key, value) tuples for all keys that start with the prefix, ordered by key"""
+        with self._manager.reader() as conn:
+            items = _scan_prefix(conn, prefix)
+        if self._write_behind and (mirrored := self._write_behind.get_prefix(prefix)):
+            values = dict(items)
+            for key, bvalue in mirrored.items():
+                if bvalue is None:
+                    values.pop(key, None)
+                else:
+                    values[key] = Codec.load(bvalue)
+            items = sorted(values.items())
+        return items
+
+    def get_prefix_dict(self, prefix: str) -> dict:
+        """
+        Returns the values of all keys that start with the prefix, as a dict keyed by the rest of the key. E.g. for
+        the prefix 'last_reading_ts_for_dev/', the dict is keyed by device ID.
+        """
+        return {key[len(prefix) :]: value for key, value in self.scan_prefix(prefix)}
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict, ttl: float | None = None) -> None:
+        """
+        Sets the values of all keys in the dict, with a single commit. With `ttl`, the keys expire after that many
+        seconds (unless written again); otherwise, they no longer expire.
+        """
+        if self._write_behind:
+            self._write_behind.set_many({key: self._codec.dump(key, value) for key, value in items.items()}, ttl)
+            return
+        with self._manager.writer() as conn:
+            _set_many(conn, self._codec, items, ttl)
+
+    def flush(self) -> None:
+        """In write-behind mode, writes all pending values to the database"""
+        if self._write_behind:
+            self._write_behind.flush()
+
+    @contextmanager
+    def transaction(self, write_behind: bool = True):
+        """
+        Provides a KVTransaction, which is committed when the context is exited without exception, or rolled back
+        otherwise. Other writers wait until the transaction is complete. In write-behind mode, provides a
+        WriteBehindTransaction instead, unless `write_behind` is False.
+
+        Keys that other processes write too (e.g. the rows of the last readings, shared with the Rust process) are
+        to be written with `write_behind` False, so that the transaction can't interleave with their writes, nor
+        be flushed over these later. The keys written that way are no longer mirrored by the write-behind buffer,
+        and any pending writes of them are dropped.
+        """
+        if self._write_behind and write_behind:
+            with self._write_behind.lock:
+                txn = WriteBehindTransaction(self)
+                yield txn
+                txn.commit()
+            return
+
+        # The write-behind buffer is kept from flushing during the transaction, so that it can't write a value that
+        # it took up before the transaction once the transaction has been committed
+        with self._write_behind.flush_lock if self._write_behind else nullcontext(), self._manager.writer() as conn:
+            # Take the database's write lock straight away, so that no other process writes in-between the reads
+            # and writes of the transaction
+            conn.execute("BEGIN IMMEDIATE")
+            txn = KVTransaction(conn, self._codec)
+            yield txn
+            if self._write_behind:
+                self._write_behind.discard(txn.written)
 
 
 class KVStore(KV):
     def __init__(self) -> None:
         SQLITE_STORE_DB_PATH = path.join(getenv("SNAP_COMMON", "./"), SQLITE_STORE_REL_PATH)
-        KV.__init__(self, SQLITE_STORE_DB_PATH, KVS_lock)
+        KV.__init__(
+            self,
+            SQLITE_STORE_DB_PATH,
+            getenv(KVSTORE_SYNCHRONOUS_ENV, KVSTORE_SYNCHRONOUS_DEFAULT),
+            binary_codec=getenv(KV_BINARY_CODEC_ENV),
+        )
 
 
 class KVCache(KV):
     def __init__(self) -> None:
-        KV.__init__(self, SQLITE_CACHE_ABS_PATH, KVC_lock)
+        KV.__init__(
+            self,
+            SQLITE_CACHE_ABS_PATH,
+            getenv(KVCACHE_SYNCHRONOUS_ENV, KVCACHE_SYNCHRONOUS_DEFAULT),
+            write_behind=getenv(KVCACHE_WRITE_BEHIND_ENV, "1") != "0",
+            binary_codec=getenv(KV_BINARY_CODEC_ENV),
+        )
@@ -0,0 +1,230 @@
+import fcntl
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from kvstore.connection_manager import DELETE_EXPIRED_SQL, DELETE_PRUNED_VERSIONS_SQL, SET_PRUNED_SQL, WAL_SIZE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Interval (in seconds) at which expired keys and the versions of deleted keys are deleted, and the need for a vacuum
+# or checkpoint is checked
+SWEEP_INTERVAL = 60.0
+# Expired keys (or versions) deleted per commit, so that other writers aren't held up for long
+SWEEP_BATCH = 500
+# The WAL is checkpointed at least this often (in seconds), and truncated once it exceeds WAL_SIZE_LIMIT
+CHECKPOINT_INTERVAL = 300.0
+# Free pages are reclaimed once they exceed VACUUM_FREE_BYTES, at most VACUUM_PAGES at a time
+VACUUM_FREE_BYTES = 1024 * 1024
+VACUUM_PAGES = 256
+
+AUTO_VACUUM_INCREMENTAL = 2
+# Suffix of the lock file next to the database, which the process that carries out its maintenance holds
+LOCK_FILE_SUFFIX = ".maintenance.lock"
+
+
+class KVMaintenance:
+    """
+    Upkeep of a database, so that long-running processes keep a stable size and I/O latency. Every SWEEP_INTERVAL
+    seconds, a background thread deletes the keys that have expired along with the versions of all deleted keys,
+    reclaims free pages with an incremental vacuum, and checkpoints the WAL (see the constants above for the limits
+    of each).
+
+    Databases created without incremental auto-vacuum (by earlier versions, or by the Rust process) are converted
+    with a single full VACUUM, once they have enough free pages to make it worthwhile.
+
+    Every process that opens the database has a KVMaintenance, but only one process at a time carries out the
+    upkeep: the first one to take the lock file next to the database, which it holds until it exits. The others
+    check for the lock upon each sweep, so that one of them takes over if that process exits.
+
+    The maintenance uses a connection of its own. The number of keys expired and versions pruned, the duration of
+    the checkpoints and the size of the database are reported by pop_stats().
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._lock_fd = None
+        self._last_checkpoint = time.monotonic()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+        threading.Thread(target=self.__run, name="KVMaintenance", daemon=True).start()
+
+    def _reset_stats(self) -> None:
+        self._stats = {
+            "expired": 0,
+            "pruned_versions": 0,
+            "vacuumed_bytes": 0,
+            "checkpoints": 0,
+            "checkpoint_time": 0.0,
+            "max_checkpoint_time": 0.0,
+        }
+
+    def run_once(self) -> bool:
+        """
+        Deletes expired keys and the versions of deleted keys, and vacuums and checkpoints the database if needed.
+        Returns False, without doing any of that, if another process carries out the maintenance of the database.
+        """
+        with self._lock:
+            if not self.__acquire_lock_file():
+                return False
+
+            if self._conn is None:
+                self._conn = sqlite3.connect(self._db_path, isolation_level=None, check_same_thread=False)
+                self._conn.execute(f"PRAGMA journal_size_limit = {WAL_SIZE_LIMIT}")
+
+            self.__sweep()
+            self.__prune_versions()
+            self.__vacuum()
+            wal_size = self.__get_size("-wal")
+            if wal_size >= WAL_SIZE_LIMIT or time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+                self.__checkpoint("TRUNCATE" if wal_size >= WAL_SIZE_LIMIT else "PASSIVE")
+            return True
+
+    def __acquire_lock_file(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+
+        try:
+            lock_fd = os.open(self._db_path + LOCK_FILE_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning(f"Unable to open the maintenance lock file of {self._db_path}: {e}")
+            return False
+        try:
+            # The lock is released by the OS when the process exits, however it does
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_fd)
+            return False
+
+        logger.info(f"Carrying out the maintenance of {self._db_path} in this process ({os.getpid()})")
+        self._lock_fd = lock_fd
+        return True
+
+    def __sweep(self) -> None:
+        expired = 0
+        while True:
+            deleted = self._conn.execute(DELETE_EXPIRED_SQL, {"limit": SWEEP_BATCH}).rowcount
+            expired += deleted
+            if deleted < SWEEP_BATCH:
+                break
+        if expired:
+            logger.debug(f"Deleted {expired} expired key(s) from {self._db_path}")
+            self.__record(expired=expired)
+
+    def __prune_versions(self) -> None:
+        # The versions of a key are only needed while it exists, as a key that's re-created gets a later version
+        pruned = 0
+        while True:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                deleted = self._conn.execute(DELETE_PRUNED_VERSIONS_SQL, {"limit": SWEEP_BATCH}).rowcount
+                if deleted:
+                    self._conn.execute(SET_PRUNED_SQL)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            pruned += deleted
+            if deleted < SWEEP_BATCH:
+                break
+        if pruned:
+            logger.debug(f"Pruned the versions of {pruned} deleted key(s) from {self._db_path}")
+            self.__record(pruned_versions=pruned)
+
+    def __vacuum(self) -> None:
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free_pages * page_size < VACUUM_FREE_BYTES:
+            return
+
+        try:
+            if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+                logger.info(f"Converting {self._db_path} to incremental auto-vacuum, with a full vacuum")
+                self._conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+                self._conn.execute("VACUUM")
+            else:
+                # Frees a single page per step, so it's run with executescript(), which steps until it's complete
+                self._conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+        except sqlite3.OperationalError as e:
+            # E.g. if another process holds a lock for longer than the timeout; the vacuum is retried next time
+            logger.warning(f"Unable to vacuum {self._db_path}: {e}")
+            return
+
+        vacuumed = free_pages - self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        logger.debug(f"Reclaimed {vacuumed} free page(s) of {self._db_path}")
+        self.__record(vacuumed_bytes=vacuumed * page_size)
+
+    def __checkpoint(self, mode: str) -> None:
+        start = time.perf_counter()
+        busy, wal_pages, checkpointed_pages = self._conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+        duration = time.perf_counter() - start
+        self._last_checkpoint = time.monotonic()
+        logger.debug(
+            f"Checkpointed {checkpointed_pages}/{wal_pages} WAL page(s) of {self._db_path} ({mode}) in "
+            f"{1000 * duration:.1f} ms{' (blocked by other connections)' if busy else ''}"
+        )
+        self.__record(checkpoints=1, checkpoint_time=duration, max_checkpoint_time=duration)
+
+    def __get_size(self, suffix: str = "") -> int:
+        try:
+            return os.path.getsize(self._db_path + suffix)
+        except FileNotFoundError:
+            return 0
+
+    def __record(self, **values) -> None:
+        with self._stats_lock:
+            for key, value in values.items():
+                if key.startswith("max_"):
+                    self._stats[key] = max(self._stats[key], value)
+                else:
+                    self._stats[key] += value
+
+    def pop_stats(self) -> dict:
+        """
+        Returns the current size of the database and its WAL (in kB), and the number of keys expired and versions
+        pruned, the free space reclaimed (in kB) and the number and mean duration of checkpoints (in ms) since the
+        previous call
+        """
+        with self._stats_lock:
+            stats = self._stats
+            self._reset_stats()
+
+        checkpoints = stats["checkpoints"]
+        return {
+            "db_size_kb": self.__get_size() / 1024,
+            "wal_size_kb": self.__get_size("-wal") / 1024,
+            "expired": stats["expired"],
+            "pruned_versions": stats["pruned_versions"],
+            "vacuumed_kb": stats["vacuumed_bytes"] / 1024,
+            "checkpoints": checkpoints,
+            "mean_checkpoint_ms": 1000 * stats["checkpoint_time"] / checkpoints if checkpoints else 0.0,
+            "max_checkpoint_ms": 1000 * stats["max_checkpoint_time"],
+        }
+
+    def __run(self) -> None:
+        while True:
+            time.sleep(SWEEP_INTERVAL)
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception(f"Exception during maintenance of {self._db_path}")
+
+
+# The maintenance of each database path, along with the ID of the process that created it (as for the connection
+# managers)
+_maintenances = {}
+_maintenances_lock = threading.Lock()
+
+
+def get_maintenance(db_path: str) -> KVMaintenance:
+    with _maintenances_lock:
+        maintenance, pid = _maintenances.get(db_path, (None, None))
+        if maintenance is None or pid != os.getpid():
+            maintenance = KVMaintenance(db_path)
+            _maintenances[db_path] = (maintenance, os.getpid())
+
+    return maintenance
@@ -0,0 +1,106 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+
+from kvstore.connection_manager import SELECT_SQL, SELECT_VERSION_SQL
+
+logger = logging.getLogger(__name__)
+
+# Interval (in seconds) at which the watchers check for changes to the database
+WATCH_INTERVAL = 1.0
+
+
+class KVWatcher:
+    """
+    Notifies subscribers of changes to keys of a database, whichever process made the change. A background thread
+    checks the database's data_version (which changes whenever another connection commits) every WATCH_INTERVAL
+    seconds. Only when it has changed are the versions of the watched keys read, and only the values of the keys
+    whose version has changed.
+
+    Callbacks are called from the watcher thread with the key's new version and encoded value (None if the key
+    was deleted), so they should return quickly.
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._db_path = db_path
+        self._lock = threading.Lock()
+        # Version last notified to each callback, keyed by key and callback
+        self._subscribers = {}
+        self._thread = None
+
+    def subscribe(self, key: str, callback: Callable[[int, bytes | None], None], version: int) -> None:
+        """Calls the callback whenever the key changes from the given version"""
+        with self._lock:
+            self._subscribers.setdefault(key, {})[callback] = version
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.__run, name="KVWatcher", daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, key: str, callback: Callable) -> None:
+        with self._lock:
+            callbacks = self._subscribers.get(key, {})
+            callbacks.pop(callback, None)
+            if not callbacks:
+                self._subscribers.pop(key, None)
+
+    def __run(self) -> None:
+        # A dedicated connection, as the data_version is specific to each connection
+        conn = sqlite3.connect(self._db_path, isolation_level=None)
+        data_version = None
+        while True:
+            try:
+                current_data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current_data_version != data_version:
+                    data_version = current_data_version
+                    self.__notify(conn)
+            except Exception:
+                logger.exception(f"Exception while checking {self._db_path} for changes")
+            time.sleep(WATCH_INTERVAL)
+
+    def __notify(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            subscribers = {key: dict(callbacks) for key, callbacks in self._subscribers.items()}
+
+        changed = {}
+        conn.execute("BEGIN")
+        try:
+            for key, callbacks in subscribers.items():
+                row = conn.execute(SELECT_VERSION_SQL, {"key": key}).fetchone()
+                version = 0 if row is None else row[0]
+                if any(seen != version for seen in callbacks.values()):
+                    row = conn.execute(SELECT_SQL, {"key": key}).fetchone()
+                    changed[key] = (version, None if row is None else row[0])
+        finally:
+            conn.execute("COMMIT")
+
+        for key, (version, bvalue) in changed.items():
+            for callback, seen in subscribers[key].items():
+                if seen == version:
+                    continue
+                with self._lock:
+                    if callback not in self._subscribers.get(key, {}):
+                        continue
+                    self._subscribers[key][callback] = version
+                try:
+                    callback(version, bvalue)
+                except Exception:
+                    logger.exception(f"Exception in callback for change of {key}")
+
+
+# The watcher for each database path, along with the ID of the process that created it (as for the connection
+# managers)
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(db_path: str) -> KVWatcher:
+    with _watchers_lock:
+        watcher, pid = _watchers.get(db_path, (None, None))
+        if watcher is None or pid != os.getpid():
+            watcher = KVWatcher(db_path)
+            _watchers[db_path] = (watcher, os.getpid())
+
+    return watcher
@@ -0,0 +1,154 @@
+import atexit
+import logging
+import os
+import threading
+import time
+
+from kvstore.connection_manager import ConnectionManager, upsert_many
+
+logger = logging.getLogger(__name__)
+
+# Pending writes are flushed to the database at least this often (in seconds), and as soon as they exceed
+# FLUSH_BYTES of encoded values
+FLUSH_INTERVAL = 5.0
+FLUSH_BYTES = 1024 * 1024
+
+
+def _live_value(value: tuple[bytes, tuple | None], now: float) -> bytes | None:
+    """Returns the encoded value of a mirrored key, or None if it has expired"""
+    bvalue, expiry = value
+    return None if expiry is not None and expiry[1] <= now else bvalue
+
+
+class WriteBehindBuffer:
+    """
+    In-process mirror of the values written to a database by this process, with the writes coalesced and flushed
+    to the database in the background: every FLUSH_INTERVAL seconds, once the pending values exceed FLUSH_BYTES,
+    and when the process exits. Other processes (e.g. the web UI, or the Rust process that reads the cache) see
+    the values once they have been flushed.
+
+    Values are held in their encoded form, so that each read returns a fresh copy, along with their expiry (if
+    any). Only keys written by this process are mirrored; all other keys are read from the database, so values
+    written by other processes remain visible unless this process has written the same key.
+    """
+
+    def __init__(self, manager: ConnectionManager) -> None:
+        self._manager = manager
+        # Held by transactions for their whole duration, so it's re-entrant
+        self._lock = threading.RLock()
+        # Serializes flushes, so that an older batch of writes never overwrites a newer one
+        self._flush_lock = threading.Lock()
+        # (encoded value, expiry) of each key, where the expiry is a (ttl, expires_at) tuple or None
+        self._values = {}
+        self._pending = {}
+        self._pending_bytes = 0
+        self._flush_requested = threading.Event()
+        threading.Thread(target=self.__run, name="KVWriteBehind", daemon=True).start()
+        atexit.register(self.flush)
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
+    @property
+    def flush_lock(self) -> threading.Lock:
+        """Held for the whole of each flush, so holding it keeps the buffer from writing to the database"""
+        return self._flush_lock
+
+    def get_many(self, keys) -> dict[str, bytes | None]:
+        """Returns the encoded values of those keys that are mirrored, or None for those that have expired"""
+        now = time.time()
+        with self._lock:
+            return {key: _live_value(self._values[key], now) for key in keys if key in self._values}
+
+    def get_prefix(self, prefix: str, pending: bool = False) -> dict[str, bytes | None]:
+        """
+        Returns the encoded values (None for those that have expired) of the mirrored keys (or, with `pending`,
+        only of those that have not yet been flushed) that start with the prefix
+        """
+        now = time.time()
+        with self._lock:
+            values = self._pending if pending else self._values
+            return {key: _live_value(value, now) for key, value in values.items() if key.startswith(prefix)}
+
+    def is_pending(self, key: str) -> bool:
+        """Whether the key has been written but not yet flushed"""
+        with self._lock:
+            return key in self._pending
+
+    def set_many(self, items: dict[str, bytes], ttl: float | None = None) -> None:
+        """Sets the encoded values of the keys, which expire after `ttl` seconds if given"""
+        expiry = None if ttl is None else (ttl, time.time() + ttl)
+        with self._lock:
+            for key, bvalue in items.items():
+                self._pending_bytes += len(bvalue) - len(self._pending.get(key, (b"", None))[0])
+                self._values[key] = self._pending[key] = (bvalue, expiry)
+            if self._pending_bytes >= FLUSH_BYTES:
+                self._flush_requested.set()
+
+    def discard(self, keys) -> None:
+        """Stops mirroring the keys, whose pending writes (if any) are dropped; they are read from the database"""
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+                if (value := self._pending.pop(key, None)) is not None:
+                    self._pending_bytes -= len(value[0])
+
+    def flush(self) -> None:
+        """Writes all pending values to the database, with a single commit"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._pending_bytes = self._pending, {}, 0
+            if not pending:
+                return
+
+            try:
+                with self._manager.writer() as conn:
+                    upsert_many(
+                        conn,
+                        {key: bvalue for key, (bvalue, _) in pending.items()},
+                        {key: expiry for key, (_, expiry) in pending.items() if expiry is not None},
+                    )
+            except Exception:
+                # Keep the values for the next flush, unless they have been overwritten in the meantime
+                with self._lock:
+                    for key, value in pending.items():
+                        if key not in self._pending:
+                            self._pending[key] = value
+                            self._pending_bytes += len(value[0])
+                raise
+            logger.trace(f"Flushed {len(pending)} key(s) to the database")
+
+    def __expire(self) -> None:
+        """Stops mirroring the keys that have expired and been flushed, which are read from the database instead"""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, value in self._values.items() if _live_value(value, now) is None]:
+                if key not in self._pending:
+                    del self._values[key]
+
+    def __run(self) -> None:
+        while True:
+            self._flush_requested.wait(FLUSH_INTERVAL)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush pending writes to the database")
+            self.__expire()
+
+
+# The write-behind buffer for each database path, along with the ID of the process that created it (as for the
+# connection managers)
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_behind_buffer(db_path: str, manager: ConnectionManager) -> WriteBehindBuffer:
+    with _buffers_lock:
+        buffer, pid = _buffers.get(db_path, (None, None))
+        if buffer is None or pid != os.getpid():
+            buffer = WriteBehindBuffer(manager)
+            _buffers[db_path] = (buffer, os.getpid())
+
+    return buffer
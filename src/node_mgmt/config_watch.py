@@ -75,13 +75,13 @@ class ConfigWatch(Thread):
                     logger.info(f"API message: {node_meta['message']}")
 
                 if "config_id" in node_meta:
-                    available_config = self._node.config
-                    logger.debug(f"Current available local config: {available_config}")
-                    if not available_config:
+                    available_config = self._node.config_snapshot
+                    logger.debug(f"Current available local config: {available_config.config}")
+                    if not available_config.config:
                         logger.debug("Local configuration is not available, but remote config is.")
                         return True
 
-                    if get_digest(available_config) == node_meta["config_id"]:
+                    if available_config.digest == node_meta["config_id"]:
                         logger.info("Latest remote configuration is in use locally")
                         return False
                     else:
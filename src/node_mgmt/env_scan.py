@@ -184,11 +184,11 @@ class NetworkEnv:
         # for potential use by other processes
         if save_to_kvc:
             try:
-                kvc = KVCache()
-                for h in hosts:
-                    if h.get("mac"):  # Skip any hosts without MAC addresses
-                        this_mac = h["mac"].lower()
-                        kvc.set(f"{keys.ENV_NET_MAC_PFX}/{this_mac}", h)
+                # Skip any hosts without MAC addresses
+                KVCache().set_many(
+                    {f"{keys.ENV_NET_MAC_PFX}/{h['mac'].lower()}": h for h in hosts if h.get("mac")},
+                    ttl=keys.ENV_NET_MAC_TTL,
+                )
             except Exception as e:
                 logger.error(f"Cannot save scan results to key-value cache: {e}")
 
@@ -1,10 +1,12 @@
 import json
 import logging
 import os
+from threading import Lock
 
 from data_mgmt.helpers.mqtt_pub import MQTTPublisher
 from edge_api import EdgeAPI
 from kvstore import KVStore, keys
+from node_mgmt.config_watch import get_digest
 from node_mgmt.events import NodeEvents
 
 logger = logging.getLogger(__name__)
@@ -12,10 +14,31 @@ logger = logging.getLogger(__name__)
 MQTT_CLIENT_ID_SUFFIX = "meta"
 
 
+class ConfigSnapshot:
+    """
+    A parsed config, along with its version in the key-value store and its digest. The config is shared by all
+    users of the snapshot, so it must not be modified; a new config is stored by setting Node.config.
+    """
+
+    __slots__ = ("config", "version", "digest")
+
+    def __init__(self, config: dict | None, version: int) -> None:
+        self.config = config
+        self.version = version
+        self.digest = get_digest(config) if config is not None else None
+
+
 class Node(object):
     def __init__(self) -> None:
         self._kvs = KVStore()
 
+        # The config is kept in memory, and only read again from the store when another process changes it. The
+        # store is watched before reading the config, so that no change is missed in-between.
+        self._config_lock = Lock()
+        self._config_snapshot = ConfigSnapshot(None, -1)
+        self._kvs.watch(keys.CONFIG, self.__update_config)
+        self.__update_config(*self._kvs.get_if_changed(keys.CONFIG, None))
+
         self.node_id = self._kvs.get(keys.NODE_ID)
         self.access_key = self._kvs.get(keys.ACCESS_KEY)
 
@@ -55,11 +78,31 @@ class Node(object):
 
     @property
     def config(self) -> dict:
-        return self._kvs.get(keys.CONFIG)
+        """The current config. It's shared, so it must not be modified (see ConfigSnapshot)."""
+        return self._config_snapshot.config
 
     @config.setter
     def config(self, value) -> None:
-        self._kvs.set(keys.CONFIG, value)
+        with self._kvs.transaction() as txn:
+            txn.set(keys.CONFIG, value)
+            version = txn.get_version(keys.CONFIG)
+        self.__update_config(version, value)
+
+    @property
+    def config_snapshot(self) -> ConfigSnapshot:
+        """The current config along with its digest, for users that need both to match"""
+        return self._config_snapshot
+
+    @property
+    def config_digest(self) -> str | None:
+        return self._config_snapshot.digest
+
+    def __update_config(self, version: int, config: dict | None) -> None:
+        # Versions only increase, so a config that is older than the snapshot (e.g. one set by this process, of
+        # which the watcher learns afterwards) is ignored
+        with self._config_lock:
+            if version > self._config_snapshot.version:
+                self._config_snapshot = ConfigSnapshot(config, version)
 
     @property
     def drivers(self) -> dict:
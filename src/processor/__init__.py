@@ -1,5 +1,18 @@
+from processor.aggregate import compile_aggregate
+from processor.field_codec import FieldCodec, compile_codec, get_array_fields
 from processor.get_output import get_output
-from processor.jsonata import evaluate_jsonata
+from processor.jsonata import evaluate_jsonata, get_jsonata_cache_info
+from processor.output_engine import OutputEngine
 from processor.process_reading import process_reading
 
-__all__ = ["process_reading", "get_output", "evaluate_jsonata"]
+__all__ = [
+    "process_reading",
+    "get_output",
+    "evaluate_jsonata",
+    "get_jsonata_cache_info",
+    "FieldCodec",
+    "compile_codec",
+    "get_array_fields",
+    "OutputEngine",
+    "compile_aggregate",
+]
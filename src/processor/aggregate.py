@@ -0,0 +1,182 @@
+"""
+Fast path for the most common shapes of output expressions, which are evaluated directly on the values of
+the readings rather than by the JSONata interpreter. The supported shapes are:
+  - a single reading:          dev_id[var = "name"].value
+  - an aggregate of readings:  $sum([dev_1[var = "name"].value, dev_2[var = "name"].value, ...])
+                               with any of $sum, $average, $max, $min, also applied to a single reading
+                               or to a reading of all devices: $sum(*[var = "name"].value)
+  - either of the above followed by an arithmetic operation (*, /, +, -) with a number
+The results are the same as those of the JSONata interpreter. Where the readings have values that the
+interpreter would treat differently from plain numbers (e.g. strings or arrays), the expression is to be
+evaluated by the interpreter instead.
+"""
+
+import logging
+import math
+import operator
+
+from processor.jsonata import tokenize_jsonata
+
+logger = logging.getLogger(__name__)
+
+# Marks readings that don't have a value
+MISSING = object()
+# Returned if the expression needs to be evaluated by the JSONata interpreter instead
+FALLBACK = object()
+# In place of the device ID of a reading, for the reading of all devices that have it (i.e. a wildcard)
+ALL_DEVICES = None
+
+
+def _convert_number(value):
+    # As done by the interpreter for the results of functions and arithmetic: numbers without fractional part
+    # are given as integers. Results that overflow are left to the interpreter.
+    if not math.isfinite(value):
+        return FALLBACK
+    if int(value) == float(value):
+        return int(value)
+    return float(value)
+
+
+def _average(values: list):
+    return sum(values) / len(values) if values else None
+
+
+AGGREGATE_FUNCTIONS = {
+    "$sum": sum,
+    "$average": _average,
+    "$max": lambda values: max(values) if values else None,
+    "$min": lambda values: min(values) if values else None,
+}
+ARITHMETIC_OPERATORS = {"*": operator.mul, "/": operator.truediv, "+": operator.add, "-": operator.sub}
+
+
+class Aggregate:
+    """Compiled form of an output expression of one of the supported shapes"""
+
+    __slots__ = ("_keys", "_function", "_array", "_operator", "_operand")
+
+    def __init__(self, keys: list[tuple], function=None, array=False, operator=None, operand=None) -> None:
+        # Readings as (dev_id, var) tuples, where dev_id may be ALL_DEVICES. Without aggregate function, there's a
+        # single reading.
+        self._keys = keys
+        self._function = function
+        # Aggregate functions are applied to an array of readings, or otherwise directly to a single reading.
+        # The difference matters if there are no values: an empty array vs. undefined.
+        self._array = array
+        self._operator = operator
+        self._operand = operand
+
+    def evaluate(self, values: dict):
+        """
+        Evaluates the expression on the values of the readings, given as a dict keyed by (dev_id, var)
+        tuples, with MISSING for readings that don't have a value. Returns FALLBACK if the values can't be
+        handled directly.
+        """
+        found = []
+        for value in self.__get_values(values):
+            if value is MISSING:
+                continue
+            if type(value) not in (int, float) or not math.isfinite(value):
+                return FALLBACK
+            found.append(value)
+
+        if not found and not self._array:
+            result = None
+        elif self._function is not None:
+            result = self._function(found)
+            if result is not None:
+                result = _convert_number(result)
+                if result is FALLBACK:
+                    return FALLBACK
+        else:
+            result = found[0]
+
+        # The interpreter carries out arithmetic on floats
+        if result is not None and self._operator is not None:
+            result = _convert_number(self._operator(float(result), float(self._operand)))
+
+        return result
+
+    def __get_values(self, values: dict):
+        for dev_id, var in self._keys:
+            if dev_id is ALL_DEVICES:
+                # In the order of the devices, as for the interpreter
+                yield from (value for (_, value_var), value in values.items() if value_var == var)
+            else:
+                yield values.get((dev_id, var), MISSING)
+
+
+def _parse_reading(tokens: list[str], i: int, wildcard: bool = False) -> tuple | None:
+    """
+    Parses dev_id[var = "name"].value at position i, returning the (dev_id, var) key and the next position.
+    With `wildcard`, the device ID may also be `*`, for which ALL_DEVICES is returned.
+    """
+    t = tokens[i : i + 8]
+    if len(t) < 8 or t[1:4] != ["[", "var", "="] or t[5:8] != ["]", ".", "value"]:
+        return None
+    name, var = t[0], t[4]
+    if var[0] not in "\"'" or "\\" in var:
+        return None
+    if wildcard and name == "*":
+        return (ALL_DEVICES, var[1:-1]), i + 8
+    if name.startswith("`"):
+        name = name[1:-1]
+    elif not name.isidentifier():
+        return None
+
+    return (name, var[1:-1]), i + 8
+
+
+def _parse_number(tokens: list[str]) -> int | float | None:
+    number = "".join(tokens)
+    if len(tokens) == 1 and number.isdigit():
+        return int(number)
+    if len(tokens) == 3 and tokens[0].isdigit() and tokens[1] == "." and tokens[2].isdigit():
+        return float(number)
+    return None
+
+
+def compile_aggregate(expr: str) -> Aggregate | None:
+    """Compiles an output expression to an Aggregate, or returns None if it's not of a supported shape"""
+    tokens = tokenize_jsonata(expr)
+
+    function = None
+    array = False
+    if tokens and tokens[0] in AGGREGATE_FUNCTIONS:
+        function = AGGREGATE_FUNCTIONS[tokens[0]]
+        array = tokens[1:3] == ["(", "["]
+        if array:
+            keys = []
+            i = 3
+            while (parsed := _parse_reading(tokens, i)) is not None:
+                key, i = parsed
+                keys.append(key)
+                if i >= len(tokens) or tokens[i] != ",":
+                    break
+                i += 1
+            if not keys or tokens[i : i + 2] != ["]", ")"]:
+                return None
+            i += 2
+        else:
+            # A wildcard gives a sequence of readings, to which the function is applied as to a single reading
+            parsed = _parse_reading(tokens, 2, wildcard=True) if tokens[1:2] == ["("] else None
+            if parsed is None or tokens[parsed[1] : parsed[1] + 1] != [")"]:
+                return None
+            keys = [parsed[0]]
+            i = parsed[1] + 1
+    else:
+        parsed = _parse_reading(tokens, 0)
+        if parsed is None:
+            return None
+        keys, i = [parsed[0]], parsed[1]
+
+    if i == len(tokens):
+        return Aggregate(keys, function, array)
+
+    if tokens[i] in ARITHMETIC_OPERATORS:
+        operand = _parse_number(tokens[i + 1 :])
+        # Division by zero is left to the interpreter
+        if operand is not None and not (tokens[i] == "/" and operand == 0):
+            return Aggregate(keys, function, array, ARITHMETIC_OPERATORS[tokens[i]], operand)
+
+    return None
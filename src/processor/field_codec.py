@@ -0,0 +1,270 @@
+"""
+Compiled counterpart of process_reading(). All of a driver field's processing parameters are resolved
+once, when the field's codec is compiled, rather than for each value that is processed. The codec's
+decode() gives the same result as process_reading() for the same field.
+
+Fields can also be array-valued, covering a block of values of the same datatype repeated at a fixed
+stride within the raw value (e.g. the individual cell voltages of a battery module). Such fields have an
+`array` parameter with the following keys:
+  - count: number of values in the block; if omitted, as many as fit in the raw value
+  - stride: distance (in bytes) between the start of subsequent values; defaults to the size of the datatype
+The position and length (or number of words) of the field cover the whole block. The positions within the
+block refer to the bytes after parsing, i.e. for 'hex' values to the bytes that the hex string represents.
+The values are decoded in one pass and returned as a list, which is emitted in readouts as one value per
+element (see get_array_fields()), since device data values are scalars.
+"""
+
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+STRUCTS = {
+    "int16": struct.Struct(">h"),
+    "uint16": struct.Struct(">H"),
+    "int32": struct.Struct(">i"),
+    "uint32": struct.Struct(">I"),
+    "int64": struct.Struct(">q"),
+    "uint64": struct.Struct(">Q"),
+    "float": struct.Struct(">f"),
+    "single": struct.Struct(">f"),
+    "double": struct.Struct(">d"),
+}
+# If datatype is not available, fall back on structs based on data length (in bytes)
+FALLBACK_STRUCTS = [
+    None,
+    struct.Struct(">B"),
+    struct.Struct(">H"),
+    None,
+    struct.Struct(">I"),
+    None,
+    None,
+    None,
+    struct.Struct(">d"),
+]
+
+TYPECASTS = {"int": int, "float": float, "str": str, "bool": bool}
+
+
+class FieldCodec:
+    """Decoder for the values of a single driver field"""
+
+    __slots__ = (
+        "_parse_as",
+        "_struct",
+        "_valuemap_b",
+        "_valuemap_s",
+        "_apply_mult_offset",
+        "_affine",
+        "_mult_offset_params",
+        "_typecast",
+        "_typecast_fn",
+        "_array",
+    )
+
+    def __init__(self, rdg: dict) -> None:
+        self._parse_as = rdg.get("parse_as")
+        self._struct = STRUCTS.get(rdg.get("datatype"))
+
+        # Value mappings for bytes values are keyed by lowercase hex strings of the form '0x123abc'. Keys
+        # that are not of this form can never match, and are left out.
+        self._valuemap_b = None
+        self._valuemap_s = None
+        if "valuemap" in rdg:
+            self._valuemap_s = rdg["valuemap"]
+            self._valuemap_b = {}
+            for key, value in rdg["valuemap"].items():
+                try:
+                    key_b = bytes.fromhex(key[2:])
+                except (TypeError, ValueError):
+                    continue
+                if key == "0x" + key_b.hex():
+                    self._valuemap_b[key_b] = value
+
+        # Multiplier and offset are not applied to string or boolean values. Otherwise they're fused into a single
+        # step (if the field has any), which applies them as process_reading() does, including when they're null.
+        self._apply_mult_offset = rdg.get("typecast") not in ["str", "bool"]
+        self._affine = compile_affine(rdg)
+        self._mult_offset_params = {k: rdg[k] for k in ("multiplier", "offset") if k in rdg}
+
+        self._typecast = rdg.get("typecast")
+        self._typecast_fn = TYPECASTS.get(self._typecast)
+        if self._typecast is not None and self._typecast_fn is None:
+            logger.warning(
+                f"Not applying invalid typecast value {self._typecast}. Must be one of 'int', 'float', 'str', 'bool'."
+            )
+
+        # For array-valued fields: (struct for each value, count, stride), or False if the definition is invalid
+        self._array = None
+        if "array" in rdg:
+            self._array = self.__compile_array(rdg)
+
+    def __compile_array(self, rdg: dict) -> tuple | bool:
+        array = rdg["array"]
+        if self._struct is None or self._parse_as == "str" or not isinstance(array, dict):
+            logger.error(
+                f"Invalid array definition for {rdg.get('var')}: requires a datatype of "
+                f"{', '.join(STRUCTS)}, and cannot be parsed as str"
+            )
+            return False
+
+        return self._struct, array.get("count"), array.get("stride", self._struct.size)
+
+    def decode(self, val_b: bytes):
+        """Process a reading obtained from a device; see process_reading() for details"""
+        if self._array is not None and isinstance(val_b, bytes):
+            return self.__decode_array(val_b)
+
+        if isinstance(val_b, bytes):
+            value = self.__parse_val_b(val_b)
+        else:
+            value = val_b
+
+        # Don't do further processing if we don't have a value
+        if value is None:
+            return None
+
+        if self._apply_mult_offset:
+            value = self.__apply_mult_offset(value)
+
+        return self.__typecast(value)
+
+    def __parse_val_b(self, val_b: bytes):
+        if self._parse_as == "str":
+            try:
+                val_s = val_b.decode("utf-8")
+            except UnicodeDecodeError:
+                logger.error(f"Could not decode {repr(val_b)} into a string")
+                return
+            if self._valuemap_s is not None and val_s in self._valuemap_s:
+                return self._valuemap_s[val_s]
+            return val_s
+
+        if self._parse_as == "hex":
+            val_b = self.__from_hex(val_b)
+            if val_b is None:
+                return
+
+        if self._valuemap_b is not None and val_b in self._valuemap_b:
+            return self._valuemap_b[val_b]
+
+        fmt_struct = self._struct or FALLBACK_STRUCTS[len(val_b)]
+        if fmt_struct is None:
+            raise struct.error(f"No datatype defined, and no fallback for values of {len(val_b)} bytes")
+
+        return fmt_struct.unpack(val_b)[0]
+
+    def __decode_array(self, val_b: bytes) -> list | None:
+        if not self._array:
+            return None
+
+        if self._parse_as == "hex":
+            val_b = self.__from_hex(val_b)
+            if val_b is None:
+                return None
+
+        item_struct, count, stride = self._array
+        size = item_struct.size
+        if count is None:
+            count = max((len(val_b) - size) // stride + 1, 0)
+        if len(val_b) < (count - 1) * stride + size:
+            raise struct.error(f"Array of {count} values with stride {stride} does not fit in {len(val_b)} bytes")
+
+        # Unpack the whole block in one pass
+        if stride == size:
+            values = [v for (v,) in item_struct.iter_unpack(val_b[: count * size])]
+        else:
+            values = [item_struct.unpack_from(val_b, i * stride)[0] for i in range(count)]
+
+        # Mapped values are taken as they are, without applying the multiplier, offset or typecast
+        mapped = {}
+        if self._valuemap_b:
+            for i in range(count):
+                item_b = val_b[i * stride : i * stride + size]
+                if item_b in self._valuemap_b:
+                    mapped[i] = self._valuemap_b[item_b]
+
+        if self._apply_mult_offset and self._affine is not None:
+            affine = self._affine
+            try:
+                values = [affine(v) for v in values]
+            except Exception:
+                logger.exception(
+                    f"Exception while applying multiplier and offset to {values}. Parameters: {self._mult_offset_params}"
+                )
+                values = [None] * count
+
+        if self._typecast_fn is not None:
+            values = [self.__typecast(v) for v in values]
+
+        for i, value in mapped.items():
+            values[i] = value
+
+        return values
+
+    @staticmethod
+    def __from_hex(val_b: bytes) -> bytes | None:
+        try:
+            val_h = val_b.decode("utf-8")
+            return bytes.fromhex(val_h)
+        except UnicodeDecodeError:
+            logger.error(f"Could not decode {repr(val_b)} into a string")
+        except ValueError:
+            logger.error(f"Could not parse {val_h} as a hex value")
+
+    def __apply_mult_offset(self, value):
+        # If the raw value is a string or bool, we need to apply a typecast before any
+        # of the below (and this typecast does need to be explicitly defined in the driver)
+        if isinstance(value, (str, bool)):
+            value = self.__typecast(value)
+
+        if self._affine is None:
+            return value
+
+        try:
+            return self._affine(value)
+        except Exception:
+            logger.exception(
+                f"Exception while applying multiplier and offset to {value}. Parameters: {self._mult_offset_params}"
+            )
+            return None
+
+    def __typecast(self, value):
+        if value is None or self._typecast_fn is None:
+            return value
+
+        try:
+            return self._typecast_fn(value)
+        except ValueError:
+            logger.error(f"Could not parse {value} as value of type {self._typecast}")
+            return
+
+
+def compile_affine(rdg: dict):
+    """
+    Returns the function that applies the field's multiplier and then its offset, i.e. multiplier * value + offset,
+    or None if it has neither. Only those of the two that the field has are applied, as they're not necessarily
+    numbers (e.g. a multiplier of a value that's mapped to a string repeats it).
+    """
+    if "multiplier" in rdg and "offset" in rdg:
+        multiplier, offset = rdg["multiplier"], rdg["offset"]
+        return lambda value: value * multiplier + offset
+    if "multiplier" in rdg:
+        multiplier = rdg["multiplier"]
+        return lambda value: value * multiplier
+    if "offset" in rdg:
+        offset = rdg["offset"]
+        return lambda value: value + offset
+    return None
+
+
+def get_array_fields(var: str, values: list) -> dict:
+    """
+    Returns the values of an array-valued field as fields of their own, named after the field and the
+    (1-based) position of the value in the array, i.e. <var>_1 to <var>_n
+    """
+    return {f"{var}_{i}": value for i, value in enumerate(values, 1)}
+
+
+def compile_codec(rdg: dict) -> FieldCodec:
+    return FieldCodec(rdg)
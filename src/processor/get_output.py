@@ -1,12 +1,12 @@
 import logging
-from copy import deepcopy
 from typing import Dict, List
 
-from processor.jsonata import evaluate_jsonata
-from processor.process_reading import typecast
+from processor.output_engine import OutputEngine
 
 logger = logging.getLogger(__name__)
 
+_engine = OutputEngine()
+
 
 def get_output(dev_rdg: Dict, output_config: List) -> List:
     """
@@ -23,15 +23,8 @@ def get_output(dev_rdg: Dict, output_config: List) -> List:
     output_config: list of outputs. Each item in the list should be a dict containing
       'source' and 'field' keys with string values. The 'source' value should be a JSONata
       expression that's applied to dev_rdg. The output is saved under the 'value' key in
-      the same list.
+      the same list. Expressions are evaluated against the 'var' and 'value' of the readings only,
+      and outputs whose input readings did not change since the previous call are not re-evaluated.
     """
 
-    output = deepcopy(output_config)
-
-    for oc in output:
-        evaluated_value = evaluate_jsonata(dev_rdg, oc["source"])
-        if evaluated_value is None:
-            continue
-        oc["value"] = typecast(evaluated_value, **oc)
-
-    return output
+    return _engine.evaluate(dev_rdg, output_config)
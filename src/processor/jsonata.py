@@ -1,16 +1,47 @@
 import logging
+import re
+from functools import lru_cache
 
 from jsonata import JException, Jsonata
 
 logger = logging.getLogger(__name__)
 
 JSON_UNDEFINED = "undefined"
+# Maximum number of compiled expressions to keep; sites can have a hundred or so calculated outputs
+JSONATA_CACHE_SIZE = 512
+# Tokens of a JSONata expression: string literals, backtick-quoted names, variables, names and operators
+TOKEN_RE = re.compile(r"\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|`[^`]*`|\$\$|\$\w*|\w+|\*\*|\S")
+
+
+@lru_cache(maxsize=JSONATA_CACHE_SIZE)
+def compile_jsonata(expr: str) -> Jsonata:
+    """Parses a JSONata expression. Compiled expressions are cached, keyed by the expression string."""
+    compiled = Jsonata(expr)
+    # The input is made up of readings obtained from devices, which are JSON types anyway. Validating the
+    # whole of it on every evaluation takes considerably longer than evaluating most expressions.
+    compiled.set_validate_input(False)
+    return compiled
+
+
+def clear_jsonata_cache() -> None:
+    compile_jsonata.cache_clear()
+
+
+def get_jsonata_cache_info() -> dict:
+    info = compile_jsonata.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+
+def tokenize_jsonata(expr: str) -> list[str]:
+    """Splits a JSONata expression into tokens, for analysing the expression without evaluating it"""
+    return TOKEN_RE.findall(expr)
 
 
 def evaluate_jsonata(data, expr):
     try:
-        expr = Jsonata(expr)
-        res = expr.evaluate(data)
+        compiled = compile_jsonata(expr)
+        # Evaluating in a new frame ensures that compiled expressions, which are shared, retain no state
+        res = compiled.evaluate(data, compiled.create_frame())
     except JException as e:
         logger.error(f"Error while processing JSONata: {e}\nInput data: {data}\nExpression: {expr}")
         return None
@@ -0,0 +1,157 @@
+"""
+Incremental evaluation of calculated outputs. When the output config is loaded, the readings that each
+output's JSONata expression depends on are determined from the expression itself:
+  - `dev_id[var = "name"]` depends on the reading `name` of device `dev_id` only
+  - any other reference to `dev_id` depends on all readings of the device
+  - expressions that refer to the input as a whole (`$`, `$$`, wildcards) depend on all readings
+  - expressions that call nondeterministic functions (e.g. `$now()`), or that don't refer to any device,
+    are evaluated on every cycle
+Upon each cycle, the expressions are evaluated against a projection of the readings that only contains
+their `var` and `value`, rather than against all of the driver's parameters for each reading. Outputs
+whose dependencies have the same values as in the previous cycle are not evaluated again; their previous
+value is returned instead. Expressions of the shapes supported by the aggregation fast path (see
+processor.aggregate) are evaluated directly on the values of the readings.
+"""
+
+import logging
+
+from processor.aggregate import FALLBACK, MISSING, compile_aggregate
+from processor.jsonata import clear_jsonata_cache, evaluate_jsonata, get_jsonata_cache_info, tokenize_jsonata
+from processor.process_reading import typecast
+
+logger = logging.getLogger(__name__)
+
+# Tokens after which a '*' is a wildcard rather than a multiplication
+WILDCARD_PRECEDERS = {None, ".", "(", "[", "{", ",", ";", ":", "?"}
+
+# Dependency on all readings of a device
+ALL_VARS = None
+
+# JSONata functions whose result changes from one evaluation to the next, even for the same input
+NONDETERMINISTIC_FUNCTIONS = {"$millis", "$now", "$random"}
+
+
+def get_dependencies(expr: str, dev_ids) -> frozenset | None:
+    """
+    Returns the readings that a JSONata expression depends on, as a set of (dev_id, var) tuples where var is
+    ALL_VARS if the expression depends on all readings of the device. Returns None if the dependencies can't
+    be determined, or if the expression's value can change without any of its dependencies changing (as for
+    nondeterministic functions, or expressions that don't refer to any device), in which case the expression
+    should be evaluated on every cycle.
+    """
+    tokens = tokenize_jsonata(expr)
+    deps = set()
+    prev = None
+    for i, token in enumerate(tokens):
+        if token in ("$", "$$", "**") or (token == "*" and prev in WILDCARD_PRECEDERS):
+            return None
+        if token in NONDETERMINISTIC_FUNCTIONS:
+            return None
+
+        name = token[1:-1] if token.startswith("`") else token
+        if name in dev_ids and prev != ".":
+            # Readings are usually selected by a filter of the form dev_id[var = "name"]
+            var_filter = tokens[i + 1 : i + 6]
+            if (
+                len(var_filter) == 5
+                and var_filter[:3] == ["[", "var", "="]
+                and var_filter[3][0] in "\"'"
+                and var_filter[4] == "]"
+            ):
+                deps.add((name, var_filter[3][1:-1]))
+            else:
+                deps.add((name, ALL_VARS))
+        prev = token
+
+    return frozenset(deps) if deps else None
+
+
+class OutputEngine:
+    """Evaluates calculated outputs, only re-evaluating those whose input readings have changed"""
+
+    def __init__(self) -> None:
+        self._output_config = None
+        self._dev_ids = None
+        self._deps = []
+        self._aggregates = []
+        # Values of the readings and of the outputs in the previous cycle
+        self._values = {}
+        self._outputs = []
+
+    def __load(self, dev_rdg: dict, output_config: list) -> None:
+        if self._output_config is None or [oc.get("source") for oc in output_config] != [
+            oc.get("source") for oc in self._output_config
+        ]:
+            # Drop the previously compiled expressions when the output sources change
+            clear_jsonata_cache()
+
+        self._output_config = [dict(oc) for oc in output_config]
+        self._dev_ids = set(dev_rdg)
+        self._deps = [get_dependencies(oc["source"], self._dev_ids) for oc in output_config]
+        self._aggregates = [compile_aggregate(oc["source"]) for oc in output_config]
+        self._values = {}
+        self._outputs = [None] * len(output_config)
+
+        dynamic = sum(deps is None for deps in self._deps)
+        native = sum(aggregate is not None for aggregate in self._aggregates)
+        logger.info(
+            f"Loaded {len(output_config)} outputs, of which {dynamic} are evaluated on every cycle "
+            f"and {native} are evaluated without the JSONata interpreter"
+        )
+
+    def evaluate(self, dev_rdg: dict, output_config: list) -> list:
+        if output_config != self._output_config or dev_rdg.keys() != self._dev_ids:
+            self.__load(dev_rdg, output_config)
+
+        values = {(dev_id, rdg["var"]): rdg.get("value", MISSING) for dev_id, rdgs in dev_rdg.items() for rdg in rdgs}
+        changed = {
+            key
+            for key in values.keys() | self._values.keys()
+            if not self.__same_value(values.get(key, MISSING), self._values.get(key, MISSING))
+        }
+        changed |= {(dev_id, ALL_VARS) for dev_id, _ in changed}
+        self._values = values
+        # The fast path looks up readings by (dev_id, var), which needs these to be unique
+        use_aggregates = len(values) == sum(map(len, dev_rdg.values()))
+
+        projection = None
+        evaluated = 0
+        for i, oc in enumerate(self._output_config):
+            deps = self._deps[i]
+            if self._outputs[i] is not None and deps is not None and deps.isdisjoint(changed):
+                continue
+
+            evaluated += 1
+            aggregate = self._aggregates[i] if use_aggregates else None
+            if aggregate is not None and (evaluated_value := aggregate.evaluate(values)) is not FALLBACK:
+                self._outputs[i] = self.__get_output(oc, evaluated_value)
+                continue
+
+            if projection is None:
+                projection = {
+                    dev_id: [
+                        {"var": rdg["var"], "value": rdg["value"]} if "value" in rdg else {"var": rdg["var"]}
+                        for rdg in rdgs
+                    ]
+                    for dev_id, rdgs in dev_rdg.items()
+                }
+
+            self._outputs[i] = self.__get_output(oc, evaluate_jsonata(projection, oc["source"]))
+
+        logger.debug(
+            f"Evaluated {evaluated} of {len(self._outputs)} outputs. JSONata expression cache: {get_jsonata_cache_info()}"
+        )
+
+        return [dict(output) for output in self._outputs]
+
+    @staticmethod
+    def __get_output(oc: dict, evaluated_value) -> dict:
+        output = dict(oc)
+        if evaluated_value is not None:
+            output["value"] = typecast(evaluated_value, **oc)
+        return output
+
+    @staticmethod
+    def __same_value(a, b) -> bool:
+        # Values of different types may compare equal (e.g. 1 and 1.0), but could give different outputs
+        return type(a) is type(b) and a == b
@@ -1,6 +1,8 @@
 import logging
 import struct
 
+from processor.field_codec import FieldCodec
+
 logger = logging.getLogger(__name__)
 
 
@@ -27,8 +29,13 @@ def process_reading(val_b: bytes, **rdg):
       - multiplier: applies a multiplier to reading
       - offset: applies an offset to reading (after application of multiplier),
         i.e. output = multiplier * reading + offset
+      - array: for array-valued fields; see processor.field_codec
     """
 
+    # Array-valued fields are decoded in one pass by the field codec
+    if "array" in rdg:
+        return FieldCodec(rdg).decode(val_b)
+
     if isinstance(val_b, bytes):
         value = parse_val_b(val_b, **rdg)
     else:
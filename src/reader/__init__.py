@@ -1,3 +1,3 @@
-from reader.get_readings import get_readings, get_readout
+from reader.get_readings import complete_readout, get_readings, get_readout, read_devices
 
-__all__ = ["get_readings", "get_readout"]
+__all__ = ["get_readings", "get_readout", "read_devices", "complete_readout"]
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# Reading types that have an asynchronous reader, and can therefore be read on the event loop
+ASYNC_READING_TYPES = ("rawtcp", "sma_speedwire", "mqtt")
+
+DEFAULT_MAX_CONCURRENCY = 32
+
+
+class AsyncReadingEngine:
+    """
+    Single event loop, running in a background thread, on which the readers of network-based devices
+    are run as coroutines. This avoids tying up an OS thread for each device while waiting on socket I/O.
+
+    As with the bus workers, jobs that have not started by their deadline (e.g. as they are queued behind a
+    device that hangs) are skipped rather than carried out late.
+    """
+
+    def __init__(self) -> None:
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._skipped = 0
+        self._skipped_lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                logger.info("Starting event loop for asynchronous readers")
+                self._loop = asyncio.new_event_loop()
+                # Make sure this thread exits directly when the program exits; no clean-up should be required
+                self._thread = threading.Thread(target=self._loop.run_forever, name="AsyncReaders", daemon=True)
+                self._thread.start()
+
+        return self._loop
+
+    def submit(
+        self,
+        jobs: list[tuple[str, str, Callable[[], Awaitable], float | None]],
+        max_concurrency: int | None = None,
+        deadline: float | None = None,
+        on_skip: Callable[[str], None] | None = None,
+    ) -> Future:
+        """
+        Schedule reading jobs on the event loop. Each job is a tuple of (worker_id, dev_id, job, timeout), where
+        `job` is a coroutine function. Jobs with the same worker ID (i.e. on the same host) are run one after the
+        other, and at most `max_concurrency` jobs are run at the same time. Each job is cancelled if it has not
+        completed within its timeout or, if it has none, by the deadline (in time.monotonic() terms). Jobs that
+        have not started by the deadline are skipped, and on_skip() is called with their device ID instead.
+        """
+        return asyncio.run_coroutine_threadsafe(
+            self._run(jobs, max_concurrency or DEFAULT_MAX_CONCURRENCY, deadline, on_skip), self._get_loop()
+        )
+
+    def pop_skipped(self) -> int:
+        """Returns the number of jobs skipped since the previous call"""
+        with self._skipped_lock:
+            skipped, self._skipped = self._skipped, 0
+        return skipped
+
+    async def _run(self, jobs: list, max_concurrency: int, deadline: float | None, on_skip: Callable | None) -> None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        job_groups = {}
+        for job in jobs:
+            job_groups.setdefault(job[0], []).append(job)
+
+        await asyncio.gather(
+            *(self._run_group(job_group, semaphore, deadline, on_skip) for job_group in job_groups.values())
+        )
+
+    async def _run_group(
+        self, jobs: list, semaphore: asyncio.Semaphore, deadline: float | None, on_skip: Callable | None
+    ) -> None:
+        for _, dev_id, job, timeout in jobs:
+            async with semaphore:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Skipping reading device {dev_id}, as it was not started before its deadline")
+                    with self._skipped_lock:
+                        self._skipped += 1
+                    if on_skip is not None:
+                        on_skip(dev_id)
+                    continue
+
+                if timeout is None:
+                    timeout = remaining
+                try:
+                    await asyncio.wait_for(job(), timeout)
+                except TimeoutError:
+                    logger.warning(f"Reading device {dev_id} did not complete within {timeout:.1f} seconds")
+                except Exception:
+                    logger.exception(f"Exception while running job for device {dev_id}")
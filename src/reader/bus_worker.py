@@ -0,0 +1,141 @@
+import logging
+import queue
+import threading
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+SERIAL_READING_TYPES = ("modbusrtu", "serial", "rawserial")
+
+# The Modbus RTU specification requires a silent interval of 3.5 character times between frames.
+# Above 19200 baud a fixed interval of 1.75 ms is recommended instead.
+INTER_FRAME_CHARS = 3.5
+FIXED_GAP_MIN_BAUDRATE = 19200
+FIXED_INTER_FRAME_GAP = 0.00175
+
+
+def get_inter_frame_gap(reading_type: str, address: dict | None) -> float:
+    """Silent interval (in seconds) to leave on a bus between reading two devices"""
+    if reading_type not in SERIAL_READING_TYPES or not isinstance(address, dict):
+        return 0.0
+
+    baudrate = address.get("baudrate", 9600)
+    if baudrate > FIXED_GAP_MIN_BAUDRATE:
+        return FIXED_INTER_FRAME_GAP
+
+    # Each character consists of a start bit, the data bits, an optional parity bit and the stop bit(s)
+    parity_bits = 0 if address.get("parity", "none") == "none" else 1
+    bits_per_char = 1 + address.get("bytesize", 8) + parity_bits + address.get("stopbits", 1)
+    return INTER_FRAME_CHARS * bits_per_char / baudrate
+
+
+class BusWorker(threading.Thread):
+    """
+    Long-lived thread that carries out the reading jobs for all devices on a single physical bus
+    (serial port or network host), one after the other. Connections are kept open in-between jobs and
+    reading cycles by the serial port manager and TCP connection pool.
+
+    Jobs that are still queued at their deadline (e.g. behind a device that hangs) are skipped rather than
+    carried out late, so that they don't pile up on a slow bus.
+    """
+
+    def __init__(self, bus_id: str) -> None:
+        threading.Thread.__init__(self)
+        self.name = f"Bus-{bus_id}"
+        # Make sure this thread exits directly when the program exits; no clean-up should be required
+        self.daemon = True
+
+        self.bus_id = bus_id
+        self._jobs = queue.Queue()
+        self._last_job_end = 0.0
+        self._skipped = 0
+        self._skipped_lock = threading.Lock()
+
+    def submit(
+        self,
+        job: Callable,
+        inter_frame_gap: float = 0.0,
+        deadline: float | None = None,
+        on_skip: Callable | None = None,
+    ) -> None:
+        """
+        Queues a job. If it has not started by the deadline (in time.monotonic() terms), it's skipped, and on_skip()
+        is called instead.
+        """
+        self._jobs.put((job, inter_frame_gap, deadline, on_skip))
+
+    def pop_skipped(self) -> int:
+        """Returns the number of jobs skipped since the previous call"""
+        with self._skipped_lock:
+            skipped, self._skipped = self._skipped, 0
+        return skipped
+
+    def stop(self) -> None:
+        self._jobs.put(None)
+
+    def run(self) -> None:
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+
+            job, inter_frame_gap, deadline, on_skip = item
+            if deadline is not None and time.monotonic() > deadline:
+                logger.warning(f"Skipping job on bus {self.bus_id}, as it was not started before its deadline")
+                with self._skipped_lock:
+                    self._skipped += 1
+                if on_skip is not None:
+                    on_skip()
+                continue
+
+            # Leave the bus silent for long enough before addressing the next device
+            wait = self._last_job_end + inter_frame_gap - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            try:
+                job()
+            except Exception:
+                logger.exception(f"Exception while running job on bus {self.bus_id}")
+
+            self._last_job_end = time.monotonic()
+
+        logger.info(f"Stopped worker for bus {self.bus_id}")
+
+
+class BusWorkerPool:
+    """The set of bus workers, each of which is started on first use and then kept running"""
+
+    def __init__(self) -> None:
+        self._workers = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        bus_id: str,
+        job: Callable,
+        inter_frame_gap: float = 0.0,
+        deadline: float | None = None,
+        on_skip: Callable | None = None,
+    ) -> None:
+        with self._lock:
+            worker = self._workers.get(bus_id)
+            if worker is None or not worker.is_alive():
+                logger.info(f"Starting worker for bus {bus_id}")
+                worker = self._workers[bus_id] = BusWorker(bus_id)
+                worker.start()
+
+        worker.submit(job, inter_frame_gap, deadline, on_skip)
+
+    def pop_skipped(self) -> int:
+        """Returns the number of jobs skipped by all workers since the previous call"""
+        with self._lock:
+            workers = list(self._workers.values())
+        return sum(worker.pop_skipped() for worker in workers)
+
+    def retain(self, active_buses: set) -> None:
+        """Stop the workers for any buses that are no longer in use"""
+        with self._lock:
+            for bus_id in [b for b in self._workers if b not in active_buses]:
+                self._workers.pop(bus_id).stop()
@@ -1,130 +1,228 @@
+import asyncio
 import logging
+import math
 import os
 import queue
 import threading
 import time
-from copy import deepcopy
 from datetime import UTC, datetime
+from functools import partial
 from time import sleep
 
 from constants import CONFIG_CALC_VENDOR_ID, DEVICE_ID_KEY, OUTPUT_READINGS_DEV_ID, VENDOR_ID_KEY
 from kvstore import KVCache, keys
-from processor import get_output, process_reading
-
-from .helpers import add_to_device_readings, check_host_vs_mac, set_host_from_mac
+from processor import get_array_fields, get_output, process_reading
+
+from .async_engine import ASYNC_READING_TYPES, AsyncReadingEngine
+from .bus_worker import SERIAL_READING_TYPES, BusWorkerPool
+from .helpers import (
+    DEFAULT_IDLE_TTL,
+    add_to_device_readings,
+    check_host_vs_mac,
+    set_host_from_mac,
+    tcp_connection_pool,
+)
+from .mqtt_reader import update_subscriptions
+from .read_plan import ReadPlan, get_read_plan, get_reader_config
+from .serial_port_manager import serial_ports
 
 logger = logging.getLogger(__name__)
 
-DEVICE_DEFAULT_TIMEOUT = 5
 DEVICE_READ_MAXTIMEOUT = 600
+# Unless set explicitly in the config (as 'read_deadline'), devices need to return their readings within this
+# fraction of the read interval to be included in the cycle's readout. Readings that come in later (but within
+# DEVICE_READ_MAXTIMEOUT) are published as a follow-up readout, with the timestamp of the same cycle. Devices
+# whose reading has not even started by then (e.g. as their bus is held up by another device) are skipped.
+READ_DEADLINE_FRACTION = 0.8
+# Readings that were not taken in a cycle are used for the outputs for up to this many of their reading intervals
+# (i.e. until they are overdue, allowing for some lag in taking them again)
+LATEST_READING_MAX_INTERVALS = 1.5
+
+bus_workers = BusWorkerPool()
+async_engine = AsyncReadingEngine()
 
 
 def save_readings_to_cache(readout: dict):
-    """Save readings to cache with merge logic for concurrent Python/Rust readers."""
-    readings = readout["r"]
+    """
+    Saves the readings of each device to the cache, in a row of its own (shared with the Rust readers) along with
+    the reading timestamp, so that only the rows of the devices in the readout are written. Readings from an
+    earlier cycle (e.g. late readings) don't replace more recent readings of the same device, and readings of a
+    device for the same timestamp are merged.
+    """
     timestamp = readout["t"]
+    readings = {rdg[DEVICE_ID_KEY]: rdg for rdg in readout["r"] if rdg.get(DEVICE_ID_KEY)}
+    row_keys = {dev_id: f"{keys.LAST_READING_FOR_DEV_PFX}/{dev_id}" for dev_id in readings}
+
+    # The rows are read and written in a single database transaction, which neither late readings (cached from a
+    # separate thread) nor the Rust readers can interleave with. As the keys are shared with the Rust readers, they
+    # bypass the write-behind buffer, so that a later flush can't overwrite newer rows.
+    with KVCache().transaction(write_behind=False) as kvc:
+        cached = kvc.get_many([keys.LAST_READINGS_TS, *row_keys.values()])
+
+        items = {}
+        for dev_id, key in row_keys.items():
+            cached_row = cached[key]
+            if cached_row is None or cached_row["t"] < timestamp:
+                items[key] = {"t": timestamp, "r": readings[dev_id]}
+            elif cached_row["t"] == timestamp:
+                items[key] = {"t": timestamp, "r": {**cached_row["r"], **readings[dev_id]}}
+            else:
+                logger.debug(f"Not caching readings of {dev_id} for {timestamp}, as those for {cached_row['t']} are")
+                continue
+            items[f"{keys.LAST_READING_TS_FOR_DEV_PFX}/{dev_id}"] = timestamp
 
-    with KVCache() as kvc:
-        # Get existing cached data
-        cached_timestamp: int | None = kvc.get(keys.LAST_READINGS_TS)
-        cached_readings: list[dict] = kvc.get(keys.LAST_READINGS) or []
-
-        # Extract device IDs from readings for per-device timestamp tracking
-        device_ids = {r.get(DEVICE_ID_KEY) for r in readings if r.get(DEVICE_ID_KEY)}
-
-        # Merge logic based on timestamp
-        if cached_timestamp == timestamp:
-            # Same timestamp: combine the readings arrays
-            logger.debug(
-                f"Merging {len(readings)} new readings with {len(cached_readings)} "
-                f"cached readings for timestamp {timestamp}"
-            )
-            final_readings = cached_readings + readings
-        else:
-            # Different timestamp: replace with new readings
-            logger.debug(
-                f"Replacing cached readings (ts: {cached_timestamp}) with {len(readings)} "
-                f"new readings for timestamp {timestamp}"
-            )
-            final_readings = readings
-
-        # Save to cache
-        kvc.set(keys.LAST_READINGS, final_readings)
-        kvc.set(keys.LAST_READINGS_TS, timestamp)
-
-        # Save per-device timestamps
-        for dev_id in device_ids:
-            kvc.set(f"{keys.LAST_READING_TS_FOR_DEV_PFX}/{dev_id}", timestamp)
+        # The rows of devices that are no longer read expire
+        kvc.set_many(items, ttl=keys.LAST_READING_FOR_DEV_TTL)
+        if cached[keys.LAST_READINGS_TS] is None or cached[keys.LAST_READINGS_TS] < timestamp:
+            kvc.set(keys.LAST_READINGS_TS, timestamp)
 
 
 def get_readings(config: dict, drivers: dict):
     # Work out all the readings that need to be taken, refactored by device
-    dev_rdg = {}
-
-    for rdg in config["readings"]:
-        # Ignore readings that are explicitly disabled
-        # (if 'enabled' key is missing altogether, assume enabled by default)
-        if not config["readings"][rdg].get("enabled", True):
-            continue
-
-        # Get device and variable name for reading; if not available then move on
+    return get_read_plan(config, drivers).get_dev_rdg()
+
+
+def get_cycle_deadline(config: dict) -> float:
+    """Time (in seconds) after the start of the cycle, after which the readout is published without waiting for
+    the devices that have not yet returned their readings"""
+    if "read_deadline" in config:
+        return min(config["read_deadline"], DEVICE_READ_MAXTIMEOUT)
+    if config.get("read_interval"):
+        return min(config["read_interval"] * READ_DEADLINE_FRACTION, DEVICE_READ_MAXTIMEOUT)
+    return DEVICE_READ_MAXTIMEOUT
+
+
+def collect_late_readings(
+    readout_q: queue.Queue,
+    remaining: int,
+    reading_timestamp: int,
+    meta: dict,
+    on_late_readout,
+    deadline: float,
+    plan: ReadPlan | None = None,
+    late_rdg: dict | None = None,
+):
+    """
+    Waits for the readings of the remaining devices, which did not return these before the cycle deadline, and
+    passes them on to on_late_readout() as follow-up readouts with the same timestamp as the cycle's readout.
+    Readings that come in together are passed on together. Devices that were skipped (given by their ID on the
+    queue) are left out. Once a device has returned its readings, these are also available to the outputs of later
+    cycles, if the read plan and the device's readings (`late_rdg`) are given.
+    """
+    while remaining:
         try:
-            dev_id = config["readings"][rdg]["device"]
-            var = config["readings"][rdg]["var"]
-        except KeyError:
-            continue
-
-        # Ignore devices that are explicitly disabled in the devices configuration
-        # (if 'enabled' key is missing altogether, assume enabled by default)
-        if dev_id in config["devices"]:
-            dev = config["devices"][dev_id]
-        else:
-            logger.error("Reading from device %s requested, but device not defined. Skipping" % dev_id)
-            continue
-
-        if not dev.get("enabled", True):
-            continue
-
-        # Get the driver name
-        drv_id = dev["driver"]
-        if drv_id not in drivers:
-            logger.error(f"Reading using driver {drv_id} requested, but driver not found. Skipping device {dev_id}")
+            fields = [readout_q.get(timeout=max(deadline - time.monotonic(), 0))]
+        except queue.Empty:
+            logger.warning(f"Not all late devices returned readings for timestamp {reading_timestamp}")
+            break
+        while len(fields) < remaining:
+            try:
+                fields.append(readout_q.get_nowait())
+            except queue.Empty:
+                break
+        remaining -= len(fields)
+        fields = [f for f in fields if isinstance(f, dict)]
+        if not fields:
             continue
 
-        # Save all necessary reading parameters in dev_rdg
-        # dev_rdg is a dict of lists of dicts ;) :
-        # 1st level: dict with the device name as the key (so we can query each device separately)
-        # 2nd level: list of individual readings that need to be taken from device
-        # 3rd level: for each reading, a dict determining how the reading should be taken
-        if dev_id not in dev_rdg:
-            dev_rdg[dev_id] = []
-
-        # Start by setting reading name
-        rdict = {"reading": rdg, "var": var}
-        # If applicable, add common reading parameters from driver file (e.g. function code)
-        rdict.update(drivers[drv_id].get("common", {}))
+        if plan is not None and late_rdg:
+            update_latest_readings(
+                plan,
+                {f[DEVICE_ID_KEY]: late_rdg[f[DEVICE_ID_KEY]] for f in fields if f[DEVICE_ID_KEY] in late_rdg},
+                reading_timestamp,
+            )
 
+        late_readout = {"t": reading_timestamp, "r": fields, "m": {**meta, "late": True}}
+        logger.info(f"Publishing late readings for timestamp {reading_timestamp}: {[f[DEVICE_ID_KEY] for f in fields]}")
         try:
-            rdict.update(drivers[drv_id]["fields"][var])
-        except KeyError:
-            logger.warning(f"Variable {var} not found in driver {drv_id}, or driver definition malformed.")
-
-        if rdict.get("deprecated"):
-            logger.warning(f"Use of deprecated variable {var} from driver {drv_id}")
-
-        dev_rdg[dev_id].append(rdict)
-
-    return dev_rdg
-
-
-def get_readout(config: dict, drivers: dict):
+            save_readings_to_cache(late_readout)
+            on_late_readout(late_readout)
+        except Exception:
+            logger.exception("Exception while publishing late readings")
+
+
+def update_latest_readings(plan: ReadPlan, dev_rdg: dict, timestamp: int) -> None:
+    """
+    Records the readings taken at the given timestamp as the plan's latest readings, except for those of which a
+    later reading has already been recorded (as can be the case for the readings of late devices)
+    """
+    latest = plan.latest_readings
+    for dev_id, readings in dev_rdg.items():
+        for rdg in readings:
+            key = (dev_id, rdg["var"])
+            if key not in latest or latest[key][1] <= timestamp:
+                latest[key] = (rdg, timestamp)
+
+
+def get_output_readings(plan: ReadPlan, dev_rdg: dict, timestamp: int) -> dict:
+    """
+    Readings from which the outputs are calculated: the most recent reading of each of the variables in the read
+    plan, whether or not it was taken in this cycle (with the given timestamp). Readings from earlier cycles are
+    only used until they are overdue (see LATEST_READING_MAX_INTERVALS); after that, they have no value.
+    """
+    update_latest_readings(plan, dev_rdg, timestamp)
+    latest = plan.latest_readings
+
+    output_readings = {}
+    for dev_id, dev_plan in plan.devices.items():
+        output_readings[dev_id] = []
+        for rdg in dev_plan.readings:
+            latest_rdg, taken_at = latest.get((dev_id, rdg["var"]), (rdg, timestamp))
+            max_age = (dev_plan.intervals[rdg["var"]] or 0) * LATEST_READING_MAX_INTERVALS
+            output_readings[dev_id].append(latest_rdg if timestamp - taken_at <= max_age else rdg)
+
+    return output_readings
+
+
+def get_readout(
+    config: dict,
+    drivers: dict,
+    on_late_readout=None,
+    due: dict[str, set] | None = None,
+    slot_time: float | None = None,
+):
+    """
+    Reads the devices in the config and returns the readout. If `due` is given (as a set of variable names for
+    each device ID), only those readings are taken; otherwise all readings are.
+
+    Devices that don't return their readings before the cycle deadline are left out of the readout; if
+    on_late_readout is given, it's called with follow-up readouts containing their readings once these are
+    available.
+    """
+    readout, plan, dev_rdg = read_devices(config, drivers, on_late_readout, due, slot_time=slot_time)
+    return complete_readout(readout, config, plan, dev_rdg)
+
+
+def read_devices(
+    config: dict,
+    drivers: dict,
+    on_late_readout=None,
+    due: dict[str, set] | None = None,
+    config_digest: str | None = None,
+    slot_time: float | None = None,
+) -> tuple[dict, ReadPlan, dict]:
+    """
+    First stage of get_readout(): reads the devices, and returns the readout with the device readings, along with
+    the read plan and readings taken, which complete_readout() needs to complete it. The readings of devices that
+    were skipped, or that are late, are left out of the latter. The config's digest should be given if known, as
+    it's what tells whether the read plan is current.
+
+    With the multi-rate scheduler, `slot_time` is the time at which the due readings were scheduled, with which the
+    readout is stamped. As readings due at nearly the same time are taken together, they can be taken slightly
+    before that time. Readings taken after it (e.g. because the previous cycle overran) are stamped with the time
+    at which they're taken instead.
+    """
     # 'readout' is a dict formatted for device-based readings. It also contains a timestamp, and snap_rev
     try:
         snap_rev = int(os.getenv("SNAP_REVISION", 0))
     except ValueError:  # Occurs if it's a devel snap with revision prefixed in 'x'
         snap_rev = 0
 
-    reading_timestamp = int(datetime.now(UTC).timestamp())
+    start_timestamp = datetime.now(UTC).timestamp()
+    reading_timestamp = int(start_timestamp)
+    if slot_time is not None:
+        reading_timestamp = max(reading_timestamp, math.ceil(slot_time))
+    cycle_start = time.monotonic()
 
     readout = {
         "t": reading_timestamp,
@@ -134,18 +232,29 @@ def get_readout(config: dict, drivers: dict):
         },
     }
 
-    dev_rdg = get_readings(config, drivers)
-    # Set up queue in which to save readouts from the multiple threads that are reading each device
+    plan = get_read_plan(config, drivers, config_digest)
+    # With the multi-rate scheduler, only the readings that are due are taken
+    dev_rdg = plan.get_dev_rdg(due)
+    # Set up queue in which to save readouts from the bus workers that are reading each device.
+    # A new queue is used for each cycle, so results that come in late cannot end up in a later cycle.
     readout_q = queue.Queue()
-    jobs = []
 
-    # Skip any devices for which min_read_interval has not yet elapsed
-    with KVCache() as kvc:
+    # Skip any devices for which min_read_interval has not yet elapsed. The multi-rate scheduler takes the
+    # minimum reading interval into account already.
+    min_interval_devices_to_skip = []
+    if due is None:
+        min_read_intervals = {
+            dev_id: min_read_interval
+            for dev_id in dev_rdg.keys()
+            if (min_read_interval := plan.devices[dev_id].dev.get("min_read_interval"))
+        }
+        last_reading_ts = (
+            KVCache().get_prefix_dict(f"{keys.LAST_READING_TS_FOR_DEV_PFX}/") if min_read_intervals else {}
+        )
         min_interval_devices_to_skip = [
             dev_id
-            for dev_id in dev_rdg.keys()
-            if (min_read_interval := config["devices"][dev_id].get("min_read_interval"))
-            and reading_timestamp - kvc.get(f"{keys.LAST_READING_TS_FOR_DEV_PFX}/{dev_id}", 0) < min_read_interval
+            for dev_id, min_read_interval in min_read_intervals.items()
+            if reading_timestamp - last_reading_ts.get(dev_id, 0) < min_read_interval
         ]
 
     if min_interval_devices_to_skip:
@@ -155,7 +264,7 @@ def get_readout(config: dict, drivers: dict):
 
     # Skip ModbusTCP devices
     modbus_tcp_devices_to_skip = [
-        dev_id for dev_id in dev_rdg.keys() if config["devices"][dev_id]["reading_type"] == "modbustcp"
+        dev_id for dev_id in dev_rdg.keys() if plan.devices[dev_id].dev["reading_type"] == "modbustcp"
     ]
     if modbus_tcp_devices_to_skip:
         logger.info(f"Skipping ModbusTCP devices: {modbus_tcp_devices_to_skip}")
@@ -165,70 +274,137 @@ def get_readout(config: dict, drivers: dict):
     # Sometimes multiple "devices" will actually share the same serial port, or host IP.
     # It is best to make sure that multiple threads do not try to open concurrent
     # connections to a single port or host; in the case of a serial port at least, this
-    # is bound to fail. Therefore we can create a lock for each physical port or host,
-    # and ensure that the reading thread respects this lock and waits for any others
-    # that are reading from the device to finish before proceeding.
-
-    # First we need to establish the actual set of physical devices, and create a
-    # lock object for each.
-    locks = {}
-
-    for dev_id, dev in config["devices"].items():
-        if "address" in dev:
-            # Get the device or host name if available
-            d = dev["address"].get("device") or dev["address"].get("host") or dev["address"].get("mac")
-
-            # Create a lock for this device or host name if it doesn't already exist
-            if d and d not in locks:
-                locks[d] = threading.Lock()
+    # is bound to fail. Therefore each physical port or host has a long-lived worker, which
+    # reads the devices on it one after the other.
+    # The physical port or host of each device is already established in the read plan.
+    # (Resolving the host from the MAC is no longer necessary as we're skipping ModbusTCP devices here,
+    # i.e. set_host_from_mac(dev["address"]) is not called)
+    # If enabled, network-based devices are instead read as coroutines on a single event loop.
+    use_async = config.get("async_readers", False)
+    active_buses = {
+        dev_plan.worker_id
+        for dev_plan in plan.devices.values()
+        if not (use_async and dev_plan.dev["reading_type"] in ASYNC_READING_TYPES)
+    }
+    bus_workers.retain(active_buses)
+
+    # Close any serial ports that are no longer used by any device
+    serial_ports.close_unused(
+        {dev_plan.bus_id for dev_plan in plan.devices.values() if dev_plan.dev["reading_type"] in SERIAL_READING_TYPES}
+    )
+
+    # Have the MQTT subscribers receive the topics for all MQTT devices in the background, so that the payloads
+    # are available by the time the devices are read
+    update_subscriptions(
+        [
+            (dev_plan.reader_config, dev_plan.readings)
+            for dev_plan in plan.devices.values()
+            if dev_plan.dev["reading_type"] == "mqtt" and dev_plan.reader_config is not None
+        ]
+    )
 
-            # This is no longer necessary as we're skipping ModbusTCP devices here
-            # set_host_from_mac(dev["address"])
+    # Close any pooled TCP connections that have not been used for a while (e.g. for removed devices)
+    tcp_connection_pool.idle_ttl = config.get("tcp_idle_ttl", DEFAULT_IDLE_TTL)
+    tcp_connection_pool.evict_idle()
 
-    # Set up threads for reading each of the devices
+    # Queue the reading job for each of the devices. Jobs that have not started by the cycle deadline are skipped,
+    # which is signalled by their device's ID (rather than its fields) on the readout queue.
+    deadline = cycle_start + get_cycle_deadline(config)
+    async_jobs = []
     for dev_id in dev_rdg:
-        dev = config["devices"][dev_id]
-        dev.update({"id": dev_id})
+        dev_plan = plan.devices[dev_id]
+        if use_async and dev_plan.dev["reading_type"] in ASYNC_READING_TYPES:
+            job = partial(
+                read_device_async, dev_plan.dev, dev_rdg[dev_id], readout_q, dev_plan.reader_config, dev_plan.codecs
+            )
+            # Unless the device has a timeout of its own, it's given until the cycle deadline
+            async_jobs.append((dev_plan.worker_id, dev_id, job, dev_plan.dev.get("read_timeout")))
+        else:
+            job = partial(
+                read_device, dev_plan.dev, dev_rdg[dev_id], readout_q, dev_plan.reader_config, dev_plan.codecs
+            )
+            bus_workers.submit(
+                dev_plan.worker_id, job, dev_plan.inter_frame_gap, deadline, partial(readout_q.put, dev_id)
+            )
 
-        try:
-            d = dev["address"].get("device") or dev["address"].get("host") or dev["address"].get("mac")
-            dev_lock = locks[d]
-        except KeyError:
-            dev_lock = None
+    if async_jobs:
+        async_engine.submit(async_jobs, config.get("async_max_concurrency"), deadline, readout_q.put)
 
-        dev_thread = threading.Thread(
-            target=read_device, name="Readout-" + dev_id, args=(dev, dev_rdg[dev_id], readout_q, dev_lock), daemon=True
-        )
+    # Wait until all of the reading jobs have completed or the cycle deadline has passed, and append the results
+    # for each device to the readout structure
+    received = 0
+    skipped_devices = set()
+    for _ in dev_rdg:
+        try:
+            fields = readout_q.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            break
+        received += 1
+        if isinstance(fields, dict):
+            readout["r"].append(fields)
+        else:
+            skipped_devices.add(fields)
+
+    # The readings of skipped devices were not taken, so the outputs keep using their previous values
+    for dev_id in skipped_devices:
+        del dev_rdg[dev_id]
+
+    if received < len(dev_rdg) + len(skipped_devices):
+        finished = {fields[DEVICE_ID_KEY] for fields in readout["r"]}
+        late_devices = [dev_id for dev_id in dev_rdg if dev_id not in finished]
+        logger.warning(f"Devices did not return readings before the cycle deadline: {late_devices}")
+        readout["m"]["late_devices"] = late_devices
+        # The readings of late devices are still being taken, so they're left out of the outputs of this cycle (with
+        # their previous values being used instead) until the devices return them
+        late_rdg = {dev_id: dev_rdg.pop(dev_id) for dev_id in late_devices}
+        if on_late_readout is not None:
+            threading.Thread(
+                target=collect_late_readings,
+                args=(
+                    readout_q,
+                    len(late_devices),
+                    reading_timestamp,
+                    {"snap_rev": snap_rev},
+                    on_late_readout,
+                    cycle_start + DEVICE_READ_MAXTIMEOUT,
+                    plan,
+                    late_rdg,
+                ),
+                name=f"LateReadings-{reading_timestamp}",
+                daemon=True,
+            ).start()
 
-        jobs.append(dev_thread)
+    logger.debug(f"Populated readings for all devices: {dev_rdg}")
 
-    # Start each of the device reading jobs
-    for j in jobs:
-        j.start()
+    # Report on the reading jobs skipped since the previous cycle, as their bus (or, for the asynchronous readers,
+    # their host or the concurrency limit) held them up until their deadline
+    if skipped_jobs := bus_workers.pop_skipped() + async_engine.pop_skipped():
+        readout["m"]["skipped_jobs"] = skipped_jobs
+    # Report on reuse of TCP connections during this cycle
+    if tcp_pool_stats := tcp_connection_pool.pop_stats():
+        readout["m"]["tcp_pool"] = tcp_pool_stats
+    # Report on the latency of, and contention for, the cache database since the previous cycle, and on its size
+    # and upkeep
+    kvc = KVCache()
+    readout["m"]["kv_cache"] = {**kvc.connection_manager.pop_stats(), **kvc.maintenance.pop_stats()}
 
-    # Wait until all of the reading jobs have completed
-    for j in jobs:
-        j.join(timeout=DEVICE_READ_MAXTIMEOUT)
+    # time that took to read all devices.
+    readout["m"]["reading_duration"] = datetime.now(UTC).timestamp() - start_timestamp
 
-    # Get the results for each device and append them to the readout structure
-    for j in jobs:
-        try:
-            fields = readout_q.get(block=False)
-            readout["r"].append(fields)
-        except queue.Empty:
-            logger.warning("Not all devices returned readings")
+    return readout, plan, dev_rdg
 
-    logger.debug(f"Populated readings for all devices: {dev_rdg}")
 
+def complete_readout(readout: dict, config: dict, plan: ReadPlan, dev_rdg: dict) -> dict:
+    """
+    Second stage of get_readout(): caches the readings and adds the calculated outputs to the readout. This can run
+    concurrently with read_devices() for the next cycle, but not with complete_readout() for another cycle.
+    """
     # Save readings to cache
     save_readings_to_cache(readout)
 
-    # time that took to read all devices.
-    readout["m"]["reading_duration"] = datetime.now(UTC).timestamp() - reading_timestamp
-
     if "output" in config:
         # Get additional processed values
-        output = get_output(dev_rdg, config["output"])
+        output = get_output(get_output_readings(plan, dev_rdg, readout["t"]), config["output"])
         logger.debug(f"Calculated outputs: {output}")
         for output_field in output:
             if output_field.get("value") is None:
@@ -254,96 +430,82 @@ def get_readout(config: dict, drivers: dict):
     return readout
 
 
-def read_device(dev, readings, readout_q, dev_lock=None):
-    # If the device has a concurrency lock associated with it, make sure it's available
-    if dev_lock:
-        dev_lock.acquire()
-        # If we've just finished reading another device on this port, let it breathe
-        time.sleep(0.5)
-
-    fields = {
-        DEVICE_ID_KEY: dev["id"],
-    }
-    if "vendor_id" in dev:
-        fields[VENDOR_ID_KEY] = dev["vendor_id"]
-
-    logger.info("READ: Start reading %s" % dev["id"])
-
-    logger.debug("Reading device %s" % dev)
-
+def get_reader_class(reading_type: str):
     # The reading type for each of the devices can be one of the following:
     # modbustcp - ModbusTCP
     # modbusrtu or serial - RS-485 / ModbusRTU
     # rawserial - Raw serial request
 
-    if dev["reading_type"] == "modbustcp":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    if reading_type == "modbustcp":
         from reader.modbustcp_reader import Reader
 
-    elif dev["reading_type"] == "modbusrtu" or dev["reading_type"] == "serial":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    elif reading_type == "modbusrtu" or reading_type == "serial":
         from reader.modbusrtu_reader import Reader
 
-    elif dev["reading_type"] == "rawserial":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    elif reading_type == "rawserial":
         from reader.rawserial_reader import Reader
 
-    elif dev["reading_type"] == "rawtcp":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    elif reading_type == "rawtcp":
         from reader.rawtcp_reader import Reader
 
-    elif dev["reading_type"] == "mqtt":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    elif reading_type == "mqtt":
         from reader.mqtt_reader import Reader
 
-    elif dev["reading_type"] == "sma_speedwire":
-        reader_config = deepcopy(dev["address"])
-        reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    elif reading_type == "sma_speedwire":
         from reader.sma_speedwire_reader import Reader
 
-    elif dev["reading_type"] == "sys":
-        reader_config = {}
+    elif reading_type == "sys":
         from reader.sys_reader import Reader
 
-    logger.debug(f"Setting up reader of type {dev['reading_type']} with config {reader_config}")
+    else:
+        raise ValueError(f"Unknown reading type {reading_type}")
+
+    return Reader
 
-    try:
-        with Reader(**reader_config) as reader:
-            if not reader:
-                raise Exception(f"No reader object could be created for device {dev['id']}. Skipping")
 
-            if "address" in dev and not check_host_vs_mac(dev["address"]):
-                raise Exception(f"MAC mismatch for {dev['id']}. Not reading device.")
+def get_async_reader_class(reading_type: str):
+    if reading_type == "rawtcp":
+        from reader.rawtcp_reader import AsyncReader
 
-            for rdg in readings:
-                if "read_delay" in dev and isinstance(dev["read_delay"], (float, int)):
-                    sleep(dev["read_delay"])
+    elif reading_type == "mqtt":
+        from reader.mqtt_reader import AsyncReader
 
-                try:
-                    val_b = reader.read(**rdg)
-                    if val_b is None:
-                        logger.warning("READ: [%s] Returned None for reading %s" % (dev["id"], rdg["reading"]))
-                        continue
+    elif reading_type == "sma_speedwire":
+        from reader.sma_speedwire_reader import AsyncReader
 
-                except Exception:
-                    logger.exception("READ: [%s] Could not obtain reading %s. Exception" % (dev["id"], rdg["reading"]))
-                    continue
+    else:
+        raise ValueError(f"No asynchronous reader for reading type {reading_type}")
 
-                # Get processed value
-                value = process_reading(val_b, **rdg)
+    return AsyncReader
 
-                # Append to key-value store
-                fields[rdg["var"]] = value
 
-                # Also save within readings structure
-                rdg["value"] = value
+def init_device_fields(dev):
+    fields = {
+        DEVICE_ID_KEY: dev["id"],
+    }
+    if "vendor_id" in dev:
+        fields[VENDOR_ID_KEY] = dev["vendor_id"]
+    return fields
+
 
-                logger.debug("READ: [%s] %s = %s %s" % (dev["id"], rdg["var"], repr(val_b), rdg.get("unit", "")))
+def read_device(dev, readings, readout_q, reader_config=None, codecs=None):
+    fields = init_device_fields(dev)
+
+    logger.info("READ: Start reading %s" % dev["id"])
+
+    logger.debug("Reading device %s" % dev)
+
+    try:
+        # The reader config is normally precomputed as part of the read plan
+        if reader_config is None:
+            reader_config = get_reader_config(dev)
+
+        logger.debug(f"Setting up reader of type {dev['reading_type']} with config {reader_config}")
+
+        with get_reader_class(dev["reading_type"])(**reader_config) as reader:
+            if not reader:
+                raise Exception(f"No reader object could be created for device {dev['id']}. Skipping")
+            read_fields(dev, reader, readings, fields, codecs)
 
     except Exception:
         logger.exception("Exception while reading device %s" % dev["id"])
@@ -352,7 +514,92 @@ def read_device(dev, readings, readout_q, dev_lock=None):
     # Append result to readings (alongside those from other devices)
     readout_q.put(fields)
 
-    # If the device has a concurrency lock associated with it, release it
-    # so that other threads can proceed with reading
-    if dev_lock:
-        dev_lock.release()
+
+async def read_device_async(dev, readings, readout_q, reader_config=None, codecs=None):
+    fields = init_device_fields(dev)
+
+    logger.info("READ: Start reading %s" % dev["id"])
+
+    try:
+        if reader_config is None:
+            reader_config = get_reader_config(dev)
+
+        logger.debug(f"Setting up asynchronous reader of type {dev['reading_type']} with config {reader_config}")
+
+        async with get_async_reader_class(dev["reading_type"])(**reader_config) as reader:
+            if not reader:
+                raise Exception(f"No reader object could be created for device {dev['id']}. Skipping")
+            await read_fields_async(dev, reader, readings, fields, codecs)
+
+    except Exception:
+        logger.exception("Exception while reading device %s" % dev["id"])
+
+    finally:
+        # Any readings obtained so far are returned even if the job is cancelled upon timing out
+        logger.info(f"READ: Finished reading {dev['id']}")
+        readout_q.put(fields)
+
+
+def read_fields(dev, reader, readings, fields, codecs=None):
+    if "address" in dev and not check_host_vs_mac(dev["address"]):
+        raise Exception(f"MAC mismatch for {dev['id']}. Not reading device.")
+
+    # If enabled for the device, read registers in blocks rather than field-by-field. The device
+    # setting can either be `true` or a dict with `max_words` and/or `max_gap` block parameters
+    if dev.get("block_read") and hasattr(reader, "prefetch_blocks"):
+        block_read_params = dev["block_read"] if isinstance(dev["block_read"], dict) else {}
+        reader.prefetch_blocks(readings, **block_read_params)
+
+    for rdg in readings:
+        if "read_delay" in dev and isinstance(dev["read_delay"], (float, int)):
+            sleep(dev["read_delay"])
+
+        try:
+            val_b = reader.read(**rdg)
+            if val_b is None:
+                logger.warning("READ: [%s] Returned None for reading %s" % (dev["id"], rdg["reading"]))
+                continue
+
+        except Exception:
+            logger.exception("READ: [%s] Could not obtain reading %s. Exception" % (dev["id"], rdg["reading"]))
+            continue
+
+        save_field_value(dev, rdg, val_b, fields, codecs)
+
+
+async def read_fields_async(dev, reader, readings, fields, codecs=None):
+    if "address" in dev and not check_host_vs_mac(dev["address"]):
+        raise Exception(f"MAC mismatch for {dev['id']}. Not reading device.")
+
+    for rdg in readings:
+        if "read_delay" in dev and isinstance(dev["read_delay"], (float, int)):
+            await asyncio.sleep(dev["read_delay"])
+
+        try:
+            val_b = await reader.read(**rdg)
+            if val_b is None:
+                logger.warning("READ: [%s] Returned None for reading %s" % (dev["id"], rdg["reading"]))
+                continue
+
+        except Exception:
+            logger.exception("READ: [%s] Could not obtain reading %s. Exception" % (dev["id"], rdg["reading"]))
+            continue
+
+        save_field_value(dev, rdg, val_b, fields, codecs)
+
+
+def save_field_value(dev, rdg, val_b, fields, codecs=None):
+    # Get processed value, using the field's compiled codec from the read plan if available
+    codec = codecs.get(rdg["var"]) if codecs else None
+    value = codec.decode(val_b) if codec else process_reading(val_b, **rdg)
+
+    # Append to key-value store. Array-valued fields are emitted as a field for each of their values.
+    if "array" in rdg and isinstance(value, list):
+        fields.update(get_array_fields(rdg["var"], value))
+    else:
+        fields[rdg["var"]] = value
+
+    # Also save within readings structure
+    rdg["value"] = value
+
+    logger.debug("READ: [%s] %s = %s %s" % (dev["id"], rdg["var"], repr(val_b), rdg.get("unit", "")))
@@ -2,6 +2,7 @@ from .add_to_device_readings import add_to_device_readings
 from .network_host_finder import check_host_vs_mac, set_host_from_mac
 from .request_response_parser import generate_request, parse_response
 from .sma_speedwire_parser import parse_datagram
+from .tcp_connection_pool import DEFAULT_IDLE_TTL, tcp_connection_pool
 
 __all__ = [
     "generate_request",
@@ -10,4 +11,6 @@ __all__ = [
     "check_host_vs_mac",
     "parse_datagram",
     "add_to_device_readings",
+    "tcp_connection_pool",
+    "DEFAULT_IDLE_TTL",
 ]
@@ -6,8 +6,6 @@ from kvstore import KVCache, keys
 
 logger = logging.getLogger(__name__)
 
-kvc = KVCache()
-
 scan_in_progress = Lock()
 # Time to pause after a scan, before the next scan can be triggered
 WAIT_AFTER_SCAN = 900
@@ -118,7 +116,7 @@ def set_host_from_mac(address: dict) -> None:
         # If not available in ARP cache, look in key-value store
         if not ip:
             logger.info(f"MAC {mac} not found in ARP cache; looking in k-v store")
-            ip = kvc.get(f"{keys.ENV_NET_MAC_PFX}/{mac}", {}).get("ipv4")
+            ip = (KVCache().get(f"{keys.ENV_NET_MAC_PFX}/{mac}") or {}).get("ipv4")
             logger.debug(f"KVS cache: Obtained IP {ip} from MAC {mac}")
 
             if not ip:
@@ -0,0 +1,111 @@
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TTL = 300
+
+
+class TcpConnectionPool:
+    """
+    Keeps TCP connections open in-between reading cycles, keyed by (host, port). Connections are checked
+    for liveness before being handed out, and are closed once they have been idle for longer than `idle_ttl`.
+    The pool does not itself establish connections; callers connect when no pooled connection is available.
+    """
+
+    def __init__(self, idle_ttl: float = DEFAULT_IDLE_TTL) -> None:
+        self.idle_ttl = idle_ttl
+        # Each key maps to a list of (connection, time last released) tuples
+        self._idle = {}
+        # Keys for which a connection has been established before, used to tell reconnects apart
+        self._known_keys = set()
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self) -> None:
+        self._stats = {"hits": 0, "misses": 0, "reconnects": 0}
+
+    def get(self, host: str, port: int) -> socket.socket | None:
+        """Returns a live pooled connection to the host and port, or None if a new one needs to be established"""
+        key = (host, port)
+        now = time.monotonic()
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    self._stats["misses"] += 1
+                    if key in self._known_keys:
+                        self._stats["reconnects"] += 1
+                    self._known_keys.add(key)
+                    return None
+                conn, released = idle.pop()
+
+            if now - released > self.idle_ttl:
+                logger.debug(f"Pooled connection to {host}:{port} expired")
+                self._close(conn)
+            elif not self._is_alive(conn):
+                logger.info(f"Pooled connection to {host}:{port} was closed by the peer")
+                self._close(conn)
+            else:
+                with self._lock:
+                    self._stats["hits"] += 1
+                return conn
+
+    def put(self, host: str, port: int, conn: socket.socket) -> None:
+        """Returns a connection to the pool, once it is no longer in use"""
+        with self._lock:
+            self._idle.setdefault((host, port), []).append((conn, time.monotonic()))
+
+    def evict_idle(self) -> None:
+        """Closes any connections that have been idle for longer than the TTL"""
+        expired = []
+        now = time.monotonic()
+
+        with self._lock:
+            for key, idle in self._idle.items():
+                expired.extend(conn for conn, released in idle if now - released > self.idle_ttl)
+                idle[:] = [(conn, released) for conn, released in idle if now - released <= self.idle_ttl]
+            self._idle = {key: idle for key, idle in self._idle.items() if idle}
+
+        for conn in expired:
+            self._close(conn)
+
+    def pop_stats(self) -> dict:
+        """Returns the pool statistics collected since the previous call, or an empty dict if it was not used"""
+        with self._lock:
+            stats = self._stats
+            self._reset_stats()
+
+        requests = stats["hits"] + stats["misses"]
+        if not requests:
+            return {}
+
+        stats["hit_ratio"] = stats["hits"] / requests
+        stats["reconnect_rate"] = stats["reconnects"] / requests
+        return stats
+
+    @staticmethod
+    def _is_alive(conn: socket.socket) -> bool:
+        # A socket that has been closed by the peer is readable, with no data. Any unread data would
+        # end up being taken as the response to the next request, so such sockets are not reused either.
+        try:
+            conn.setblocking(False)
+            conn.recv(1, socket.MSG_PEEK)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        return False
+
+    @staticmethod
+    def _close(conn: socket.socket) -> None:
+        try:
+            conn.close()
+        except Exception:
+            logger.warning("Could not close TCP connection", exc_info=True)
+
+
+tcp_connection_pool = TcpConnectionPool()
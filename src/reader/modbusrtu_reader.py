@@ -4,8 +4,81 @@ import struct
 import minimalmodbus
 import serial
 
+from .serial_port_manager import serial_ports
+
 logger = logging.getLogger(__name__)
 
+# Limits for coalescing the registers of several fields into a single block read. The Modbus
+# specification allows up to 125 registers to be read in one request, but some devices have lower limits.
+DEFAULT_MAX_BLOCK_WORDS = 64
+MODBUS_MAX_BLOCK_WORDS = 125
+# Maximum number of unused registers between two fields for them to still be read in the same block
+DEFAULT_MAX_GAP_WORDS = 4
+# Function codes for which registers can be read in blocks
+BLOCK_READ_FNCODES = (3, 4)
+
+
+def get_register_address(register) -> int:
+    # If register is a string, assume that it's hex and convert to integer
+    # (having a "0x" prefix is acceptable but optional)
+    if isinstance(register, str):
+        return int(register, 16)
+    return register
+
+
+def is_port_error(e: Exception) -> bool:
+    """
+    Whether the exception is an error of the serial port itself, rather than one reported by (or in the
+    response of) the slave, which minimalmodbus raises as OSErrors too
+    """
+    return isinstance(e, (serial.SerialException, OSError)) and not isinstance(e, minimalmodbus.ModbusException)
+
+
+def plan_blocks(
+    readings: list[dict], max_words: int = DEFAULT_MAX_BLOCK_WORDS, max_gap: int = DEFAULT_MAX_GAP_WORDS
+) -> list[tuple[int, int, int]]:
+    """
+    Groups the registers of a device's readings into contiguous blocks that can each be read with a
+    single request. Readings are grouped by function code, and neighbouring fields are merged into a
+    block as long as the gap between them is at most `max_gap` registers and the block does not
+    exceed `max_words` registers.
+    Returns a list of (fncode, start register, number of registers) tuples. Only blocks covering more
+    than one field are returned, since any other field is just as well read by itself.
+    """
+    max_words = min(max_words, MODBUS_MAX_BLOCK_WORDS)
+
+    spans = {}
+    for rdg in readings:
+        fncode = rdg.get("fncode")
+        words = rdg.get("words")
+        if fncode not in BLOCK_READ_FNCODES or not isinstance(words, int) or words > max_words:
+            continue
+        try:
+            start = get_register_address(rdg["register"])
+        except (KeyError, ValueError):
+            continue
+        spans.setdefault(fncode, set()).add((start, start + words))
+
+    blocks = []
+    for fncode, fncode_spans in spans.items():
+        sorted_spans = sorted(fncode_spans)
+        block_start, block_end = sorted_spans[0]
+        num_fields = 1
+        for start, end in sorted_spans[1:]:
+            if start - block_end <= max_gap and max(end, block_end) - block_start <= max_words:
+                block_end = max(end, block_end)
+                num_fields += 1
+                continue
+
+            if num_fields > 1:
+                blocks.append((fncode, block_start, block_end - block_start))
+            block_start, block_end, num_fields = start, end, 1
+
+        if num_fields > 1:
+            blocks.append((fncode, block_start, block_end - block_start))
+
+    return blocks
+
 
 class Reader(object):
     def __init__(
@@ -22,39 +95,22 @@ class Reader(object):
         paritysel = {"none": serial.PARITY_NONE, "odd": serial.PARITY_ODD, "even": serial.PARITY_EVEN}
         self._parity = paritysel[parity]
 
-    def __enter__(self):
-        # Create a Serial connection to be used for all our requests
-        try:
-            self._conn = minimalmodbus.Instrument(port=self._device, slaveaddress=self._slaveaddr)
-        except Exception:
-            logger.error("Exception while attempting to create serial connection:")
-            raise
-
-        try:
-            self._conn.serial.debug = self._debug
-            self._conn.serial.timeout = self._timeout
-
-            # Set up serial connection parameters according to device driver
-            self._conn.serial.baudrate = self._baudrate
-            self._conn.serial.bytesize = self._bytesize
-            self._conn.serial.parity = self._parity
-            self._conn.serial.stopbits = self._stopbits
-        except Exception:
-            logger.error("Exception while attempting to configure serial connection:")
-            raise
+        # Register values obtained through block reads, as (fncode, start register, values) tuples
+        self._stored_blocks = []
 
-        try:
-            # Make sure we have an open connection to device
-            if not self._conn.serial.is_open:
-                self._conn.serial.open()
-                if self._conn.serial.is_open:
-                    logger.debug("Opened serial connection to %s:%s" % (self._device, self._slaveaddr))
-                else:
-                    logger.error("Unable to open serial connection to %s:%s" % (self._device, self._slaveaddr))
-                    return None
-        except Exception:
-            logger.error("Exception while attempting to open serial connection:")
-            raise
+    def __enter__(self):
+        # The port is opened once and shared by all devices on the bus; it stays open after this reader exits
+        self._conn = serial_ports.acquire(
+            self._device,
+            baudrate=self._baudrate,
+            bytesize=self._bytesize,
+            parity=self._parity,
+            stopbits=self._stopbits,
+            timeout=self._timeout,
+        )
+        self._conn.serial.debug = self._debug
+        self._conn.address = self._slaveaddr
+        self._port_error = False
 
         return self
 
@@ -62,22 +118,82 @@ class Reader(object):
         if not hasattr(self, "_conn"):
             return
 
+        serial_ports.release(self._device, error=type is not None or self._port_error)
+
+    def prefetch_blocks(self, readings: list[dict], max_words: int | None = None, max_gap: int | None = None) -> None:
+        """
+        Reads the registers for the given readings in as few requests as possible, and stores the
+        values so that subsequent calls to read() can be served without further requests.
+        If a block cannot be read (e.g. because the gap between two fields contains registers
+        that the device regards as illegal addresses) the fields in it are read one by one instead.
+        """
+        blocks = plan_blocks(
+            readings,
+            max_words=max_words or DEFAULT_MAX_BLOCK_WORDS,
+            max_gap=DEFAULT_MAX_GAP_WORDS if max_gap is None else max_gap,
+        )
+
+        self._stored_blocks = []
+        for fncode, start, words in blocks:
+            try:
+                values = self._conn.read_registers(start, words, fncode)
+            except minimalmodbus.IllegalRequestError:
+                logger.info(
+                    f"Block read of {words} registers from {start} on {self._device}: slave {self._slaveaddr} "
+                    "refused; falling back to reading fields individually"
+                )
+                continue
+            except Exception as e:
+                # The fields would fail to be read individually too; the port is reopened on next use
+                if is_port_error(e):
+                    logger.error(f"Serial port error during block read of {self._device}: slave {self._slaveaddr}")
+                    self._port_error = True
+                    raise
+                logger.warning(
+                    f"Exception during block read of {words} registers from {start} on {self._device}: "
+                    f"slave {self._slaveaddr}; falling back to reading fields individually",
+                    exc_info=True,
+                )
+                continue
+
+            self._stored_blocks.append((fncode, start, values))
+
+        logger.debug(f"Read {len(self._stored_blocks)} of {len(blocks)} register blocks from slave {self._slaveaddr}")
+
+    def __get_stored_registers(self, register, words, fncode) -> list[int] | None:
         try:
-            self._conn.serial.close()
-        except Exception:
-            logger.warning("Could not close serial connection", exc_info=True)
+            register = get_register_address(register)
+        except ValueError:
+            return None
+
+        for block_fncode, start, values in self._stored_blocks:
+            if block_fncode == fncode and start <= register and register + words <= start + len(values):
+                return values[register - start : register - start + words]
+
+        return None
 
     def read(self, register, words, fncode, **kwargs):
-        try:
-            val_i = self._conn.read_registers(register, words, fncode)
-        except minimalmodbus.NoResponseError:
-            logger.error(
-                f"No response when trying to read {self._device}: slave {self._slaveaddr}: register {register}"
-            )
-            raise
-        except Exception:
-            logger.error(f"Exception while reading {self._device}: slave {self._slaveaddr}: register {register}")
-            raise
+        # Use the values from a block read if available
+        val_i = self.__get_stored_registers(register, words, fncode)
+        if val_i is None:
+            try:
+                val_i = self._conn.read_registers(register, words, fncode)
+            except minimalmodbus.NoResponseError:
+                logger.error(
+                    f"No response when trying to read {self._device}: slave {self._slaveaddr}: register {register}"
+                )
+                raise
+            except minimalmodbus.ModbusException:
+                # Errors reported by (or in the response of) the slave, which are OSErrors too but leave the port fine
+                logger.error(f"Exception while reading {self._device}: slave {self._slaveaddr}: register {register}")
+                raise
+            except (serial.SerialException, OSError):
+                logger.error(f"Serial port error while reading {self._device}: slave {self._slaveaddr}")
+                self._port_error = True
+                raise
+            except Exception:
+                logger.error(f"Exception while reading {self._device}: slave {self._slaveaddr}: register {register}")
+                raise
 
         try:
             # The minimalmodbus library helpfully converts the binary result to a list of integers, so
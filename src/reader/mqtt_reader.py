@@ -1,71 +1,228 @@
 import logging
-from time import sleep
+import threading
+import time
 
 import paho.mqtt.client as mqtt
 
+from node_mgmt.config_watch import get_digest
+
 logger = logging.getLogger(__name__)
 
 CLIENT_ID = "ammp-edge"
 DEFAULT_QOS = 1
+# Unless a maximum age is set for the device (or reading), payloads are disregarded once they are older than this
+# many of the device's reading intervals, or than DEFAULT_MAX_AGE seconds if its interval isn't known. This way the
+# last payload of a publisher that has gone silent is not published over and over again.
+MAX_AGE_INTERVALS = 3
+DEFAULT_MAX_AGE = 900
 
 # A note on the reading logic; the approach implemented here does the following:
-# 1. Upon initialization, it waits for `timeout` seconds for any payloads to come in
-#    on subscribed topics. I.e. it collects data.
-# 2. Upon carrying out a read(), it subscribes to the topic for that read, checks whether
-#    data for a desired topic is available, and if so it returns it
+# 1. A single long-lived subscriber is kept for each broker. It maintains one session, subscribed to
+#    all the topics required by the current config, and keeps the latest payload received on each
+#    topic along with the time at which it was received. Devices that set different client parameters
+#    for the same broker get a session (and client ID) of their own.
+# 2. Upon carrying out a read(), the latest payload for the topic is looked up, without blocking.
+#    Payloads that were received longer ago than the maximum age (see above) are disregarded.
 #
-# This means that during the very first reading cycle, no data is likely to be returned. But
-# since the broker should remember this client ID and its subscriptions, any QoS 1 and QoS 2
-# messages that are received in-between reading cycles should subsequently be buffered,
-# and delivered upon the following reading cycle.
+# This means that directly after the config introduces a new topic, no data may be available for it
+# yet. But since the broker remembers this client ID and its subscriptions, any QoS 1 and QoS 2
+# messages published while the subscriber is disconnected are delivered upon reconnection.
 
+# Address parameters that are used by the reader itself, rather than passed on to the MQTT client
+READER_PARAMS = ("host", "port", "timeout", "max_age", "read_interval", "subscribe")
 
-class Reader(object):
-    def __init__(self, host: str = "localhost", port: int = 1883, timeout: int = 3, **kwargs):
+
+def get_client_id(client_kwargs: dict) -> str:
+    """Client ID for a session with the client parameters, which are in the ID unless there are none"""
+    return f"{CLIENT_ID}-{get_digest(client_kwargs)}" if client_kwargs else CLIENT_ID
+
+
+class MQTTSubscriber:
+    """Long-lived MQTT session with a broker, keeping the latest payload received on each subscribed topic"""
+
+    def __init__(self, host: str, port: int, client_id: str = CLIENT_ID, **kwargs) -> None:
         self._host = host
         self._port = port
-        # Note that the timeout is the time to wait for data, not for establishing a connection
-        # A timeout for connection is not supported by the Paho MQTT library
-        self._timeout = timeout
 
         self._client = mqtt.Client(
-            callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id=CLIENT_ID, clean_session=False, **kwargs
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION1, client_id=client_id, clean_session=False, **kwargs
         )
-
         self._client.enable_logger(logger=logger)
+        self._client.on_connect = self.__on_connect
+        self._client.on_message = self.__on_message
 
-        # We store payloads from all topics in a dict. We need this since it's possible that
-        # a payload comes in for a topic that's different to the one we're currently looking
-        # to read, but we need to retain it so it can be returned as the result of another reading
-        self._current_payloads = {}
+        # Topic filters (which may contain wildcards) that are currently subscribed to
+        self._topics = set()
+        # Latest (payload, receive timestamp) for each topic that a message has been received on
+        self._payloads = {}
+        self._lock = threading.Lock()
 
-    def __enter__(self):
+        # The client's network loop takes care of reconnecting if the connection is lost
+        self._client.connect_async(self._host, port=self._port)
+        self._client.loop_start()
+        logger.info(f"Started MQTT subscriber for {self._host}:{self._port} as {client_id}")
+
+    def stop(self) -> None:
         try:
-            self._client.connect(self._host, port=self._port)
+            self._client.disconnect()
+            self._client.loop_stop()
         except Exception:
-            logger.error("Exception while attempting to connect to MQTT broker:")
-            raise
+            logger.warning("Could not disconnect from MQTT broker", exc_info=True)
+
+    def set_topics(self, topics: set) -> None:
+        """Subscribes to any new topics, and unsubscribes from those that are no longer required"""
+        with self._lock:
+            new_topics = topics - self._topics
+            old_topics = self._topics - topics
+            self._topics = set(topics)
+
+        if new_topics:
+            self.__subscribe(new_topics)
+        if old_topics:
+            self._client.unsubscribe(list(old_topics))
+
+    def add_topic(self, topic: str) -> None:
+        with self._lock:
+            if topic in self._topics:
+                return
+            self._topics.add(topic)
+
+        self.__subscribe({topic})
+
+    def get_payload(self, topic: str, max_age: float | None = None) -> bytes | None:
+        """
+        Returns the latest payload received on the topic, if any. The topic may contain wildcards, in which case
+        the latest payload received on any matching topic is returned.
+        """
+        with self._lock:
+            if "+" in topic or "#" in topic:
+                matches = [v for t, v in self._payloads.items() if mqtt.topic_matches_sub(topic, t)]
+                latest = max(matches, key=lambda v: v[1], default=None)
+            else:
+                latest = self._payloads.get(topic)
+
+        if latest is None:
+            return None
+
+        payload, received = latest
+        if max_age is not None and time.time() - received > max_age:
+            logger.warning(f"Latest payload on topic '{topic}' was received {time.time() - received:.0f} s ago")
+            return None
+
+        return payload
+
+    def __subscribe(self, topics: set) -> None:
+        if not self._client.is_connected():
+            # Subscriptions are made upon connecting
+            return
+
+        res, _ = self._client.subscribe([(topic, DEFAULT_QOS) for topic in topics])
+        if res != mqtt.MQTT_ERR_SUCCESS:
+            logger.error(f"Could not subscribe to topics {topics}. Result: {res}")
+
+    def __on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error(f"Could not connect to MQTT broker {self._host}:{self._port}. Result: {rc}")
+            return
+
+        logger.info(f"Connected to MQTT broker {self._host}:{self._port}")
+        with self._lock:
+            topics = set(self._topics)
+        if topics:
+            self.__subscribe(topics)
+
+    def __on_message(self, client, userdata, msg):
+        with self._lock:
+            self._payloads[msg.topic] = (msg.payload, time.time())
 
-        self._client.on_message = self.__on_message
-        self._client.loop_start()
 
-        sleep(self._timeout)
+# The subscriber for each broker and set of client parameters, keyed by (host, port, client ID)
+_subscribers = {}
+_subscribers_lock = threading.Lock()
 
+
+def get_subscriber_key(host: str, port: int, client_kwargs: dict) -> tuple[str, int, str]:
+    return host, port, get_client_id(client_kwargs)
+
+
+def get_subscriber(host: str, port: int, **kwargs) -> MQTTSubscriber:
+    key = get_subscriber_key(host, port, kwargs)
+    with _subscribers_lock:
+        subscriber = _subscribers.get(key)
+        if subscriber is None:
+            subscriber = _subscribers[key] = MQTTSubscriber(host, port, key[2], **kwargs)
+
+    return subscriber
+
+
+def update_subscriptions(devices: list[tuple[dict, list[dict]]]) -> None:
+    """
+    Sets the topics subscribed to on each broker to those required by the devices, given as a list of
+    (reader config, readings) tuples. A device's address may include additional topic filters to subscribe
+    to, under `subscribe`. Subscribers for brokers that are no longer in use are stopped.
+    """
+    broker_topics = {}
+    for reader_config, readings in devices:
+        host = reader_config.get("host", "localhost")
+        port = reader_config.get("port", 1883)
+        client_kwargs = {k: v for k, v in reader_config.items() if k not in READER_PARAMS}
+        subscriber = get_subscriber(host, port, **client_kwargs)
+
+        topics = broker_topics.setdefault(get_subscriber_key(host, port, client_kwargs), (subscriber, set()))[1]
+        topics.update(rdg["topic"] for rdg in readings if "topic" in rdg)
+        topics.update(reader_config.get("subscribe", []))
+
+    with _subscribers_lock:
+        for key in [k for k in _subscribers if k not in broker_topics]:
+            logger.info(f"Stopping MQTT subscriber for {key[0]}:{key[1]} as {key[2]}, which is no longer in use")
+            _subscribers.pop(key).stop()
+
+    for subscriber, topics in broker_topics.values():
+        subscriber.set_topics(topics)
+
+
+class Reader(object):
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 1883,
+        timeout: int = 3,
+        max_age: float | None = None,
+        read_interval: float | None = None,
+        **kwargs,
+    ):
+        # The timeout is no longer used, since payloads are received in the background. The read interval is the
+        # device's, which the maximum age of payloads defaults to a multiple of.
+        if max_age is None:
+            max_age = MAX_AGE_INTERVALS * read_interval if read_interval else DEFAULT_MAX_AGE
+        self._max_age = max_age
+        kwargs.pop("subscribe", None)
+        self._subscriber = get_subscriber(host, port, **kwargs)
+
+    def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
-        try:
-            self._client.disconnect()
-        except Exception:
-            logger.warning("Could not disconnect from MQTT broker", exc_info=True)
+        pass
 
-    def __on_message(self, client, userdata, msg):
-        self._current_payloads[msg.topic] = msg.payload
+    def read(self, topic, max_age=None, **rdg):
+        # Normally the topic will have been subscribed to already, as part of the config
+        self._subscriber.add_topic(topic)
 
-    def read(self, topic, **rdg):
-        res, _ = self._client.subscribe(topic, qos=DEFAULT_QOS)
-        if res != mqtt.MQTT_ERR_SUCCESS:
-            logger.error(f"Could not subscribe to topic '{topic}'. Result: {res}")
-            return None
+        return self._subscriber.get_payload(topic, max_age if max_age is not None else self._max_age)
+
+
+class AsyncReader(Reader):
+    """
+    Counterpart of Reader for use with the asyncio reading engine. Since reads are lookups of payloads that
+    have already been received, they do not need to wait on any I/O.
+    """
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        pass
 
-        return self._current_payloads.get(topic)
+    async def read(self, topic, max_age=None, **rdg):
+        return Reader.read(self, topic, max_age=max_age, **rdg)
@@ -4,6 +4,8 @@ import time
 
 import serial
 
+from .serial_port_manager import serial_ports
+
 logger = logging.getLogger(__name__)
 
 
@@ -21,32 +23,17 @@ class Reader(object):
         self._stored_responses = {}
 
     def __enter__(self):
-        # Create a Serial connection to be used for all our requests
-        try:
-            self._conn = serial.Serial(
-                port=self._device,
-                baudrate=self._baudrate,
-                bytesize=self._bytesize,
-                parity=self._parity,
-                stopbits=self._stopbits,
-                timeout=self._timeout,
-            )
-        except Exception:
-            logger.error("Exception while attempting to create serial connection:")
-            raise
-
-        try:
-            # Make sure we have an open connection to device
-            if not self._conn.is_open:
-                self._conn.open()
-                if self._conn.is_open:
-                    logger.debug(f"Opened serial connection to {self._device}")
-                else:
-                    logger.error(f"Unable to open serial connection to {self._device}")
-                    return None
-        except Exception:
-            logger.error("Exception while attempting to open serial connection:")
-            raise
+        # The port is opened once and shared by all devices on the bus; it stays open after this reader exits
+        instrument = serial_ports.acquire(
+            self._device,
+            baudrate=self._baudrate,
+            bytesize=self._bytesize,
+            parity=self._parity,
+            stopbits=self._stopbits,
+            timeout=self._timeout,
+        )
+        self._conn = instrument.serial
+        self._port_error = False
 
         return self
 
@@ -54,16 +41,15 @@ class Reader(object):
         if not hasattr(self, "_conn"):
             return
 
-        try:
-            self._conn.close()
-        except Exception:
-            logger.warning("Could not close serial connection", exc_info=True)
+        serial_ports.release(self._device, error=type is not None or self._port_error)
 
     def read(self, query, pos, length, resp_template=None, resp_termination=None, **rdg):
         if query in self._stored_responses:
             resp = self._stored_responses[query]
         else:
             try:
+                # The port is kept open in-between reading cycles, so discard anything left over from before
+                self._conn.reset_input_buffer()
                 logger.debug(f"Writing {repr(query)} to serial port")
                 self._conn.write(self.get_bytes(query))
 
@@ -88,6 +74,10 @@ class Reader(object):
                         logger.warn(f"Response {repr(resp)} does not match template {resp_template}. Discarding")
                         return
 
+            except (serial.SerialException, OSError):
+                logger.error(f"Serial port error while reading response to query {repr(query)}")
+                self._port_error = True
+                raise
             except Exception:
                 logger.error(f"Exception while reading response to query {repr(query)}")
                 raise
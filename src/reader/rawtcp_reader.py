@@ -1,7 +1,8 @@
+import asyncio
 import logging
 import socket
 
-from .helpers import generate_request, parse_response
+from .helpers import generate_request, parse_response, tcp_connection_pool
 
 logger = logging.getLogger(__name__)
 
@@ -24,14 +25,24 @@ class Reader(object):
         self._device_args = {"host": host, "port": port, **kwargs}
 
         self._stored_responses = {}
+        # Set to False upon any error, so that the connection is closed rather than returned to the pool
+        self._reusable = True
 
     def __enter__(self):
+        # Reuse the connection from a previous reading cycle if possible
+        self._conn = tcp_connection_pool.get(self._host, self._port)
+        if self._conn is not None:
+            self._conn.settimeout(self._timeout)
+            return self
+
         self._conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._conn.settimeout(self._timeout)
         try:
             self._conn.connect((self._host, self._port))
         except Exception:
             logger.error("Exception while attempting to create TCP connection:")
+            self._conn.close()
+            del self._conn
             raise
 
         return self
@@ -40,6 +51,10 @@ class Reader(object):
         if not hasattr(self, "_conn"):
             return
 
+        if type is None and self._reusable:
+            tcp_connection_pool.put(self._host, self._port, self._conn)
+            return
+
         try:
             self._conn.close()
         except Exception:
@@ -61,12 +76,17 @@ class Reader(object):
 
                 if response == b"":
                     logger.warn("No response received from device")
+                    self._reusable = False
                     return
 
             except Exception:
                 logger.error(f"Exception while reading response to query {repr(request)}")
+                self._reusable = False
                 raise
 
+        return self._get_value(request, response, schema, **rdg)
+
+    def _get_value(self, request: bytes, response: bytes, schema: dict, **rdg) -> bytes:
         # Save response in case other readings rely on the same query
         self._stored_responses[request] = response
 
@@ -78,3 +98,55 @@ class Reader(object):
             raise
 
         return val_b
+
+
+class AsyncReader(Reader):
+    """Counterpart of Reader for use with the asyncio reading engine"""
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+
+        self._conn = tcp_connection_pool.get(self._host, self._port)
+        if self._conn is not None:
+            self._conn.setblocking(False)
+            return self
+
+        self._conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._conn.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(self._conn, (self._host, self._port)), self._timeout)
+        except Exception:
+            logger.error("Exception while attempting to create TCP connection:")
+            self._conn.close()
+            del self._conn
+            raise
+
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        self.__exit__(type, value, traceback)
+
+    async def read(self, schema, **rdg):
+        loop = asyncio.get_running_loop()
+        request = generate_request(schema["request"], self._device_args, **rdg)
+
+        if request in self._stored_responses:
+            response = self._stored_responses[request]
+        else:
+            try:
+                logger.debug(f"Writing {repr(request)} to TCP port")
+                await asyncio.wait_for(loop.sock_sendall(self._conn, request), self._timeout)
+                response = await asyncio.wait_for(loop.sock_recv(self._conn, self._recv_buffer_size), self._timeout)
+                logger.debug(f"Received {repr(response)} from TCP port")
+
+                if response == b"":
+                    logger.warn("No response received from device")
+                    self._reusable = False
+                    return
+
+            except Exception:
+                logger.error(f"Exception while reading response to query {repr(request)}")
+                self._reusable = False
+                raise
+
+        return self._get_value(request, response, schema, **rdg)
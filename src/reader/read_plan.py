@@ -0,0 +1,222 @@
+import logging
+import threading
+from copy import deepcopy
+
+from node_mgmt.config_watch import get_digest
+from processor import compile_codec
+
+from .bus_worker import get_inter_frame_gap
+
+logger = logging.getLogger(__name__)
+
+DEVICE_DEFAULT_TIMEOUT = 5
+
+# The most recently compiled plan is kept here, and reused for as long as the config remains unchanged
+_plan_cache = {}
+_plan_cache_lock = threading.Lock()
+
+
+def get_reader_config(dev: dict, read_interval: float | None = None) -> dict:
+    """Keyword arguments used to instantiate the reader for a device, which is read at `read_interval` (if known)"""
+    if dev["reading_type"] == "sys":
+        return {}
+
+    reader_config = deepcopy(dev["address"])
+    reader_config["timeout"] = dev.get("timeout", DEVICE_DEFAULT_TIMEOUT)
+    # MQTT payloads are only used while they are recent, relative to the interval at which the device is read
+    if dev["reading_type"] == "mqtt" and read_interval:
+        reader_config["read_interval"] = read_interval
+    return reader_config
+
+
+def get_bus_id(dev: dict) -> str | None:
+    """Identifier of the physical port or host that a device is reached through (if any)"""
+    address = dev.get("address")
+    if not isinstance(address, dict):
+        return None
+    return address.get("device") or address.get("host") or address.get("mac")
+
+
+def get_device_interval(dev: dict, read_interval: float | None = None) -> float | None:
+    """Interval at which a device is read, unless set for individual readings"""
+    if dev.get("read_interval"):
+        return dev["read_interval"]
+    # A minimum reading interval that is longer than the global one effectively sets the device's interval
+    return max(filter(None, [read_interval, dev.get("min_read_interval")]), default=None)
+
+
+class DevicePlan:
+    """
+    Everything needed to read a single device: the device definition (with its ID set), the
+    readings to be taken from it with driver parameters already merged in, the compiled codec for
+    each of the readings (keyed by variable name) and the reader config.
+
+    The readings are also grouped by the (interval, phase) at which they're to be read. Devices and
+    readings can set their own `read_interval` and `read_phase` (in seconds) in the config; otherwise
+    the device's interval and phase, or the global `read_interval`, apply.
+    """
+
+    def __init__(
+        self,
+        dev_id: str,
+        dev: dict,
+        readings: list[dict],
+        read_interval: float | None = None,
+        reading_schedules: dict | None = None,
+    ) -> None:
+        self.dev_id = dev_id
+        self.dev = {**dev, "id": dev_id}
+        self.readings = tuple(readings)
+        self.codecs = {rdg["var"]: compile_codec(rdg) for rdg in self.readings}
+        self.bus_id = get_bus_id(dev)
+        # Devices that are not on a shared bus get a worker of their own
+        self.worker_id = self.bus_id or f"dev/{dev_id}"
+        self.inter_frame_gap = get_inter_frame_gap(dev.get("reading_type"), dev.get("address"))
+        dev_interval = get_device_interval(dev, read_interval)
+        try:
+            self.reader_config = get_reader_config(dev, dev_interval)
+        except KeyError:
+            logger.error(f"Device {dev_id} has no address defined")
+            self.reader_config = None
+
+        dev_phase = dev.get("read_phase", 0)
+        self.schedule = {}
+        # Interval of each reading, keyed by variable name
+        self.intervals = {}
+        for rdg in self.readings:
+            interval, phase = (reading_schedules or {}).get(rdg["var"], (None, None))
+            key = (interval or dev_interval, phase if phase is not None else dev_phase)
+            self.schedule.setdefault(key, []).append(rdg["var"])
+            self.intervals[rdg["var"]] = key[0]
+
+
+class ReadPlan:
+    def __init__(self, devices: dict[str, DevicePlan], config_digest: str) -> None:
+        self.devices = devices
+        self.config_digest = config_digest
+        # Most recent reading of each variable, with its timestamp, keyed by (dev_id, var). Maintained by
+        # get_output_readings(), so that readings from before a change of plan are not carried over.
+        self.latest_readings = {}
+
+    def is_current(self, config_digest: str) -> bool:
+        """
+        Checks whether the plan is still valid for the config with the digest. The drivers that are loaded from
+        files don't change while the process runs, and those in the config are covered by its digest.
+        """
+        return config_digest == self.config_digest
+
+    def get_dev_rdg(self, due: dict[str, set] | None = None) -> dict[str, list[dict]]:
+        """
+        Returns the readings to be taken, refactored by device. dev_rdg is a dict of lists of dicts ;) :
+        1st level: dict with the device name as the key (so we can query each device separately)
+        2nd level: list of individual readings that need to be taken from device
+        3rd level: for each reading, a dict determining how the reading should be taken
+
+        The reading dicts are shallow copies, so the values saved into them during a reading cycle
+        do not leak into the plan.
+
+        If `due` is given, only the readings that it contains (as a set of variable names for each
+        device ID) are included.
+        """
+        if due is None:
+            return {dev_id: [dict(rdg) for rdg in d.readings] for dev_id, d in self.devices.items()}
+
+        return {
+            dev_id: [dict(rdg) for rdg in self.devices[dev_id].readings if rdg["var"] in due_vars]
+            for dev_id, due_vars in due.items()
+            if dev_id in self.devices
+        }
+
+
+def build_read_plan(config: dict, drivers: dict, config_digest: str | None = None) -> ReadPlan:
+    # Work out all the readings that need to be taken, refactored by device
+    dev_readings = {}
+    # Interval and phase of readings for which these are set explicitly, by device and variable name
+    reading_schedules = {}
+    # Each device/variable pair only needs to be read once, even if several readings refer to it
+    planned_vars = set()
+
+    for rdg, rdg_config in config["readings"].items():
+        # Ignore readings that are explicitly disabled
+        # (if 'enabled' key is missing altogether, assume enabled by default)
+        if not rdg_config.get("enabled", True):
+            continue
+
+        # Get device and variable name for reading; if not available then move on
+        try:
+            dev_id = rdg_config["device"]
+            var = rdg_config["var"]
+        except KeyError:
+            continue
+
+        # Ignore devices that are explicitly disabled in the devices configuration
+        # (if 'enabled' key is missing altogether, assume enabled by default)
+        if dev_id in config["devices"]:
+            dev = config["devices"][dev_id]
+        else:
+            logger.error("Reading from device %s requested, but device not defined. Skipping" % dev_id)
+            continue
+
+        if not dev.get("enabled", True):
+            continue
+
+        # Get the driver name
+        drv_id = dev["driver"]
+        if drv_id not in drivers:
+            logger.error(f"Reading using driver {drv_id} requested, but driver not found. Skipping device {dev_id}")
+            continue
+
+        if (dev_id, var) in planned_vars:
+            logger.debug(f"Reading {rdg} duplicates variable {var} of device {dev_id}. Skipping")
+            continue
+        planned_vars.add((dev_id, var))
+
+        # Start by setting reading name
+        rdict = {"reading": rdg, "var": var}
+        # If applicable, add common reading parameters from driver file (e.g. function code)
+        rdict.update(drivers[drv_id].get("common", {}))
+
+        try:
+            rdict.update(drivers[drv_id]["fields"][var])
+        except KeyError:
+            logger.warning(f"Variable {var} not found in driver {drv_id}, or driver definition malformed.")
+
+        if rdict.get("deprecated"):
+            logger.warning(f"Use of deprecated variable {var} from driver {drv_id}")
+
+        dev_readings.setdefault(dev_id, []).append(rdict)
+        if "read_interval" in rdg_config or "read_phase" in rdg_config:
+            reading_schedules.setdefault(dev_id, {})[var] = (
+                rdg_config.get("read_interval"),
+                rdg_config.get("read_phase"),
+            )
+
+    devices = {
+        dev_id: DevicePlan(
+            dev_id, config["devices"][dev_id], readings, config.get("read_interval"), reading_schedules.get(dev_id)
+        )
+        for dev_id, readings in dev_readings.items()
+    }
+
+    return ReadPlan(devices, config_digest or get_digest(config))
+
+
+def get_read_plan(config: dict, drivers: dict, config_digest: str | None = None) -> ReadPlan:
+    """
+    Returns the compiled read plan for the config and drivers. The plan is only rebuilt if the config has
+    changed since the plan was compiled, as told by its digest. Callers that keep the config should pass its
+    digest (see Node.config_digest), as working it out on every cycle would cost about as much as the plan saves.
+    """
+    if config_digest is None:
+        config_digest = get_digest(config)
+
+    with _plan_cache_lock:
+        plan = _plan_cache.get("plan")
+        if plan is not None and plan.is_current(config_digest):
+            return plan
+
+        plan = build_read_plan(config, drivers, config_digest)
+        logger.info(f"Compiled read plan for config {plan.config_digest} covering {len(plan.devices)} devices")
+        _plan_cache["plan"] = plan
+
+    return plan
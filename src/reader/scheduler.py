@@ -0,0 +1,129 @@
+import heapq
+import logging
+import math
+
+from .read_plan import ReadPlan
+
+logger = logging.getLogger(__name__)
+
+# Groups of readings that are due within this many seconds of each other are read in the same cycle, so they share
+# the bus workers and are published as a single readout
+COALESCE_WINDOW = 1.0
+
+
+class ReadingScheduler:
+    """
+    Multi-rate scheduler for the readings in the read plan. Each group of readings of a device that share an
+    interval and phase (see DevicePlan.schedule) is kept on a heap, ordered by the time at which it's next due.
+    Upon each wake-up, only the groups that are due are popped off the heap, and rescheduled for their next
+    due time.
+
+    With `roundtime`, readings are due at round times based on their interval (e.g. on the minute for an interval
+    of 60 s), offset by their phase. Otherwise, readings are first due `phase` seconds after being scheduled.
+    Subsequent due times are always based on the previous due time rather than on the time at which the readings
+    were actually taken, so they don't drift. If a due time has already passed by the time the group is
+    rescheduled (e.g. because a cycle took longer than the interval), the missed readings are skipped.
+
+    The scheduler keeps count of skipped slots and of cycles that overran (i.e. were still taking readings when
+    the next readings became due), and of how late the due readings were taken. These are reported through
+    pop_stats().
+    """
+
+    def __init__(self) -> None:
+        self._plan = None
+        self._roundtime = False
+        # Variable names of each group, keyed by (dev_id, interval, phase)
+        self._groups = {}
+        # (due time, group key) for each group
+        self._heap = []
+        # Due time of the readings last returned by pop_due()
+        self._slot_time = None
+        self._stats = {"lag": 0.0, "skipped": 0, "overruns": 0}
+
+    def update(self, plan: ReadPlan, roundtime: bool, now: float) -> None:
+        """Updates the groups after the read plan has changed. Groups that remain keep their due time."""
+        if plan is self._plan and roundtime == self._roundtime:
+            return
+
+        due_times = {key: due for due, key in self._heap}
+        groups = {}
+        for dev_id, dev_plan in plan.devices.items():
+            for (interval, phase), dev_vars in dev_plan.schedule.items():
+                if not interval:
+                    logger.error(f"No reading interval defined for readings {dev_vars} of device {dev_id}. Skipping")
+                    continue
+                groups[(dev_id, interval, phase)] = frozenset(dev_vars)
+
+        if roundtime != self._roundtime:
+            due_times = {}
+        self._heap = []
+        for key in groups:
+            _, interval, phase = key
+            due_time = due_times.get(key) or self.__get_first_due(interval, phase, roundtime, now)
+            self._heap.append((due_time, key))
+        heapq.heapify(self._heap)
+        self._groups = groups
+        self._plan = plan
+        self._roundtime = roundtime
+
+        logger.info(f"Scheduled {len(groups)} groups of readings at {len({key[1] for key in groups})} intervals")
+
+    def next_due(self) -> float | None:
+        """Time at which the next group of readings is due, if any"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: float) -> dict[str, set]:
+        """
+        Returns the readings that are due at `now` (or within the coalescing window after it), as a set of
+        variable names for each device ID, and reschedules them.
+        """
+        due = {}
+        self._slot_time = None
+        while self._heap and self._heap[0][0] <= now + COALESCE_WINDOW:
+            due_time, key = heapq.heappop(self._heap)
+            dev_id, interval, _ = key
+            due.setdefault(dev_id, set()).update(self._groups[key])
+            self._slot_time = due_time
+            self._stats["lag"] = max(self._stats["lag"], now - due_time)
+
+            next_due = due_time + interval
+            if next_due <= now:
+                skipped = math.floor((now - next_due) / interval) + 1
+                next_due += skipped * interval
+                self._stats["skipped"] += skipped
+                logger.warning(f"Skipped {skipped} reading(s) at interval {interval} s of device {dev_id}")
+            heapq.heappush(self._heap, (next_due, key))
+
+        return due
+
+    def slot_time(self) -> float | None:
+        """
+        Time at which the readings last returned by pop_due() were due. For groups that were coalesced, this is the
+        latest of their due times, so that none of the readings are taken before it.
+        """
+        return self._slot_time
+
+    def check_overrun(self, now: float) -> bool:
+        """Records an overrun if the next readings are already due at `now`, after taking the previous readings"""
+        next_due = self.next_due()
+        if next_due is None or now <= next_due:
+            return False
+
+        self._stats["overruns"] += 1
+        logger.warning(f"Reading cycle overran the schedule by {now - next_due:.1f} s")
+        return True
+
+    def pop_stats(self) -> dict:
+        """
+        Returns the largest delay (in seconds) between the time readings were due and the time they were taken,
+        and the number of skipped slots and overruns, since the previous call
+        """
+        stats = {**self._stats, "lag": round(self._stats["lag"], 3)}
+        self._stats = {"lag": 0.0, "skipped": 0, "overruns": 0}
+        return stats
+
+    @staticmethod
+    def __get_first_due(interval: float, phase: float, roundtime: bool, now: float) -> float:
+        if not roundtime:
+            return now + phase
+        return phase + math.ceil((now - phase) / interval) * interval
@@ -0,0 +1,126 @@
+import logging
+import threading
+
+import minimalmodbus
+import serial
+
+logger = logging.getLogger(__name__)
+
+
+class SerialPortManager:
+    """
+    Process-wide registry of serial ports, each of which is opened once with its line settings and then kept
+    open. All devices on a bus share the port's handle, which is a minimalmodbus Instrument whose slave address
+    is switched for each device; its `serial` attribute gives access to the underlying port for raw requests.
+    A port is only reopened after an error, or if it is requested with different line settings.
+    """
+
+    def __init__(self) -> None:
+        # Each device (e.g. /dev/ttyAMA0) maps to an (instrument, line settings) tuple. The registry lock is held for
+        # every access to the dicts, while the lock of each port is held for the whole use of the port.
+        self._ports = {}
+        self._port_locks = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self,
+        device: str,
+        baudrate: int = 9600,
+        bytesize: int = 8,
+        parity: str = serial.PARITY_NONE,
+        stopbits: int = 1,
+        timeout: float = 5,
+    ) -> minimalmodbus.Instrument:
+        """
+        Returns the open port for the device, for exclusive use by the caller until it calls release().
+        """
+        with self._lock:
+            port_lock = self._port_locks.setdefault(device, threading.RLock())
+
+        port_lock.acquire()
+        try:
+            instrument = self.__get_open_port(device, (baudrate, bytesize, parity, stopbits))
+            if instrument.serial.timeout != timeout:
+                instrument.serial.timeout = timeout
+        except Exception:
+            port_lock.release()
+            raise
+
+        return instrument
+
+    def release(self, device: str, error: bool = False) -> None:
+        """Hands back the port for the device. If an error occurred, the port is closed and reopened on next use."""
+        if error:
+            logger.info(f"Closing serial port {device} following error; it will be reopened on next use")
+            self.__close(device)
+        with self._lock:
+            port_lock = self._port_locks[device]
+        port_lock.release()
+
+    def close_unused(self, devices_in_use: set) -> None:
+        """Closes the ports of any devices that are no longer in use"""
+        with self._lock:
+            unused = [
+                (device, self._port_locks[device]) for device in list(self._ports) if device not in devices_in_use
+            ]
+
+        for device, port_lock in unused:
+            with port_lock:
+                logger.info(f"Closing serial port {device}, which is no longer in use")
+                self.__close(device)
+
+    def __get_open_port(self, device: str, settings: tuple) -> minimalmodbus.Instrument:
+        with self._lock:
+            instrument, open_settings = self._ports.get(device, (None, None))
+        if instrument is not None and instrument.serial.is_open:
+            if open_settings == settings:
+                return instrument
+            logger.info(f"Line settings for serial port {device} changed to {settings}; reopening")
+            self.__close(device)
+
+        try:
+            instrument = minimalmodbus.Instrument(port=device, slaveaddress=1)
+        except Exception:
+            logger.error("Exception while attempting to create serial connection:")
+            raise
+
+        try:
+            # Set up serial connection parameters according to device driver
+            baudrate, bytesize, parity, stopbits = settings
+            instrument.serial.baudrate = baudrate
+            instrument.serial.bytesize = bytesize
+            instrument.serial.parity = parity
+            instrument.serial.stopbits = stopbits
+        except Exception:
+            logger.error("Exception while attempting to configure serial connection:")
+            raise
+
+        try:
+            # Make sure we have an open connection to device
+            if not instrument.serial.is_open:
+                instrument.serial.open()
+        except Exception:
+            logger.error("Exception while attempting to open serial connection:")
+            raise
+
+        if not instrument.serial.is_open:
+            raise Exception(f"Unable to open serial connection to {device}")
+
+        logger.debug(f"Opened serial port {device} with settings {settings}")
+        with self._lock:
+            self._ports[device] = (instrument, settings)
+        return instrument
+
+    def __close(self, device: str) -> None:
+        with self._lock:
+            instrument, _ = self._ports.pop(device, (None, None))
+        if instrument is None:
+            return
+
+        try:
+            instrument.serial.close()
+        except Exception:
+            logger.warning(f"Could not close serial port {device}", exc_info=True)
+
+
+serial_ports = SerialPortManager()
@@ -1,6 +1,9 @@
+import asyncio
 import logging
 import socket
 import struct
+import threading
+import time
 
 from .helpers.sma_speedwire_parser import parse_datagram
 
@@ -10,6 +13,123 @@ DEFAULT_RECV_BUFFER_SIZE = 10240
 MULTICAST_GROUP = "239.12.255.254"
 MULTICAST_PORT = 9522
 MAX_RESPONSES = 5
+# Energy meters send a datagram every second; values that are older than this are regarded as stale
+DEFAULT_MAX_AGE = 30
+# Receive timeout of the listener, and the time it waits before rejoining the multicast group after errors
+LISTENER_POLL_INTERVAL = 1
+
+
+class SpeedwireListener(threading.Thread):
+    """
+    Background thread that receives all Speedwire datagrams sent to the multicast group, and keeps
+    the most recently received values for each serial number.
+    """
+
+    def __init__(
+        self, group: str = MULTICAST_GROUP, port: int = MULTICAST_PORT, recv_buffer_size: int = DEFAULT_RECV_BUFFER_SIZE
+    ) -> None:
+        threading.Thread.__init__(self)
+        self.name = f"Speedwire-{group}:{port}"
+        # Make sure this thread exits directly when the program exits; no clean-up should be required
+        self.daemon = True
+
+        self._group = group
+        self._port = port
+        self._recv_buffer_size = recv_buffer_size
+        self._started_at = time.time()
+
+        # Latest (values, receive timestamp) for each serial number
+        self._values = {}
+        self._values_updated = threading.Condition()
+
+    def run(self) -> None:
+        while True:
+            try:
+                conn = self.__join_group()
+            except OSError:
+                logger.exception(f"Could not join multicast group {self._group}")
+                time.sleep(LISTENER_POLL_INTERVAL)
+                continue
+
+            try:
+                self.__receive(conn)
+            except OSError:
+                logger.exception("Exception while receiving multicast datagrams")
+            finally:
+                conn.close()
+            time.sleep(LISTENER_POLL_INTERVAL)
+
+    def __join_group(self) -> socket.socket:
+        conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        conn.settimeout(LISTENER_POLL_INTERVAL)
+        conn.bind(("", self._port))
+        mreq = struct.pack("4sl", socket.inet_aton(self._group), socket.INADDR_ANY)
+        logger.debug(f"Joining multicast group {self._group}")
+        conn.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        return conn
+
+    def __receive(self, conn: socket.socket) -> None:
+        while True:
+            try:
+                datagram = conn.recv(self._recv_buffer_size)
+            except socket.timeout:
+                continue
+
+            logger.debug(f"Received {repr(datagram)} from multicast")
+            if datagram == b"":
+                continue
+
+            try:
+                serial_number, values = parse_datagram(datagram)
+            except Exception:
+                logger.warning(f"Could not parse datagram {repr(datagram)}", exc_info=True)
+                continue
+
+            with self._values_updated:
+                self._values[serial_number] = (values, time.time())
+                self._values_updated.notify_all()
+
+    def get_values(self, serial: int, max_age: float = DEFAULT_MAX_AGE, wait: float = 0) -> dict | None:
+        """
+        Returns the latest values received from the device with the serial number, unless these are older than
+        `max_age`. If there are no such values, waits up to `wait` seconds for them to come in.
+        """
+        deadline = time.time() + wait
+        with self._values_updated:
+            while True:
+                values, received = self._values.get(serial, (None, 0))
+                if values is not None and time.time() - received <= max_age:
+                    return values
+                if not self._values_updated.wait(max(deadline - time.time(), 0)):
+                    return None
+
+    def get_serials(self, max_age: float = DEFAULT_MAX_AGE) -> list:
+        """Returns the serial numbers of all devices from which datagrams have been received recently"""
+        with self._values_updated:
+            return [serial for serial, (_, received) in self._values.items() if time.time() - received <= max_age]
+
+    def get_warm_up_remaining(self, duration: float) -> float:
+        """Time (in seconds) until the listener has been running for at least `duration` seconds"""
+        return max(self._started_at + duration - time.time(), 0)
+
+
+# The listener for each multicast group, keyed by (group, port)
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+def get_listener(
+    group: str = MULTICAST_GROUP, port: int = MULTICAST_PORT, recv_buffer_size: int = DEFAULT_RECV_BUFFER_SIZE
+) -> SpeedwireListener:
+    with _listeners_lock:
+        listener = _listeners.get((group, port))
+        if listener is None or not listener.is_alive():
+            logger.info(f"Starting Speedwire listener for {group}:{port}")
+            listener = _listeners[(group, port)] = SpeedwireListener(group, port, recv_buffer_size)
+            listener.start()
+
+    return listener
 
 
 class Reader(object):
@@ -21,78 +141,65 @@ class Reader(object):
         recv_buffer_size: int = DEFAULT_RECV_BUFFER_SIZE,
         max_responses: int = MAX_RESPONSES,
         timeout: int = 5,
+        max_age: float = DEFAULT_MAX_AGE,
         **kwargs,
     ):
         self._group = group
         self._port = port
         self._recv_buffer_size = recv_buffer_size
-        self._max_responses = max_responses
+        # Only applies to the time waited for the first datagrams after the listener is started
         self._timeout = timeout
+        self._max_age = max_age
 
         self._serial = serial
         self._stored_values = None
 
     def __enter__(self):
-        self._conn = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
-        self._conn.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._conn.settimeout(self._timeout)
-        self._conn.bind(("", self._port))
-        mreq = struct.pack("4sl", socket.inet_aton(self._group), socket.INADDR_ANY)
-        logger.debug(f"Joining multicast group {self._group}")
-        self._conn.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-
+        self._listener = get_listener(self._group, self._port, self._recv_buffer_size)
         return self
 
     def __exit__(self, type, value, traceback):
-        if not hasattr(self, "_conn"):
-            return
-
-        try:
-            self._conn.close()
-        except Exception:
-            logger.warning("Could not close UDP connection", exc_info=True)
-
-    def __get_datagram(self):
-        try:
-            datagram = self._conn.recv(self._recv_buffer_size)
-        except socket.timeout:
-            logger.warning("Timed out while waiting for multicast datagram")
-            return None
-
-        logger.debug(f"Received {repr(datagram)} from multicast")
-        if datagram == b"":
-            logger.warning("Empty datagram received from multicast")
-            return None
-        return datagram
+        pass
 
     def read(self, obis_channel: int, obis_type: int, **rdg) -> bytes:
         if self._stored_values is None:
-            # If there is no stored response, collect responses and try to
-            # find the one that matched the desired serial
-            for _ in range(self._max_responses):
-                datagram = self.__get_datagram()
-                if datagram is None:
-                    break
-                serial_number, values = parse_datagram(datagram)
-                if serial_number == self._serial:
-                    self._stored_values = values
-                    break
+            self._load_values(wait=True)
 
-        return self.__get_value(self._stored_values, obis_channel, obis_type)
+        return self._get_value(self._stored_values, obis_channel, obis_type)
 
     def scan_serials(self) -> list:
-        serials = []
-        for _ in range(self._max_responses):
-            datagram = self.__get_datagram()
-            if datagram is None:
-                break
-            serial_number, _ = parse_datagram(datagram)
-            if serial_number not in serials:
-                serials.append(serial_number)
-        return serials
+        # Give the listener the chance to receive datagrams from all devices if it has only just been started
+        time.sleep(self._listener.get_warm_up_remaining(self._timeout))
+        return self._listener.get_serials(self._max_age)
+
+    def _load_values(self, wait: bool) -> None:
+        # Values are normally available directly, unless the listener has only just been started
+        wait_time = self._listener.get_warm_up_remaining(self._timeout) if wait else 0
+        self._stored_values = self._listener.get_values(self._serial, self._max_age, wait=wait_time)
+        if self._stored_values is None and wait:
+            logger.warning(f"No recent datagram received from serial {self._serial}")
 
     @staticmethod
-    def __get_value(values: dict, obis_channel: int, obis_type: int) -> bytes:
+    def _get_value(values: dict, obis_channel: int, obis_type: int) -> bytes:
         if not isinstance(values, dict):
             return None
         return values.get(obis_channel, {}).get(obis_type)
+
+
+class AsyncReader(Reader):
+    """Counterpart of Reader for use with the asyncio reading engine"""
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, type, value, traceback):
+        self.__exit__(type, value, traceback)
+
+    async def read(self, obis_channel: int, obis_type: int, **rdg) -> bytes:
+        if self._stored_values is None:
+            self._load_values(wait=False)
+        if self._stored_values is None:
+            # Any waiting for the first datagrams is done without blocking the event loop
+            await asyncio.to_thread(self._load_values, wait=True)
+
+        return self._get_value(self._stored_values, obis_channel, obis_type)
@@ -119,13 +119,23 @@ def configuration():
     return render_template("configuration.html", node_id=node_id, devices=devices, timestamp=config_ts)
 
 
+# Version of the cached rows of last readings, with the readings and timestamp assembled from them
+_last_readings = (None, None, None)
+
+
 @app.route("/realtime-readings")
 def realtime_readings():
+    global _last_readings
     is_loaded = False
     timestamp = None
     with KVCache() as kvc:
-        device_readings = kvc.get(keys.LAST_READINGS)
-        last_reading_ts = kvc.get(keys.LAST_READINGS_TS)
+        version, device_readings, last_reading_ts = _last_readings
+        # The readings are only read again (from a single snapshot) once any device's readings have changed
+        if changed := kvc.get_prefix_if_changed(f"{keys.LAST_READING_FOR_DEV_PFX}/", version):
+            version, rows = changed
+            device_readings = [row["r"] for _, row in sorted(rows.items())] if rows else None
+            last_reading_ts = max((row["t"] for row in rows.values()), default=None)
+            _last_readings = (version, device_readings, last_reading_ts)
         if last_reading_ts is not None:
             timestamp = datetime.datetime.fromtimestamp(last_reading_ts)
         if device_readings is not None:
@@ -1,7 +1,7 @@
 import logging
 import os
 import sys
-from time import sleep
+from threading import Event
 
 from dotenv import load_dotenv
 
@@ -34,16 +34,21 @@ def initialize(wifi_ap: WifiAPSnapCtl, kvs: KVStore) -> bool:
 
 
 def monitor_and_update(wifi_ap: WifiAPSnapCtl, kvs: KVStore) -> None:
-    wifi_ap_cfg = kvs.get(KVS_CONFIG_KEY)
+    # Check for a new config as soon as it's written (by whichever process), or at least every 60 s
+    config_changed = Event()
+    kvs.watch(KVS_CONFIG_KEY, lambda version, value: config_changed.set())
+    version, wifi_ap_cfg = kvs.get_if_changed(KVS_CONFIG_KEY, None)
     while True:
+        config_changed.wait(60)
+        config_changed.clear()
         try:
-            new_wifi_ap_cfg = kvs.get(KVS_CONFIG_KEY)
-            if new_wifi_ap_cfg != wifi_ap_cfg:
-                wifi_ap_cfg = new_wifi_ap_cfg
-                wifi_ap.configure(wifi_ap_cfg)
+            if changed := kvs.get_if_changed(KVS_CONFIG_KEY, version):
+                version, new_wifi_ap_cfg = changed
+                if new_wifi_ap_cfg != wifi_ap_cfg:
+                    wifi_ap_cfg = new_wifi_ap_cfg
+                    wifi_ap.configure(wifi_ap_cfg)
         except Exception as e:
             logger.info(f"Exception while monitoring for new config: {type(e).__name__}: {e}")
-        sleep(60)
 
 
 def main() -> None:
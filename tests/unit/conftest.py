@@ -0,0 +1,39 @@
+import pytest
+
+from reader.read_plan import build_read_plan
+
+
+@pytest.fixture
+def drivers():
+    return {
+        "meter": {
+            "common": {"fncode": 3},
+            "fields": {
+                "P": {"register": 1, "datatype": "int16"},
+                "E": {"register": 2, "datatype": "uint32"},
+            },
+        }
+    }
+
+
+@pytest.fixture
+def config():
+    """Config with two devices of 2 readings each: by default at the global interval of 60 s, and 'E' at 300 s"""
+    return {
+        "read_interval": 60,
+        "devices": {
+            "meter_1": {"driver": "meter", "reading_type": "modbusrtu"},
+            "meter_2": {"driver": "meter", "reading_type": "modbusrtu", "read_phase": 10},
+        },
+        "readings": {
+            "meter_1_P": {"device": "meter_1", "var": "P"},
+            "meter_1_E": {"device": "meter_1", "var": "E", "read_interval": 300},
+            "meter_2_P": {"device": "meter_2", "var": "P"},
+            "meter_2_E": {"device": "meter_2", "var": "E", "read_interval": 300},
+        },
+    }
+
+
+@pytest.fixture
+def plan(config, drivers):
+    return build_read_plan(config, drivers)
@@ -0,0 +1,105 @@
+import itertools
+import math
+
+import pytest
+
+from processor import compile_aggregate, evaluate_jsonata
+from processor.aggregate import FALLBACK, MISSING
+
+FUNCTIONS = [None, "$sum", "$average", "$max", "$min"]
+OPERATIONS = ["", " * 2", " / 3", " + 1.5", " - 10", "*0.1"]
+READINGS = ['dev_1[var = "x"].value', 'dev_1[var="y"].value', '`dev_2`[var = "x"].value']
+# Values for the readings dev_1.x, dev_1.y and dev_2.x
+KEYS = [("dev_1", "x"), ("dev_1", "y"), ("dev_2", "x")]
+VALUE_SETS = [
+    (1, 2, 3),
+    (1.5, 2.25, -3.75),
+    (0.1, 0.2, 0.3),
+    (2.5, 2.5, 5),
+    (MISSING, 4, 5),
+    (4, 5, MISSING),
+    (MISSING, MISSING, MISSING),
+    (0, 0, 0),
+    (-7, 1e12, 3),
+    (2**53 + 1, 1, 0),
+    (1, True, 2),
+    ("1", 2, 3),
+    (None, 2, 3),
+    ([1, 2], 3, 4),
+    (math.nan, 1, 2),
+    (1e308, 1e308, 0),
+]
+UNSUPPORTED = [
+    'dev_1[var = "x"].value * dev_2[var = "x"].value',
+    'dev_1[var = "x"]',
+    "$sum(dev_1.value)",
+    '$sum([dev_1[var = "x"].value]) / 0',
+    '$count([dev_1[var = "x"].value])',
+    '$sum([dev_1[var = "x"].value, 1])',
+    '2 * dev_1[var = "x"].value',
+    # Wildcards are only supported as the argument of an aggregate function
+    '*[var = "x"].value',
+    '$sum([*[var = "x"].value])',
+    '$sum([dev_1[var = "x"].value, *[var = "x"].value])',
+    '$sum(*[var = "x"])',
+    "$sum(*.value)",
+]
+
+
+def get_expressions() -> list[str]:
+    expressions = []
+    for function, operation in itertools.product(FUNCTIONS, OPERATIONS):
+        if function is None:
+            expressions += [reading + operation for reading in READINGS]
+        else:
+            expressions.append(f"{function}([{', '.join(READINGS)}]){operation}")
+            expressions.append(f"{function}({READINGS[1]}){operation}")
+            # Wildcards over readings of several devices, of a single device, and of none
+            expressions.append(f'{function}(*[var = "x"].value){operation}')
+            expressions.append(f'{function}(*[var="y"].value){operation}')
+            expressions.append(f'{function}(*[var = "z"].value){operation}')
+    return expressions
+
+
+def make_dev_rdg(values: dict) -> dict:
+    dev_rdg = {}
+    for (dev_id, var), value in values.items():
+        dev_rdg.setdefault(dev_id, []).append({"var": var} if value is MISSING else {"var": var, "value": value})
+    return dev_rdg
+
+
+@pytest.mark.parametrize("expr", get_expressions())
+def test_supported_shapes(expr):
+    assert compile_aggregate(expr) is not None
+
+
+@pytest.mark.parametrize("expr", UNSUPPORTED)
+def test_unsupported_shapes(expr):
+    assert compile_aggregate(expr) is None
+
+
+@pytest.mark.parametrize("value_set", VALUE_SETS, ids=repr)
+@pytest.mark.parametrize("expr", get_expressions())
+def test_parity_with_interpreter(expr, value_set):
+    values = dict(zip(KEYS, value_set))
+    actual = compile_aggregate(expr).evaluate(values)
+    if actual is FALLBACK:
+        return
+
+    expected = evaluate_jsonata(make_dev_rdg(values), expr)
+    assert actual == expected
+    assert type(actual) is type(expected)
+
+
+def test_wildcard_sum():
+    aggregate = compile_aggregate('$sum(*[var="P_total"].value)')
+    values = {("inv_1", "P_total"): 10, ("inv_1", "E_total"): 1000, ("inv_2", "P_total"): 5.5, ("meter", "P"): 3}
+    assert aggregate.evaluate(values) == 15.5
+    assert aggregate.evaluate({("meter", "P"): 3}) is None
+
+
+@pytest.mark.parametrize("value_set", [(1, 2, "3"), (1, 2, None), (1, 2, math.inf)], ids=repr)
+def test_fallback_for_values_of_other_types(value_set):
+    values = dict(zip(KEYS, value_set))
+    assert compile_aggregate(f"$sum([{', '.join(READINGS)}])").evaluate(values) is FALLBACK
+    assert compile_aggregate('$sum(*[var = "x"].value)').evaluate(values) is FALLBACK
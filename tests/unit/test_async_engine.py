@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from reader.async_engine import AsyncReadingEngine
+
+
+@pytest.fixture
+def engine():
+    return AsyncReadingEngine()
+
+
+def sleeper(events: list, dev_id: str, duration: float):
+    """Returns a job that takes `duration` seconds, recording when it starts and whether it's completed or cancelled"""
+
+    async def job():
+        events.append(("start", dev_id))
+        try:
+            await asyncio.sleep(duration)
+        except asyncio.CancelledError:
+            events.append(("cancelled", dev_id))
+            raise
+        events.append(("done", dev_id))
+
+    return job
+
+
+def test_concurrency(engine):
+    events = []
+    jobs = [
+        ("host_a", "a_1", sleeper(events, "a_1", 0.05), None),
+        ("host_a", "a_2", sleeper(events, "a_2", 0.05), None),
+        ("host_b", "b_1", sleeper(events, "b_1", 0.05), None),
+        ("host_c", "c_1", sleeper(events, "c_1", 0.05), None),
+    ]
+    engine.submit(jobs, max_concurrency=2).result(timeout=5)
+
+    # Devices on the same host are read one after the other, and at most two at a time overall
+    assert events.index(("done", "a_1")) < events.index(("start", "a_2"))
+    running = max_running = 0
+    for event, _ in events:
+        running += 1 if event == "start" else -1
+        max_running = max(max_running, running)
+    assert max_running == 2
+    assert sorted(dev_id for event, dev_id in events if event == "done") == ["a_1", "a_2", "b_1", "c_1"]
+    assert engine.pop_skipped() == 0
+
+
+def test_deadline(engine):
+    events = []
+    skipped = []
+    jobs = [
+        # Without a timeout of its own, the job is cancelled at the deadline, and the one queued behind it is skipped
+        ("host_a", "a_1", sleeper(events, "a_1", 5), None),
+        ("host_a", "a_2", sleeper(events, "a_2", 0.01), None),
+        # A job with a timeout of its own can run past the deadline
+        ("host_b", "b_1", sleeper(events, "b_1", 0.3), 5),
+        ("host_c", "c_1", sleeper(events, "c_1", 5), 0.05),
+    ]
+    start = time.monotonic()
+    engine.submit(jobs, deadline=start + 0.1, on_skip=skipped.append).result(timeout=5)
+
+    assert time.monotonic() - start < 1
+    assert sorted(events) == [
+        ("cancelled", "a_1"),
+        ("cancelled", "c_1"),
+        ("done", "b_1"),
+        ("start", "a_1"),
+        ("start", "b_1"),
+        ("start", "c_1"),
+    ]
+    assert skipped == ["a_2"]
+    assert engine.pop_skipped() == 1
+    assert engine.pop_skipped() == 0
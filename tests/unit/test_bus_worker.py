@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from reader.bus_worker import FIXED_INTER_FRAME_GAP, BusWorker, BusWorkerPool, get_inter_frame_gap
+
+
+@pytest.fixture
+def worker():
+    worker = BusWorker("test")
+    worker.start()
+    yield worker
+    worker.stop()
+    worker.join(timeout=1)
+
+
+def test_jobs_run_in_order(worker):
+    done = threading.Event()
+    results = []
+    for i in range(5):
+        worker.submit(lambda i=i: results.append(i))
+    worker.submit(done.set)
+
+    assert done.wait(timeout=1)
+    assert results == [0, 1, 2, 3, 4]
+    assert worker.pop_skipped() == 0
+
+
+def test_stale_jobs_are_skipped(worker):
+    release = threading.Event()
+    done = threading.Event()
+    results, skipped = [], []
+    # The first job holds up the bus until after the deadline of the following ones
+    worker.submit(release.wait)
+    deadline = time.monotonic() + 0.05
+    worker.submit(lambda: results.append("stale"), deadline=deadline, on_skip=lambda: skipped.append("stale"))
+    worker.submit(lambda: results.append("no deadline"))
+    worker.submit(lambda: results.append("current"), deadline=time.monotonic() + 60)
+    worker.submit(done.set)
+
+    time.sleep(0.1)
+    release.set()
+    assert done.wait(timeout=1)
+    assert results == ["no deadline", "current"]
+    assert skipped == ["stale"]
+    assert worker.pop_skipped() == 1
+    assert worker.pop_skipped() == 0
+
+
+def test_exceptions_dont_stop_worker(worker):
+    done = threading.Event()
+    worker.submit(lambda: 1 / 0)
+    worker.submit(done.set)
+    assert done.wait(timeout=1)
+
+
+def test_pool_skipped_across_workers():
+    pool = BusWorkerPool()
+    release = threading.Event()
+    done = [threading.Event(), threading.Event()]
+    for bus_id, event in zip(["a", "b"], done):
+        pool.submit(bus_id, release.wait)
+        pool.submit(bus_id, lambda: None, deadline=time.monotonic())
+        pool.submit(bus_id, event.set)
+
+    release.set()
+    assert all(event.wait(timeout=1) for event in done)
+    assert pool.pop_skipped() == 2
+    pool.retain(set())
+
+
+@pytest.mark.parametrize(
+    "reading_type, address, expected",
+    [
+        ("modbustcp", {"host": "10.0.0.1"}, 0.0),
+        ("modbusrtu", None, 0.0),
+        ("modbusrtu", {"baudrate": 9600}, 3.5 * 10 / 9600),
+        ("modbusrtu", {"baudrate": 9600, "parity": "even", "stopbits": 1}, 3.5 * 11 / 9600),
+        ("rawserial", {"baudrate": 115200}, FIXED_INTER_FRAME_GAP),
+    ],
+)
+def test_inter_frame_gap(reading_type, address, expected):
+    assert get_inter_frame_gap(reading_type, address) == pytest.approx(expected)
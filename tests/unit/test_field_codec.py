@@ -0,0 +1,147 @@
+import json
+import math
+import struct
+from pathlib import Path
+
+import pytest
+
+from processor import compile_codec, get_array_fields, process_reading
+
+DRIVERS_PATH = Path(__file__).parents[2] / "drivers"
+
+SAMPLE_LENGTHS = {
+    "int16": 2,
+    "uint16": 2,
+    "int32": 4,
+    "uint32": 4,
+    "int64": 8,
+    "uint64": 8,
+    "float": 4,
+    "single": 4,
+    "double": 8,
+}
+# Values that readers other than the binary ones return as they are
+NON_BYTES_SAMPLES = [None, 0, 12, -3.5, "12.5", "on", True]
+
+
+def load_fields(path: Path) -> list[dict]:
+    with open(path) as driver_file:
+        drv = json.load(driver_file)
+    return [{"var": var, **drv.get("common", {}), **field} for var, field in drv.get("fields", {}).items()]
+
+
+def get_samples(rdg: dict) -> list:
+    """Raw values for a field, as the readers would return them, including some that can't be decoded"""
+    valuemap_keys = list(rdg.get("valuemap", {}))
+    if rdg.get("parse_as") == "str":
+        return [b"12.5", b"12", b"-1", b"", b"on", b"\xff\xfe", *(key.encode("utf-8") for key in valuemap_keys)]
+
+    length = SAMPLE_LENGTHS.get(rdg.get("datatype"))
+    if length is None:
+        length = 2 * rdg["words"] if isinstance(rdg.get("words"), int) else rdg.get("length", 2)
+    samples = [bytes(length), b"\xff" * length, b"\x7f" + b"\xa5" * (length - 1), bytes(range(1, length + 1))]
+    samples += [struct.pack(">f", 12.5), struct.pack(">d", -0.1), b"\x01", b"\x01\x02\x03"]
+    for key in valuemap_keys:
+        try:
+            samples.append(bytes.fromhex(key[2:]))
+        except (TypeError, ValueError):
+            continue
+
+    if rdg.get("parse_as") == "hex":
+        return [sample.hex().encode("utf-8") for sample in samples] + [b"zz", b"\xff"]
+    return samples + NON_BYTES_SAMPLES
+
+
+def decode_or_error(fn, val_b):
+    try:
+        return fn(val_b)
+    except Exception as e:
+        return type(e)
+
+
+def same_value(a, b) -> bool:
+    if isinstance(a, float) and isinstance(b, float) and math.isnan(a) and math.isnan(b):
+        return True
+    return a == b and type(a) is type(b)
+
+
+@pytest.mark.parametrize("path", sorted(DRIVERS_PATH.glob("*.json")), ids=lambda path: path.stem)
+def test_parity_with_process_reading(path):
+    for rdg in load_fields(path):
+        codec = compile_codec(rdg)
+        for val_b in get_samples(rdg):
+            expected = decode_or_error(lambda v, rdg=rdg: process_reading(v, **rdg), val_b)
+            actual = decode_or_error(codec.decode, val_b)
+            assert same_value(expected, actual), f"{rdg['var']}: {val_b!r}"
+
+
+@pytest.mark.parametrize(
+    "rdg",
+    [
+        {"datatype": "int16", "multiplier": 0.1, "offset": -40},
+        {"datatype": "int16", "multiplier": 0.1},
+        {"datatype": "int16", "offset": -40},
+        {"datatype": "uint16", "multiplier": 2, "typecast": "int"},
+        {"datatype": "uint16", "multiplier": 0.5, "offset": 1, "typecast": "str"},
+        # Multiplier and offset are applied if given, even as null (which fails the value)
+        {"datatype": "int16", "multiplier": None},
+        {"datatype": "int16", "offset": None},
+        {"datatype": "int16", "multiplier": None, "offset": None},
+        # Values that are mapped to strings are repeated by the multiplier, but fail with an offset
+        {"datatype": "uint16", "valuemap": {"0x0001": "on"}, "multiplier": 2},
+        {"datatype": "uint16", "valuemap": {"0x0001": "on"}, "offset": 1},
+        {"datatype": "uint16", "valuemap": {"0x0001": "1"}, "typecast": "float", "multiplier": 2},
+    ],
+)
+def test_multiplier_and_offset(rdg):
+    codec = compile_codec(rdg)
+    for val_b in [b"\x00\x01", b"\xff\x9c", 12, "2"]:
+        expected = decode_or_error(lambda v: process_reading(v, **rdg), val_b)
+        assert same_value(codec.decode(val_b), expected)
+
+
+def test_affine():
+    codec = compile_codec({"datatype": "int16", "multiplier": 0.1, "offset": -40})
+    assert codec.decode(b"\x01\x90") == pytest.approx(0.0)
+    assert codec.decode(b"\xff\x9c") == pytest.approx(-50.0)
+    assert compile_codec({"datatype": "int16", "multiplier": None}).decode(b"\x00\x01") is None
+
+
+def test_array():
+    cells = struct.pack(">4H", 3300, 3301, 0xFFFF, 3303)
+    codec = compile_codec({"datatype": "uint16", "multiplier": 0.001, "array": {"count": 4}})
+    assert codec.decode(cells) == pytest.approx([3.3, 3.301, 65.535, 3.303])
+    # Array fields are decoded in the same way by process_reading()
+    assert process_reading(cells, datatype="uint16", multiplier=0.001, array={"count": 4}) == codec.decode(cells)
+
+    # Without a count, as many values as fit; mapped values are taken as they are
+    rdg = {"datatype": "uint16", "valuemap": {"0xffff": None}, "offset": -3300, "typecast": "int", "array": {}}
+    assert compile_codec(rdg).decode(cells) == [0, 1, None, 3]
+    with pytest.raises(struct.error):
+        compile_codec({"datatype": "uint16", "array": {"count": 5}}).decode(cells)
+
+
+def test_array_stride():
+    # int16 values every 3 registers, as hex; the last one doesn't need the full stride
+    block = struct.pack(">h4xh4xh", -1, 2, 3).hex().encode("utf-8")
+    codec = compile_codec({"datatype": "int16", "parse_as": "hex", "array": {"count": 3, "stride": 6}})
+    assert codec.decode(block) == [-1, 2, 3]
+    assert codec.decode(b"zz") is None
+    # Values that aren't bytes are taken as they are
+    assert codec.decode(12) == 12
+
+
+@pytest.mark.parametrize(
+    "rdg",
+    [
+        {"parse_as": "str", "datatype": "int16", "array": {"count": 2}},
+        {"length": 4, "array": {"count": 2}},
+        {"datatype": "int16", "array": 2},
+    ],
+)
+def test_invalid_array(rdg):
+    assert compile_codec(rdg).decode(b"\x00\x01\x00\x02") is None
+
+
+def test_array_fields():
+    assert get_array_fields("cell_v", [3.3, None, 3.2]) == {"cell_v_1": 3.3, "cell_v_2": None, "cell_v_3": 3.2}
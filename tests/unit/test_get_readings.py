@@ -0,0 +1,166 @@
+import importlib
+import math
+import struct
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from constants import DEVICE_ID_KEY
+from reader.get_readings import get_output_readings, read_devices, save_field_value, update_latest_readings
+
+# The module, which the reader package's get_readings() function shadows
+get_readings_module = importlib.import_module("reader.get_readings")
+from reader.read_plan import build_read_plan
+
+
+def take_readings(plan, due: dict, value) -> dict:
+    dev_rdg = plan.get_dev_rdg(due)
+    for readings in dev_rdg.values():
+        for rdg in readings:
+            rdg["value"] = value
+    return dev_rdg
+
+
+def get_values(output_readings: dict) -> dict:
+    return {(dev_id, rdg["var"]): rdg.get("value") for dev_id, rdgs in output_readings.items() for rdg in rdgs}
+
+
+def test_readings_of_earlier_cycles_are_reused(plan):
+    get_output_readings(plan, take_readings(plan, None, 1), 1000)
+    values = get_values(get_output_readings(plan, take_readings(plan, {"meter_1": {"P"}, "meter_2": {"P"}}, 2), 1060))
+
+    assert values == {("meter_1", "P"): 2, ("meter_1", "E"): 1, ("meter_2", "P"): 2, ("meter_2", "E"): 1}
+
+
+def test_overdue_readings_are_not_reused(plan):
+    get_output_readings(plan, take_readings(plan, None, 1), 1000)
+    # meter_1.P is read at 60 s intervals, and E at 300 s intervals
+    values = get_values(get_output_readings(plan, take_readings(plan, {"meter_2": {"P"}}, 2), 1090))
+    assert values == {("meter_1", "P"): 1, ("meter_1", "E"): 1, ("meter_2", "P"): 2, ("meter_2", "E"): 1}
+
+    values = get_values(get_output_readings(plan, take_readings(plan, {"meter_2": {"P"}}, 3), 1091))
+    assert values == {("meter_1", "P"): None, ("meter_1", "E"): 1, ("meter_2", "P"): 3, ("meter_2", "E"): 1}
+
+    values = get_values(get_output_readings(plan, {}, 1451))
+    assert values == {("meter_1", "P"): None, ("meter_1", "E"): None, ("meter_2", "P"): None, ("meter_2", "E"): None}
+
+
+def test_readings_not_reused_across_plans(config, drivers, plan):
+    get_output_readings(plan, take_readings(plan, None, 1), 1000)
+
+    config["readings"]["meter_1_P"]["read_interval"] = 30
+    new_plan = build_read_plan(config, drivers)
+    values = get_values(get_output_readings(new_plan, take_readings(new_plan, {"meter_1": {"P"}}, 2), 1030))
+    assert values == {("meter_1", "P"): 2, ("meter_1", "E"): None, ("meter_2", "P"): None, ("meter_2", "E"): None}
+
+
+def test_array_fields_are_flattened():
+    fields = {}
+    rdg = {"var": "cell_v", "datatype": "uint16", "offset": -3300, "array": {"count": 3}}
+    save_field_value({"id": "bms"}, rdg, struct.pack(">3H", 3300, 3301, 3302), fields)
+    assert fields == {"cell_v_1": 0, "cell_v_2": 1, "cell_v_3": 2}
+    # The field's reading keeps the whole array, for outputs to refer to
+    assert rdg["value"] == [0, 1, 2]
+
+    # A value that can't be decoded is emitted under the field's own name, as for any other field
+    fields = {}
+    save_field_value({"id": "bms"}, {**rdg, "parse_as": "hex"}, b"zz", fields)
+    assert fields == {"cell_v": None}
+
+
+class FakeBusWorkers:
+    """Bus workers that read devices right away, or once released for those in `late`, or skip those in `skip`"""
+
+    def __init__(self, late: set, skip: set) -> None:
+        self.late = late
+        self.skip = skip
+        self.release = threading.Event()
+
+    def retain(self, bus_ids) -> None:
+        pass
+
+    def pop_skipped(self) -> int:
+        return len(self.skip)
+
+    def submit(self, bus_id, job, inter_frame_gap=0.0, deadline=None, on_skip=None) -> None:
+        dev, readings, readout_q = job.args[:3]
+        if dev["id"] in self.skip:
+            on_skip()
+            return
+
+        def read():
+            if dev["id"] in self.late:
+                self.release.wait()
+            for rdg in readings:
+                rdg["value"] = 5
+            readout_q.put({DEVICE_ID_KEY: dev["id"], **{rdg["var"]: 5 for rdg in readings}})
+
+        threading.Thread(target=read, daemon=True).start()
+
+
+@pytest.fixture
+def bus_workers(monkeypatch):
+    bus_workers = FakeBusWorkers(late={"meter_2"}, skip={"meter_3"})
+    monkeypatch.setattr(get_readings_module, "bus_workers", bus_workers)
+    stats = SimpleNamespace(pop_stats=dict)
+    monkeypatch.setattr(
+        get_readings_module, "KVCache", lambda: SimpleNamespace(connection_manager=stats, maintenance=stats)
+    )
+    monkeypatch.setattr(get_readings_module, "save_readings_to_cache", lambda readout: None)
+    return bus_workers
+
+
+def test_late_and_skipped_devices(config, drivers, bus_workers):
+    config["read_deadline"] = 0.2
+    config["devices"]["meter_3"] = {"driver": "meter", "reading_type": "modbusrtu"}
+    config["readings"]["meter_3_P"] = {"device": "meter_3", "var": "P"}
+    late_readouts = []
+    late_published = threading.Event()
+
+    def on_late_readout(readout):
+        late_readouts.append(readout)
+        late_published.set()
+
+    readout, plan, dev_rdg = read_devices(config, drivers, on_late_readout)
+
+    # Skipped devices aren't reported as late, and neither they nor the late devices have their readings (still
+    # being taken in the case of late devices) used for this cycle's outputs
+    assert [fields[DEVICE_ID_KEY] for fields in readout["r"]] == ["meter_1"]
+    assert readout["m"]["late_devices"] == ["meter_2"]
+    assert readout["m"]["skipped_jobs"] == 1
+    assert list(dev_rdg) == ["meter_1"]
+    values = get_values(get_output_readings(plan, dev_rdg, readout["t"]))
+    assert values == {
+        ("meter_1", "P"): 5,
+        ("meter_1", "E"): 5,
+        ("meter_2", "P"): None,
+        ("meter_2", "E"): None,
+        ("meter_3", "P"): None,
+    }
+
+    # Once the late device has returned its readings, they're published and used for the outputs
+    bus_workers.release.set()
+    assert late_published.wait(timeout=5)
+    assert late_readouts[0]["r"] == [{DEVICE_ID_KEY: "meter_2", "P": 5, "E": 5}]
+    values = get_values(get_output_readings(plan, {}, readout["t"] + 10))
+    assert values[("meter_2", "P")] == 5 and values[("meter_2", "E")] == 5
+
+
+def test_late_readings_do_not_replace_later_ones(plan):
+    get_output_readings(plan, take_readings(plan, {"meter_1": {"P"}}, 2), 1060)
+    update_latest_readings(plan, take_readings(plan, {"meter_1": {"P", "E"}}, 1), 1000)
+    values = get_values(get_output_readings(plan, {}, 1070))
+    assert values[("meter_1", "P")] == 2 and values[("meter_1", "E")] == 1
+
+
+def test_readout_stamped_with_slot_time(config, drivers, bus_workers):
+    bus_workers.late = bus_workers.skip = set()
+    now = time.time()
+    # Readings that are taken slightly ahead of their slot are for the time of the slot
+    readout, _, _ = read_devices(config, drivers, due={"meter_1": {"P"}}, slot_time=now + 0.9)
+    assert readout["t"] == math.ceil(now + 0.9)
+    # Readings taken late are for the time they're taken
+    readout, _, _ = read_devices(config, drivers, due={"meter_1": {"P"}}, slot_time=now - 30)
+    assert now - 1 <= readout["t"] <= time.time()
@@ -0,0 +1,334 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import kvstore.write_behind
+from kvstore.kv import KV
+from kvstore.maintenance import KVMaintenance
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "kv.db")
+
+
+@pytest.fixture
+def kv(db_path):
+    return KV(db_path, synchronous="OFF")
+
+
+@pytest.fixture
+def kv_write_behind(db_path):
+    return KV(db_path, synchronous="OFF", write_behind=True)
+
+
+def test_direct_transaction_in_write_behind_mode(kv, kv_write_behind):
+    kv_write_behind.set("shared", 1)
+    kv_write_behind.set("own", 1)
+
+    with kv_write_behind.transaction(write_behind=False) as txn:
+        # The transaction reads from the database, to which the pending write has not been flushed yet
+        assert txn.get("shared") is None
+        txn.set("shared", 2)
+        # Not visible to other connections until the transaction is committed
+        assert kv.get("shared") is None
+    assert kv.get("shared") == 2
+
+    # Another process writes the key, which the write-behind buffer no longer mirrors, nor flushes over
+    kv.set("shared", 3)
+    kv_write_behind.flush()
+    assert kv_write_behind.get("shared") == 3
+    assert kv.get("shared") == 3
+    assert kv.get("own") == 1
+
+
+def test_direct_transaction_rollback_keeps_pending_writes_of_other_keys(kv, kv_write_behind):
+    kv_write_behind.set("own", 1)
+
+    with pytest.raises(RuntimeError), kv_write_behind.transaction(write_behind=False) as txn:
+        txn.set("shared", 1)
+        raise RuntimeError
+
+    kv_write_behind.flush()
+    assert kv.get("shared") is None
+    assert kv.get("own") == 1
+
+
+def expire(db_path: str, *keys: str) -> None:
+    """Makes the keys expire, as if their TTL had passed"""
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany("UPDATE kvstore_expiry SET expires_at = 0 WHERE key = ?", [(key,) for key in keys])
+
+
+def test_ttl(db_path, kv):
+    kv.set_many({"a": 1, "b": 2}, ttl=60)
+    kv.set("c", 3)
+    assert kv.get_many(["a", "b", "c"]) == {"a": 1, "b": 2, "c": 3}
+
+    expire(db_path, "a", "b")
+    assert kv.get_many(["a", "b", "c"]) == {"a": None, "b": None, "c": 3}
+    assert kv.scan_prefix("a") == []
+
+    # Writing a key again pushes back its expiry, also when written by another process (e.g. the Rust process)
+    kv.set("a", 4, ttl=60)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE kvstore SET value = ? WHERE key = 'b'", (b"5",))
+    assert kv.get_many(["a", "b"]) == {"a": 4, "b": 5}
+
+    kv.maintenance.run_once()
+    assert kv.maintenance.pop_stats()["expired"] == 0
+
+    expire(db_path, "a")
+    kv.maintenance.run_once()
+    assert kv.maintenance.pop_stats()["expired"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT key FROM kvstore ORDER BY key").fetchall() == [("b",), ("c",)]
+        assert conn.execute("SELECT key FROM kvstore_expiry").fetchall() == [("b",)]
+
+
+def test_maintenance_in_a_single_process(db_path, kv):
+    # Stands in for the maintenance of another process, which opens the lock file of its own
+    other = KVMaintenance(db_path)
+    kv.set("a", 1, ttl=60)
+    expire(db_path, "a")
+
+    assert kv.maintenance.run_once()
+    assert not other.run_once()
+    assert kv.maintenance.pop_stats()["expired"] == 1
+    assert other.pop_stats()["expired"] == 0
+
+    # Another process takes over once the one that carried out the maintenance exits
+    os.close(kv.maintenance._lock_fd)
+    assert other.run_once()
+
+
+def test_ttl_removed_when_set_without(db_path, kv):
+    kv.set("a", 1, ttl=60)
+    kv.set("a", 2)
+    expire(db_path, "a")
+    assert kv.get("a") == 2
+
+
+def test_ttl_in_write_behind_mode(db_path, kv, kv_write_behind):
+    kv_write_behind.set("a", 1, ttl=0.05)
+    assert kv_write_behind.get("a") == 1
+    time.sleep(0.1)
+    assert kv_write_behind.get("a") is None
+    kv_write_behind.flush()
+    assert kv.get("a") is None
+
+
+def test_versions_of_deleted_keys_are_pruned(db_path, kv):
+    kv.set_many({"dev/1": 1, "dev/2": 2}, ttl=60)
+    version = kv.get_version("dev/1")
+    prefix_version, values = kv.get_prefix_if_changed("dev/", None)
+    assert values == {"1": 1, "2": 2}
+
+    expire(db_path, "dev/1")
+    kv.maintenance.run_once()
+    assert kv.maintenance.pop_stats()["pruned_versions"] == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT key FROM kvstore_versions").fetchall() == [("dev/2",)]
+
+    # The deletion is still seen as a change, and the versions of re-created keys are later than before
+    assert kv.get_version("dev/1") == 0
+    changed = kv.get_prefix_if_changed("dev/", prefix_version)
+    assert changed is not None and changed[0] > prefix_version and changed[1] == {"2": 2}
+    kv.set("dev/1", 1)
+    assert kv.get_version("dev/1") > version
+    assert kv.get_prefix_if_changed("dev/", changed[0])[0] > changed[0]
+
+    # Nothing left to prune
+    kv.maintenance.run_once()
+    assert kv.maintenance.pop_stats()["pruned_versions"] == 0
+
+
+def test_versions(kv):
+    assert kv.get_version("a") == 0
+    kv.set("a", 1)
+    version = kv.get_version("a")
+    assert version > 0
+
+    # Only changes of the value change the version
+    kv.set("a", 1)
+    assert kv.get_version("a") == version
+    kv.set("a", 2)
+    assert kv.get_version("a") > version
+
+
+def test_get_if_changed(kv):
+    assert kv.get_if_changed("a", None) == (0, None)
+    kv.set("a", {"x": 1})
+    version, value = kv.get_if_changed("a", 0)
+    assert value == {"x": 1}
+    assert kv.get_if_changed("a", version) is None
+
+    kv.set("a", {"x": 2})
+    assert kv.get_if_changed("a", version)[1] == {"x": 2}
+
+
+def test_get_prefix_if_changed(kv):
+    kv.set_many({"dev/1": 1, "dev/2": 2, "other": 3})
+    version, values = kv.get_prefix_if_changed("dev/", None)
+    assert values == {"1": 1, "2": 2}
+
+    kv.set("other", 4)
+    assert kv.get_prefix_if_changed("dev/", version) is None
+    kv.set("dev/2", 5)
+    version, values = kv.get_prefix_if_changed("dev/", version)
+    assert values == {"1": 1, "2": 5}
+
+
+def test_version_in_write_behind_mode(kv, kv_write_behind):
+    kv_write_behind.set("a", 1)
+    assert kv.get_version("a") == 0
+    # Pending writes of the key are flushed first
+    assert kv_write_behind.get_version("a") > 0
+    assert kv.get("a") == 1
+
+
+def test_watch(monkeypatch, db_path, kv):
+    monkeypatch.setattr("kvstore.watcher.WATCH_INTERVAL", 0.01)
+    changes = queue.Queue()
+    kv.set("a", 1)
+    unwatch = kv.watch("a", lambda version, value: changes.put((version, value)))
+
+    kv.set("a", 2)
+    version, value = changes.get(timeout=1)
+    assert value == 2
+    assert version == kv.get_version("a")
+
+    # Changes by other connections (e.g. other processes) are notified too
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM kvstore WHERE key = 'a'")
+    assert changes.get(timeout=1)[1] is None
+
+    unwatch()
+    kv.set("a", 3)
+    with pytest.raises(queue.Empty):
+        changes.get(timeout=0.1)
+
+
+def test_get_many_set_many(kv):
+    kv.set_many({"a": 1, "b": [1, 2], "c": {"x": None}})
+    assert kv.get_many(["a", "b", "c", "d"]) == {"a": 1, "b": [1, 2], "c": {"x": None}, "d": None}
+    assert kv.get_many(["d"], default=0) == {"d": 0}
+    assert kv.get("b") == [1, 2]
+
+
+def test_transaction(kv):
+    kv.set("counter", 1)
+    with kv.transaction() as txn:
+        txn.set("counter", txn.get("counter") + 1)
+        # Reads within the transaction see its own writes, others don't until it's committed
+        assert txn.get("counter") == 2
+        assert kv.get("counter") == 1
+    assert kv.get("counter") == 2
+
+
+def test_transaction_rollback(kv):
+    kv.set("a", 1)
+    with pytest.raises(ValueError), kv.transaction() as txn:
+        txn.set_many({"a": 2, "b": 2})
+        raise ValueError
+    assert kv.get_many(["a", "b"]) == {"a": 1, "b": None}
+
+
+def test_transaction_locks_out_other_writers(db_path, kv):
+    with kv.transaction() as txn:
+        txn.get("a")
+        with sqlite3.connect(db_path, timeout=0) as conn, pytest.raises(sqlite3.OperationalError, match="locked"):
+            conn.execute("INSERT INTO kvstore (key, value) VALUES ('a', '1')")
+        txn.set("a", 2)
+    assert kv.get("a") == 2
+
+
+def test_write_behind_transaction(kv, kv_write_behind):
+    kv_write_behind.set("a", 1)
+    with kv_write_behind.transaction() as txn:
+        assert txn.get("a") == 1
+        txn.set("a", 2)
+        txn.set("b", 3, ttl=60)
+        assert txn.get_many(["a", "b"]) == {"a": 2, "b": 3}
+        assert kv_write_behind.get("a") == 1
+    assert kv_write_behind.get_many(["a", "b"]) == {"a": 2, "b": 3}
+
+    with pytest.raises(ValueError), kv_write_behind.transaction() as txn:
+        txn.set("a", 4)
+        raise ValueError
+    assert kv_write_behind.get("a") == 2
+
+    kv_write_behind.flush()
+    assert kv.get_many(["a", "b"]) == {"a": 2, "b": 3}
+
+
+def test_write_behind(db_path, kv, kv_write_behind):
+    kv.set("other", 1)
+    kv_write_behind.set_many({"a": 1, "b": 2}, ttl=60)
+    # Pending writes are visible to this process, along with the keys written by others, but not in the database
+    assert kv_write_behind.get_many(["a", "b", "other"]) == {"a": 1, "b": 2, "other": 1}
+    assert kv.get_many(["a", "b"]) == {"a": None, "b": None}
+
+    kv_write_behind.flush()
+    assert kv.get_many(["a", "b"]) == {"a": 1, "b": 2}
+    with sqlite3.connect(db_path) as conn:
+        (expires_at,) = conn.execute("SELECT expires_at FROM kvstore_expiry WHERE key = 'a'").fetchone()
+    assert expires_at == pytest.approx(time.time() + 60, abs=5)
+
+
+def test_write_behind_flush_on_size(monkeypatch, kv, kv_write_behind):
+    monkeypatch.setattr(kvstore.write_behind, "FLUSH_BYTES", 100)
+    kv_write_behind.set("small", "x")
+    kv_write_behind.set("large", "x" * 100)
+    deadline = time.monotonic() + 5
+    while kv.get("large") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert kv.get_many(["small", "large"]) == {"small": "x", "large": "x" * 100}
+
+
+def test_write_behind_flush_ordering(monkeypatch, kv, kv_write_behind):
+    buffer = kv_write_behind.write_behind
+    manager = kv.connection_manager
+    writer = manager.writer
+    flushes = [threading.Thread(target=buffer.flush) for _ in range(2)]
+
+    def slow_writer():
+        # The first flush, with the older value, is slow to get the writer connection
+        if threading.current_thread() is flushes[0]:
+            time.sleep(0.2)
+        return writer()
+
+    monkeypatch.setattr(manager, "writer", slow_writer)
+    kv_write_behind.set("a", 1)
+    flushes[0].start()
+    while buffer.is_pending("a"):
+        time.sleep(0.01)
+    kv_write_behind.set("a", 2)
+    flushes[1].start()
+    for flush in flushes:
+        flush.join()
+    assert kv.get("a") == 2
+
+
+def test_write_behind_flush_failure(monkeypatch, kv, kv_write_behind):
+    upsert_many = kvstore.write_behind.upsert_many
+
+    def fail(*args):
+        # A key is overwritten while the flush is in progress
+        kv_write_behind.set("a", 3)
+        raise sqlite3.OperationalError("disk I/O error")
+
+    kv_write_behind.set_many({"a": 1, "b": 2})
+    monkeypatch.setattr(kvstore.write_behind, "upsert_many", fail)
+    with pytest.raises(sqlite3.OperationalError):
+        kv_write_behind.flush()
+    assert kv.get_many(["a", "b"]) == {"a": None, "b": None}
+
+    # The failed values are kept for the next flush, unless they have been overwritten
+    monkeypatch.setattr(kvstore.write_behind, "upsert_many", upsert_many)
+    kv_write_behind.flush()
+    assert kv.get_many(["a", "b"]) == {"a": 3, "b": 2}
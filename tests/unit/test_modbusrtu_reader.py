@@ -0,0 +1,145 @@
+import struct
+
+import minimalmodbus
+import pytest
+import serial
+
+from reader.modbusrtu_reader import MODBUS_MAX_BLOCK_WORDS, Reader, plan_blocks
+
+
+def rdg(register, words: int = 1, fncode: int = 3, **kwargs) -> dict:
+    return {"register": register, "words": words, "fncode": fncode, **kwargs}
+
+
+def test_plan_contiguous():
+    readings = [rdg(10, 2), rdg(12), rdg(13, 4)]
+    assert plan_blocks(readings) == [(3, 10, 7)]
+    # Fields that are read more than once, or that overlap, don't get in the way
+    assert plan_blocks([*readings, rdg(12), rdg(11, 2)]) == [(3, 10, 7)]
+
+
+def test_plan_gaps():
+    readings = [rdg(10, 2), rdg(16), rdg(22), rdg(100, 2), rdg(102)]
+    # With the default gap of 4 registers, 16 is merged into the block of 10 while 22 is read by itself
+    assert plan_blocks(readings) == [(3, 10, 7), (3, 100, 3)]
+    assert plan_blocks(readings, max_gap=5) == [(3, 10, 13), (3, 100, 3)]
+    assert plan_blocks(readings, max_gap=0) == [(3, 100, 3)]
+
+
+def test_plan_over_limit():
+    readings = [rdg(0, 4), rdg(4, 4), rdg(8, 4), rdg(12, 4)]
+    assert plan_blocks(readings, max_words=8) == [(3, 0, 8), (3, 8, 8)]
+    # Fields aren't split across blocks, so blocks can fall short of the limit
+    assert plan_blocks(readings, max_words=10) == [(3, 0, 8), (3, 8, 8)]
+    assert plan_blocks(readings, max_words=7) == []
+    # Fields that are longer than a block are read by themselves
+    assert plan_blocks([rdg(0, 9), rdg(9), rdg(10)], max_words=8) == [(3, 9, 2)]
+    # Blocks never exceed the limit of the Modbus specification
+    assert plan_blocks([rdg(i * 50, 50) for i in range(4)], max_words=1000) == [(3, 0, 100), (3, 100, 100)]
+    assert plan_blocks([rdg(0, 100), rdg(100, MODBUS_MAX_BLOCK_WORDS - 100)], max_words=1000) == [(3, 0, 125)]
+
+
+def test_plan_mixed_function_codes():
+    readings = [
+        rdg(10, fncode=3),
+        rdg(11, fncode=4),
+        rdg(12, fncode=3),
+        rdg(13, fncode=4),
+        rdg(14, fncode=4),
+        # Coils and discrete inputs, and fields with no fixed length or register, are always read by themselves
+        rdg(15, fncode=1),
+        rdg(16, fncode=1),
+        rdg(17, words=None),
+        {"fncode": 3, "words": 1},
+    ]
+    assert sorted(plan_blocks(readings)) == [(3, 10, 3), (4, 11, 4)]
+
+
+def test_plan_hex_registers():
+    assert plan_blocks([rdg("0x10"), rdg("11"), rdg(18), rdg("zz")]) == [(3, 16, 3)]
+
+
+def registers(*addresses: int, fncode: int = 3) -> bytes:
+    """The value read from the registers at the addresses, as held by FakeInstrument"""
+    return struct.pack(f">{len(addresses)}H", *(fncode * 1000 + address for address in addresses))
+
+
+class FakeInstrument:
+    """
+    Instrument whose registers hold their own address (plus 1000 times the function code), and which refuses
+    reads of addresses in `illegal`
+    """
+
+    def __init__(self, illegal: set = frozenset(), error: Exception | None = None) -> None:
+        self.illegal = set(illegal)
+        self.error = error
+        self.requests = []
+
+    def read_registers(self, start: int, words: int, fncode: int) -> list[int]:
+        self.requests.append((fncode, start, words))
+        if self.error is not None:
+            raise self.error
+        if self.illegal & set(range(start, start + words)):
+            raise minimalmodbus.IllegalRequestError("Slave reported illegal data address")
+        return [fncode * 1000 + register for register in range(start, start + words)]
+
+
+@pytest.fixture
+def reader():
+    reader = Reader("/dev/ttyA", 1)
+    reader._conn = FakeInstrument()
+    reader._port_error = False
+    return reader
+
+
+def test_prefetch(reader):
+    readings = [rdg(10, 2), rdg(13), rdg("0x0f", 2, order="lsr"), rdg(13, fncode=4), rdg(14, fncode=4), rdg(50)]
+    reader.prefetch_blocks(readings)
+    assert sorted(reader._conn.requests) == [(3, 10, 7), (4, 13, 2)]
+
+    # Each field is sliced from its block, in the register order that it asks for
+    values = [reader.read(**r) for r in readings]
+    assert values == [
+        registers(10, 11),
+        registers(13),
+        registers(16, 15),
+        registers(13, fncode=4),
+        registers(14, fncode=4),
+        registers(50),
+    ]
+    # Only the field outside of the blocks was read by itself
+    assert sorted(reader._conn.requests) == [(3, 10, 7), (3, 50, 1), (4, 13, 2)]
+    # The stored registers don't change when a field asks for them in reverse order
+    assert reader.read(**readings[2]) == registers(16, 15)
+
+
+def test_prefetch_refused(reader):
+    reader._conn.illegal = {12}
+    reader.prefetch_blocks([rdg(10, 2), rdg(13), rdg(20), rdg(21)])
+    # The fields of the block that was refused are read one by one instead
+    assert reader.read(**rdg(10, 2)) == registers(10, 11)
+    assert reader.read(**rdg(21)) == registers(21)
+    assert reader._conn.requests == [(3, 10, 4), (3, 20, 2), (3, 10, 2)]
+    assert not reader._port_error
+
+
+@pytest.mark.parametrize(
+    ("error", "port_error"),
+    [
+        (minimalmodbus.InvalidResponseError("Checksum error"), False),
+        (minimalmodbus.NoResponseError("No communication with the instrument"), False),
+        (serial.SerialException("device disconnected"), True),
+        (OSError(5, "Input/output error"), True),
+    ],
+)
+def test_prefetch_errors(reader, error, port_error):
+    reader._conn.error = error
+    if port_error:
+        # The port is closed upon exiting the reader, so that it's reopened on next use
+        with pytest.raises(type(error)):
+            reader.prefetch_blocks([rdg(10), rdg(11)])
+    else:
+        reader.prefetch_blocks([rdg(10), rdg(11)])
+        with pytest.raises(type(error)):
+            reader.read(**rdg(10))
+    assert reader._port_error == port_error
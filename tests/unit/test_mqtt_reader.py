@@ -0,0 +1,108 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import reader.mqtt_reader
+from reader.mqtt_reader import CLIENT_ID, DEFAULT_MAX_AGE, MAX_AGE_INTERVALS, Reader, update_subscriptions
+
+
+class FakeClient:
+    """MQTT client that stays connected, and subscribes to whatever it's asked to"""
+
+    def __init__(self, callback_api_version, client_id: str, clean_session: bool, **kwargs) -> None:
+        self.client_id = client_id
+        self.kwargs = kwargs
+        self.topics = set()
+        self.on_connect = self.on_message = None
+
+    def enable_logger(self, logger) -> None:
+        pass
+
+    def connect_async(self, host: str, port: int) -> None:
+        pass
+
+    def loop_start(self) -> None:
+        pass
+
+    def is_connected(self) -> bool:
+        return True
+
+    def subscribe(self, topics: list) -> tuple[int, int]:
+        self.topics.update(topic for topic, _ in topics)
+        return reader.mqtt_reader.mqtt.MQTT_ERR_SUCCESS, 1
+
+    def unsubscribe(self, topics: list) -> None:
+        self.topics.difference_update(topics)
+
+    def disconnect(self) -> None:
+        pass
+
+    def loop_stop(self) -> None:
+        pass
+
+
+@pytest.fixture(autouse=True)
+def subscribers(monkeypatch):
+    monkeypatch.setattr(reader.mqtt_reader.mqtt, "Client", FakeClient)
+    monkeypatch.setattr(reader.mqtt_reader, "_subscribers", {})
+    return reader.mqtt_reader._subscribers
+
+
+def receive(mqtt_reader: Reader, topic: str, payload: bytes, age: float = 0) -> None:
+    """Has the reader's subscriber receive the payload on the topic, `age` seconds ago"""
+    subscriber = mqtt_reader._subscriber
+    subscriber._client.on_message(subscriber._client, None, SimpleNamespace(topic=topic, payload=payload))
+    if age:
+        subscriber._payloads[topic] = (payload, time.time() - age)
+
+
+def test_max_age():
+    mqtt_reader = Reader(read_interval=60)
+    receive(mqtt_reader, "meter/p", b"1", age=MAX_AGE_INTERVALS * 60 - 10)
+    assert mqtt_reader.read("meter/p") == b"1"
+    # A publisher that has gone silent doesn't have its last payload published over and over again
+    receive(mqtt_reader, "meter/p", b"1", age=MAX_AGE_INTERVALS * 60 + 10)
+    assert mqtt_reader.read("meter/p") is None
+    # A reading can set a maximum age of its own
+    assert mqtt_reader.read("meter/p", max_age=3600) == b"1"
+
+    receive(mqtt_reader, "meter/q", b"2", age=DEFAULT_MAX_AGE - 10)
+    assert Reader().read("meter/q") == b"2"
+    assert Reader(max_age=10).read("meter/q") is None
+    receive(mqtt_reader, "meter/q", b"2", age=DEFAULT_MAX_AGE + 10)
+    assert Reader().read("meter/q") is None
+
+
+def test_wildcard_topics():
+    mqtt_reader = Reader()
+    receive(mqtt_reader, "meter/1/p", b"1", age=20)
+    receive(mqtt_reader, "meter/2/p", b"2", age=10)
+    assert mqtt_reader.read("meter/+/p") == b"2"
+    assert mqtt_reader.read("meter/3/#") is None
+
+
+def test_subscribers(subscribers):
+    update_subscriptions(
+        [
+            ({"host": "broker", "timeout": 5, "read_interval": 60}, [{"topic": "a/p"}]),
+            ({"host": "broker", "max_age": 10, "subscribe": ["a/#"]}, [{"topic": "a/q"}]),
+            ({"host": "broker", "transport": "websockets"}, [{"topic": "b/p"}]),
+            ({"host": "other", "port": 1884}, [{"topic": "c/p"}]),
+        ]
+    )
+
+    # Devices with different client parameters for the same broker get a session of their own
+    clients = {key: subscriber._client for key, subscriber in subscribers.items()}
+    default, websockets, other = [clients[key] for key in sorted(clients)]
+    assert default.client_id == CLIENT_ID and default.kwargs == {}
+    assert default.topics == {"a/p", "a/q", "a/#"}
+    assert websockets.client_id not in (CLIENT_ID, other.client_id)
+    assert websockets.kwargs == {"transport": "websockets"}
+    assert websockets.topics == {"b/p"}
+    assert other.client_id == CLIENT_ID and other.topics == {"c/p"}
+    assert Reader(host="broker", transport="websockets")._subscriber._client is websockets
+
+    update_subscriptions([({"host": "broker"}, [{"topic": "a/p"}])])
+    assert [subscriber._client for subscriber in subscribers.values()] == [default]
+    assert default.topics == {"a/p"}
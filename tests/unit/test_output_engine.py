@@ -0,0 +1,109 @@
+import pytest
+
+import processor.output_engine
+from processor import OutputEngine
+
+OUTPUT_CONFIG = [
+    # Refers to a reading of each of two devices, which the aggregation fast path doesn't support
+    {"field": "p_diff", "source": 'meter_1[var = "P"].value - meter_2[var = "P"].value'},
+    {"field": "e_1", "source": 'meter_1[var = "E"].value * 2'},
+    {"field": "count_2", "source": "$count(meter_2.value)"},
+]
+
+
+def get_dev_rdg(p_1, e_1, p_2, e_2) -> dict:
+    """Readings of two meters, with the driver parameters that readings carry besides their value"""
+    return {
+        "meter_1": [
+            {"var": "P", "register": 1, "datatype": "int16", "value": p_1},
+            {"var": "E", "register": 2, "datatype": "uint32", "value": e_1},
+        ],
+        "meter_2": [
+            {"var": "P", "register": 1, "datatype": "int16", "value": p_2},
+            {"var": "E", "register": 2, "datatype": "uint32", "value": e_2},
+        ],
+    }
+
+
+@pytest.fixture
+def evaluated(monkeypatch) -> list:
+    """The sources of the outputs evaluated by the JSONata interpreter, and the input they're evaluated against"""
+    evaluated = []
+    evaluate_jsonata = processor.output_engine.evaluate_jsonata
+
+    def recording_evaluate(data, source):
+        evaluated.append((source, data))
+        return evaluate_jsonata(data, source)
+
+    monkeypatch.setattr(processor.output_engine, "evaluate_jsonata", recording_evaluate)
+    return evaluated
+
+
+def get_values(outputs: list) -> dict:
+    return {output["field"]: output.get("value") for output in outputs}
+
+
+def test_outputs_reused_when_readings_unchanged(evaluated):
+    engine = OutputEngine()
+    assert get_values(engine.evaluate(get_dev_rdg(10, 100, 4, 200), OUTPUT_CONFIG)) == {
+        "p_diff": 6,
+        "e_1": 200,
+        "count_2": 2,
+    }
+    assert [source for source, _ in evaluated] == [OUTPUT_CONFIG[0]["source"], OUTPUT_CONFIG[2]["source"]]
+
+    evaluated.clear()
+    outputs = engine.evaluate(get_dev_rdg(10, 100, 4, 200), OUTPUT_CONFIG)
+    assert get_values(outputs) == {"p_diff": 6, "e_1": 200, "count_2": 2}
+    assert evaluated == []
+
+
+def test_outputs_recomputed_when_a_reading_changes(evaluated):
+    engine = OutputEngine()
+    engine.evaluate(get_dev_rdg(10, 100, 4, 200), OUTPUT_CONFIG)
+
+    # The reading of the other device is enough for an output to be recomputed
+    evaluated.clear()
+    outputs = engine.evaluate(get_dev_rdg(10, 100, 7, 200), OUTPUT_CONFIG)
+    assert get_values(outputs) == {"p_diff": 3, "e_1": 200, "count_2": 2}
+    assert [source for source, _ in evaluated] == [OUTPUT_CONFIG[0]["source"], OUTPUT_CONFIG[2]["source"]]
+
+    # An output that depends on all readings of a device is recomputed when any of them changes
+    evaluated.clear()
+    outputs = engine.evaluate(get_dev_rdg(10, 100, 7, None), OUTPUT_CONFIG)
+    assert get_values(outputs) == {"p_diff": 3, "e_1": 200, "count_2": 2}
+    assert [source for source, _ in evaluated] == [OUTPUT_CONFIG[2]["source"]]
+
+    # Outputs on the aggregation fast path are recomputed without the interpreter
+    evaluated.clear()
+    outputs = engine.evaluate(get_dev_rdg(10, 150, 7, None), OUTPUT_CONFIG)
+    assert get_values(outputs) == {"p_diff": 3, "e_1": 300, "count_2": 2}
+    assert evaluated == []
+
+    # A value of another type counts as a change, even if it compares equal
+    outputs = engine.evaluate(get_dev_rdg(10.0, 150, 7, None), OUTPUT_CONFIG)
+    assert [source for source, _ in evaluated] == [OUTPUT_CONFIG[0]["source"]]
+
+
+def test_projection_has_var_and_value_only(evaluated):
+    dev_rdg = get_dev_rdg(10, 100, 4, 200)
+    del dev_rdg["meter_2"][1]["value"]
+    OutputEngine().evaluate(dev_rdg, OUTPUT_CONFIG)
+
+    _, projection = evaluated[0]
+    assert projection == {
+        "meter_1": [{"var": "P", "value": 10}, {"var": "E", "value": 100}],
+        "meter_2": [{"var": "P", "value": 4}, {"var": "E"}],
+    }
+    # The readings themselves are left as they are
+    assert dev_rdg["meter_1"][0]["register"] == 1
+
+
+def test_outputs_recomputed_when_config_changes(evaluated):
+    engine = OutputEngine()
+    engine.evaluate(get_dev_rdg(10, 100, 4, 200), OUTPUT_CONFIG)
+
+    evaluated.clear()
+    output_config = [{**OUTPUT_CONFIG[0], "source": 'meter_2[var = "P"].value - meter_1[var = "P"].value'}]
+    assert get_values(engine.evaluate(get_dev_rdg(10, 100, 4, 200), output_config)) == {"p_diff": -6}
+    assert len(evaluated) == 1
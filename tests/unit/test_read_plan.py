@@ -0,0 +1,66 @@
+import copy
+
+import pytest
+
+import reader.read_plan
+from node_mgmt.config_watch import get_digest
+from reader.read_plan import get_read_plan
+
+
+@pytest.fixture(autouse=True)
+def plan_cache(monkeypatch):
+    monkeypatch.setattr(reader.read_plan, "_plan_cache", {})
+
+
+def get_plan(config: dict, drivers: dict):
+    """Returns the read plan as the node does, with the digest of the config"""
+    return get_read_plan(config, drivers, get_digest(config))
+
+
+def test_reuse(config, drivers):
+    plan = get_plan(config, drivers)
+    assert get_plan(copy.deepcopy(config), drivers) is plan
+    # The digest is worked out if it isn't given
+    assert get_read_plan(config, drivers) is plan
+    assert plan.config_digest == get_digest(config)
+
+    dev_rdg = plan.get_dev_rdg()
+    assert [rdg["var"] for rdg in dev_rdg["meter_1"]] == ["P", "E"]
+    # The readings handed out are copies, so the values taken don't leak into the plan
+    dev_rdg["meter_1"][0]["value"] = 1
+    assert "value" not in get_plan(config, drivers).get_dev_rdg()["meter_1"][0]
+
+
+def test_config_change(config, drivers):
+    plan = get_plan(config, drivers)
+    plan.latest_readings[("meter_1", "P")] = ({"var": "P", "value": 1}, 1000)
+
+    config["devices"]["meter_2"]["enabled"] = False
+    new_plan = get_plan(config, drivers)
+    assert new_plan is not plan
+    assert list(new_plan.devices) == ["meter_1"]
+    assert new_plan.latest_readings == {}
+
+
+def test_driver_change(config, drivers):
+    plan = get_plan(config, drivers)
+    assert plan.devices["meter_1"].readings[0]["register"] == 1
+
+    # Custom drivers come with the config, and are merged into the node's drivers (see update_drv_from_config())
+    config["drivers"] = {"meter": copy.deepcopy(drivers["meter"])}
+    config["drivers"]["meter"]["fields"]["P"]["register"] = 10
+    drivers = {**drivers, **config["drivers"]}
+    new_plan = get_plan(config, drivers)
+    assert new_plan is not plan
+    assert new_plan.devices["meter_1"].readings[0]["register"] == 10
+
+
+def test_read_interval_change(config, drivers):
+    plan = get_plan(config, drivers)
+    assert plan.devices["meter_1"].intervals == {"P": 60, "E": 300}
+
+    config["read_interval"] = 30
+    new_plan = get_plan(config, drivers)
+    assert new_plan is not plan
+    assert new_plan.devices["meter_1"].intervals == {"P": 30, "E": 300}
+    assert new_plan.devices["meter_1"].schedule == {(30, 0): ["P"], (300, 0): ["E"]}
@@ -0,0 +1,96 @@
+import pytest
+
+from reader.read_plan import build_read_plan
+from reader.scheduler import COALESCE_WINDOW, ReadingScheduler
+
+
+@pytest.fixture
+def scheduler(plan):
+    scheduler = ReadingScheduler()
+    scheduler.update(plan, roundtime=False, now=1000.0)
+    return scheduler
+
+
+def test_first_readings_due_at_phase(scheduler):
+    assert scheduler.pop_due(1000.0) == {"meter_1": {"P", "E"}}
+    assert scheduler.next_due() == 1010.0
+    assert scheduler.pop_due(1010.0) == {"meter_2": {"P", "E"}}
+    assert scheduler.next_due() == 1060.0
+
+
+def test_readings_due_at_own_intervals(scheduler):
+    due_times = {}
+    now = 1000.0
+    while now < 1600.0:
+        for dev_id, dev_vars in scheduler.pop_due(now).items():
+            for var in dev_vars:
+                due_times.setdefault((dev_id, var), []).append(now)
+        now = scheduler.next_due()
+
+    assert due_times[("meter_1", "P")] == [1000.0 + 60 * i for i in range(10)]
+    assert due_times[("meter_1", "E")] == [1000.0, 1300.0]
+    assert due_times[("meter_2", "P")] == [1010.0 + 60 * i for i in range(10)]
+    assert due_times[("meter_2", "E")] == [1010.0, 1310.0]
+    assert scheduler.pop_stats() == {"lag": 0.0, "skipped": 0, "overruns": 0}
+
+
+def test_coalescing(scheduler):
+    assert scheduler.pop_due(1000.0 - COALESCE_WINDOW) == {"meter_1": {"P", "E"}}
+    # Readings taken ahead of time are for the time at which they were due
+    assert scheduler.slot_time() == 1000.0
+    assert scheduler.pop_due(1010.0 - 2 * COALESCE_WINDOW) == {}
+    assert scheduler.slot_time() is None
+
+
+def test_slot_time_of_coalesced_groups(config, drivers):
+    config["devices"]["meter_2"]["read_phase"] = 0.5
+    scheduler = ReadingScheduler()
+    scheduler.update(build_read_plan(config, drivers), roundtime=False, now=1000.0)
+    assert scheduler.pop_due(1000.0) == {"meter_1": {"P", "E"}, "meter_2": {"P", "E"}}
+    assert scheduler.slot_time() == 1000.5
+
+
+def test_missed_readings_are_skipped(scheduler):
+    scheduler.pop_due(1000.0)
+    scheduler.pop_due(1010.0)
+    # A cycle that takes 150 s misses the readings at 60 s intervals that were due in the meantime
+    assert scheduler.check_overrun(1160.0)
+    assert scheduler.pop_due(1160.0) == {"meter_1": {"P"}, "meter_2": {"P"}}
+    # Rescheduled for the first due times after now, keeping their phase
+    assert scheduler.next_due() == 1180.0
+    assert scheduler.pop_due(1180.0) == {"meter_1": {"P"}}
+    assert scheduler.pop_due(1190.0) == {"meter_2": {"P"}}
+
+    # The readings due at 1060 and 1070 were taken 100 s late, and those due at 1120 and 1130 were skipped
+    assert scheduler.pop_stats() == {"lag": 100.0, "skipped": 2, "overruns": 1}
+    assert scheduler.pop_stats() == {"lag": 0.0, "skipped": 0, "overruns": 0}
+
+
+def test_no_overrun_within_schedule(scheduler):
+    scheduler.pop_due(1000.0)
+    assert not scheduler.check_overrun(1005.0)
+    assert scheduler.pop_stats()["overruns"] == 0
+
+
+def test_roundtime(plan):
+    scheduler = ReadingScheduler()
+    scheduler.update(plan, roundtime=True, now=1000.0)
+    # Round times of 60 s are multiples of 60, of 300 s multiples of 300, each offset by the device's phase
+    assert scheduler.pop_due(1020.0) == {"meter_1": {"P"}}
+    assert scheduler.pop_due(1030.0) == {"meter_2": {"P"}}
+    assert scheduler.next_due() == 1080.0
+
+
+def test_update_keeps_due_times(config, drivers, scheduler):
+    scheduler.pop_due(1000.0)
+    scheduler.pop_due(1010.0)
+
+    config["readings"]["meter_1_E"]["read_interval"] = 600
+    del config["readings"]["meter_2_E"]
+    scheduler.update(build_read_plan(config, drivers), roundtime=False, now=1020.0)
+
+    # Only the group with a new interval is scheduled afresh
+    assert scheduler.pop_due(1020.0) == {"meter_1": {"E"}}
+    assert scheduler.pop_due(1060.0) == {"meter_1": {"P"}}
+    assert scheduler.pop_due(1070.0) == {"meter_2": {"P"}}
+    assert scheduler.next_due() == 1120.0
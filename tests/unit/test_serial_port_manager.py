@@ -0,0 +1,140 @@
+import threading
+
+import pytest
+import serial
+
+import reader.serial_port_manager
+from reader.serial_port_manager import SerialPortManager
+
+
+class FakeSerial:
+    def __init__(self, fail_open: bool = False) -> None:
+        self.is_open = False
+        self.timeout = 0.05
+        self._fail_open = fail_open
+
+    def open(self) -> None:
+        if self._fail_open:
+            raise serial.SerialException("could not open port")
+        self.is_open = True
+
+    def close(self) -> None:
+        self.is_open = False
+
+
+@pytest.fixture
+def instruments(monkeypatch):
+    """The instruments created, in order; ports whose name contains 'bad' fail to open"""
+    instruments = []
+
+    class FakeInstrument:
+        def __init__(self, port: str, slaveaddress: int) -> None:
+            self.port = port
+            self.serial = FakeSerial(fail_open="bad" in port)
+            instruments.append(self)
+
+    monkeypatch.setattr(reader.serial_port_manager.minimalmodbus, "Instrument", FakeInstrument)
+    return instruments
+
+
+@pytest.fixture
+def ports(instruments):
+    return SerialPortManager()
+
+
+def test_reuse(ports, instruments):
+    instrument = ports.acquire("/dev/ttyA", baudrate=19200, parity=serial.PARITY_EVEN, timeout=2)
+    assert instrument.serial.is_open
+    assert (instrument.serial.baudrate, instrument.serial.parity, instrument.serial.timeout) == (19200, "E", 2)
+    ports.release("/dev/ttyA")
+
+    assert ports.acquire("/dev/ttyA", baudrate=19200, parity=serial.PARITY_EVEN, timeout=1) is instrument
+    assert instrument.serial.timeout == 1
+    ports.release("/dev/ttyA")
+    assert ports.acquire("/dev/ttyB") is not instrument
+    ports.release("/dev/ttyB")
+    assert len(instruments) == 2
+
+
+def test_reopen_on_changed_settings(ports):
+    instrument = ports.acquire("/dev/ttyA", baudrate=9600)
+    ports.release("/dev/ttyA")
+    reopened = ports.acquire("/dev/ttyA", baudrate=19200)
+    ports.release("/dev/ttyA")
+    assert reopened is not instrument
+    assert not instrument.serial.is_open
+    assert reopened.serial.is_open and reopened.serial.baudrate == 19200
+
+
+def test_reopen_after_error(ports, instruments):
+    instrument = ports.acquire("/dev/ttyA")
+    ports.release("/dev/ttyA", error=True)
+    assert not instrument.serial.is_open
+    assert ports.acquire("/dev/ttyA") is not instrument
+    ports.release("/dev/ttyA")
+    assert len(instruments) == 2
+
+
+def test_open_failure_releases_port(ports):
+    with pytest.raises(serial.SerialException):
+        ports.acquire("/dev/bad")
+
+    # Another thread can still use the port (and fails to open it too), rather than waiting for it forever
+    errors = []
+
+    def acquire():
+        try:
+            ports.acquire("/dev/bad")
+        except serial.SerialException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    thread.join(timeout=1)
+    assert not thread.is_alive() and len(errors) == 1
+
+
+def test_exclusive_use(ports):
+    ports.acquire("/dev/ttyA")
+    acquired = threading.Event()
+
+    def acquire():
+        ports.acquire("/dev/ttyA")
+        acquired.set()
+        ports.release("/dev/ttyA")
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    # Other ports remain available while the port is in use
+    ports.acquire("/dev/ttyB")
+    ports.release("/dev/ttyB")
+    assert not acquired.wait(0.1)
+
+    ports.release("/dev/ttyA")
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_close_unused(ports):
+    a = ports.acquire("/dev/ttyA")
+    ports.release("/dev/ttyA")
+    b = ports.acquire("/dev/ttyB")
+    ports.release("/dev/ttyB")
+
+    ports.close_unused({"/dev/ttyA"})
+    assert a.serial.is_open and not b.serial.is_open
+    assert ports.acquire("/dev/ttyA") is a
+    ports.release("/dev/ttyA")
+
+
+def test_close_unused_waits_for_port_in_use(ports):
+    instrument = ports.acquire("/dev/ttyA")
+    thread = threading.Thread(target=ports.close_unused, args=(set(),))
+    thread.start()
+    thread.join(timeout=0.1)
+    # The port isn't closed under the feet of the device that's using it
+    assert thread.is_alive() and instrument.serial.is_open
+
+    ports.release("/dev/ttyA")
+    thread.join(timeout=1)
+    assert not thread.is_alive() and not instrument.serial.is_open
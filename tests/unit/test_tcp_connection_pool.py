@@ -0,0 +1,101 @@
+import socket
+import time
+
+import pytest
+
+from reader.helpers.tcp_connection_pool import TcpConnectionPool
+
+HOST, PORT = "192.0.2.1", 502
+
+
+@pytest.fixture
+def connect():
+    """Returns a connected (client, peer) pair of sockets, all of which are closed at the end of the test"""
+    sockets = []
+
+    def connect():
+        pair = socket.socketpair()
+        sockets.extend(pair)
+        return pair
+
+    yield connect
+    for sock in sockets:
+        sock.close()
+
+
+def test_reuse(connect):
+    pool = TcpConnectionPool()
+    assert pool.get(HOST, PORT) is None
+    conn, _ = connect()
+    pool.put(HOST, PORT, conn)
+
+    assert pool.get(HOST, PORT) is conn
+    # The connection is in use until it's put back, and connections to other hosts aren't shared
+    assert pool.get(HOST, PORT) is None
+    pool.put(HOST, PORT, conn)
+    assert pool.get(HOST, PORT + 1) is None
+    assert pool.get(HOST, PORT) is conn
+
+
+def test_closed_by_peer(connect):
+    pool = TcpConnectionPool()
+    conn, peer = connect()
+    pool.put(HOST, PORT, conn)
+    peer.close()
+    assert pool.get(HOST, PORT) is None
+    assert conn.fileno() == -1
+
+
+def test_unread_data(connect):
+    pool = TcpConnectionPool()
+    conn, peer = connect()
+    pool.put(HOST, PORT, conn)
+    # A late response would be taken as the response to the next request
+    peer.sendall(b"\x01")
+    assert pool.get(HOST, PORT) is None
+    assert conn.fileno() == -1
+
+
+def test_idle_ttl(connect):
+    pool = TcpConnectionPool(idle_ttl=0.05)
+    stale, _ = connect()
+    pool.put(HOST, PORT, stale)
+    time.sleep(0.1)
+    fresh, _ = connect()
+    pool.put(HOST, PORT + 1, fresh)
+
+    assert pool.get(HOST, PORT) is None
+    assert stale.fileno() == -1
+    assert pool.get(HOST, PORT + 1) is fresh
+
+
+def test_evict_idle(connect):
+    pool = TcpConnectionPool(idle_ttl=0.05)
+    stale, _ = connect()
+    pool.put(HOST, PORT, stale)
+    time.sleep(0.1)
+    fresh, _ = connect()
+    pool.put(HOST, PORT, fresh)
+
+    pool.evict_idle()
+    assert stale.fileno() == -1 and fresh.fileno() != -1
+    assert pool.get(HOST, PORT) is fresh
+    assert pool.get(HOST, PORT) is None
+
+
+def test_pop_stats(connect):
+    pool = TcpConnectionPool()
+    assert pool.pop_stats() == {}
+
+    conn, peer = connect()
+    assert pool.get(HOST, PORT) is None
+    pool.put(HOST, PORT, conn)
+    assert pool.get(HOST, PORT) is conn
+    pool.put(HOST, PORT, conn)
+    peer.close()
+    assert pool.get(HOST, PORT) is None
+    assert pool.get(HOST, PORT + 1) is None
+
+    # The second connection to the first host is a reconnect, unlike the first connection to the second host
+    assert pool.pop_stats() == {"hits": 1, "misses": 3, "reconnects": 1, "hit_ratio": 0.25, "reconnect_rate": 0.25}
+    assert pool.pop_stats() == {}